@@ -3,9 +3,374 @@ import cv2
 import matplotlib.pyplot as plt
 from ultralytics import YOLO
 import os
+import json
+import threading
+import multiprocessing
+import queue
+import time
+import itertools
+import collections
+import contextlib
+import cProfile
+import hashlib
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 
 
-def display_image_pair(index, left_image_folder, right_image_folder, show_picture=True):
+#--- Metrics registry for timers, counters and profiling
+class _Timer:
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters and observed values, such as per-stage durations.
+
+    Instrumented code calls timer(), increment() and observe() unconditionally. While the registry
+    is disabled these calls return immediately, so the instrumentation costs close to nothing.
+    Observations keep their count, sum, minimum and maximum plus a bounded window of recent
+    values for the quantiles. The registry can be exported as JSON lines and in the Prometheus
+    text format, and can capture a cProfile and tracemalloc sample over the next N frames.
+
+    Metrics are per process: batch worker processes keep their own registry.
+
+    Args:
+        enabled (bool): Whether to collect metrics.
+        window (int): Number of recent values kept per observation for the quantiles.
+        namespace (str): Prefix of the exported Prometheus metric names.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, enabled=False, window=1024, namespace="stereo_vision"):
+        self.enabled = enabled
+        self.window = window
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._null_timer = contextlib.nullcontext()
+        self._profile = None
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all collected metrics.
+        """
+        with self._lock:
+            self.counters = {}
+            self.observations = {}
+
+    def timer(self, name):
+        """
+        Return a context manager that observes the duration of its block under <name>_seconds.
+        """
+        if not self.enabled:
+            return self._null_timer
+        return _Timer(self, name + '_seconds')
+
+    def increment(self, name, value=1):
+        """
+        Add a value to a counter.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Record one value of a distribution, e.g. a duration or the invalid-disparity fraction.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            observation = self.observations.get(name)
+            if observation is None:
+                observation = self.observations[name] = {
+                    'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                    'values': collections.deque(maxlen=self.window),
+                }
+            observation['count'] += 1
+            observation['sum'] += value
+            observation['min'] = min(observation['min'], value)
+            observation['max'] = max(observation['max'], value)
+            observation['values'].append(value)
+
+    def snapshot(self):
+        """
+        Return the current metrics.
+
+        Returns:
+            dict: Counters, and for every observation its count, sum, mean, min, max and quantiles
+                over the recent window.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            observations = {name: dict(observation, values=np.array(observation['values'], dtype=np.float64))
+                            for name, observation in self.observations.items()}
+
+        summaries = {}
+        for name, observation in observations.items():
+            quantiles = np.quantile(observation['values'], self.QUANTILES)
+            summaries[name] = {
+                'count': observation['count'], 'sum': observation['sum'],
+                'mean': observation['sum'] / observation['count'],
+                'min': observation['min'], 'max': observation['max'],
+                'quantiles': {str(q): float(value) for q, value in zip(self.QUANTILES, quantiles)},
+            }
+        return {'timestamp': time.time(), 'counters': counters, 'observations': summaries}
+
+    def write_jsonl(self, file_path):
+        """
+        Append the current snapshot to a JSON lines file.
+        """
+        with open(file_path, 'a') as file:
+            file.write(json.dumps(self.snapshot()) + '\n')
+
+    def write_prometheus(self, file_path):
+        """
+        Write the current metrics to a file in the Prometheus text exposition format.
+
+        Counters are exported as <namespace>_<name>_total and observations as summaries.
+        The file is replaced atomically so a scraper never reads a partial file.
+        """
+        def metric_name(name):
+            return self.namespace + '_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            name = metric_name(name) + '_total'
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, summary in sorted(snapshot['observations'].items()):
+            name = metric_name(name)
+            lines.append(f"# TYPE {name} summary")
+            lines += [f'{name}{{quantile="{q}"}} {value}' for q, value in summary['quantiles'].items()]
+            lines += [f"{name}_sum {summary['sum']}", f"{name}_count {summary['count']}"]
+
+        temporary_path = file_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, file_path)
+
+    def start_profiling(self, num_frames, output_prefix, cpu=True, memory=True):
+        """
+        Capture a cProfile and/or tracemalloc sample over the next num_frames frames.
+
+        The frames are counted by frame_done(). When the sample is complete the CPU profile is
+        written to <output_prefix>.prof and the top memory allocations to <output_prefix>_memory.txt.
+
+        Args:
+            num_frames (int): Number of frames to profile.
+            output_prefix (str): Path prefix of the output files.
+            cpu (bool): Whether to run cProfile.
+            memory (bool): Whether to trace memory allocations.
+        """
+        profiler = cProfile.Profile() if cpu else None
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._profile = {'remaining': num_frames, 'prefix': output_prefix, 'profiler': profiler, 'memory': memory}
+        if profiler is not None:
+            profiler.enable()
+
+    def _stop_profiling(self):
+        profile, self._profile = self._profile, None
+        if profile['profiler'] is not None:
+            profile['profiler'].disable()
+            profile['profiler'].dump_stats(profile['prefix'] + '.prof')
+        if profile['memory']:
+            statistics = tracemalloc.take_snapshot().statistics('lineno')
+            tracemalloc.stop()
+            with open(profile['prefix'] + '_memory.txt', 'w') as file:
+                file.write('\n'.join(str(statistic) for statistic in statistics[:50]) + '\n')
+
+    def frame_done(self):
+        """
+        Mark the end of a frame: count it and advance a running profiling sample.
+        """
+        if self.enabled:
+            self.increment('frames_processed')
+        if self._profile is not None:
+            self._profile['remaining'] -= 1
+            if self._profile['remaining'] <= 0:
+                self._stop_profiling()
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    Return the metrics registry used by the pipeline and the folder drivers. It is disabled by default.
+    """
+    return _metrics
+
+
+def enable_metrics(enabled=True):
+    """
+    Enable or disable the collection of metrics and return the registry.
+    """
+    _metrics.enabled = enabled
+    return _metrics
+
+
+#--- Index of a KITTI dataset folder structure
+class KittiDataset:
+    """
+    Index of the frames of a KITTI-style dataset, built once from the folder listings.
+
+    Frame IDs are the file names without extension (e.g. "000013"), sorted so that a given
+    index refers to the same frame in every folder. Only frames present in both the left and
+    right image folders are indexed. The index can be saved to a small JSON manifest that is
+    reused as long as the folders have not been modified.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        calibration_folder (str): Path to the folder containing the calibration files.
+        labels_folder (str): Path to the folder containing the label files.
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, left_image_folder, right_image_folder, calibration_folder=None, labels_folder=None,
+                 _listings=None):
+        self.folders = {
+            'left': left_image_folder,
+            'right': right_image_folder,
+            'calib': calibration_folder,
+            'label': labels_folder,
+        }
+        if _listings is None:
+            _listings = {kind: self._list_folder(folder, '.txt' if kind in ('calib', 'label') else None)
+                         for kind, folder in self.folders.items()}
+
+        # Map frame IDs to file names in each folder
+        self._files = {kind: {os.path.splitext(name)[0]: name for name in names}
+                       for kind, names in _listings.items()}
+        self.frame_ids = sorted(self._files['left'].keys() & self._files['right'].keys())
+        self._index = {frame_id: index for index, frame_id in enumerate(self.frame_ids)}
+
+    @staticmethod
+    def _list_folder(folder, extension=None):
+        if folder is None:
+            return []
+        return sorted(name for name in os.listdir(folder) if extension is None or name.endswith(extension))
+
+    @staticmethod
+    def _folder_mtime(folder):
+        return None if folder is None else os.stat(folder).st_mtime_ns
+
+    @classmethod
+    def open(cls, left_image_folder, right_image_folder, calibration_folder=None, labels_folder=None,
+             manifest_path=None):
+        """
+        Load the index from a manifest if it is still valid, otherwise scan the folders.
+
+        Args:
+            left_image_folder (str): Path to the folder containing the left images.
+            right_image_folder (str): Path to the folder containing the right images.
+            calibration_folder (str): Path to the folder containing the calibration files.
+            labels_folder (str): Path to the folder containing the label files.
+            manifest_path (str): Path of the manifest file. If None, the folders are always scanned.
+
+        Returns:
+            KittiDataset: The dataset index.
+        """
+        folders = {'left': left_image_folder, 'right': right_image_folder,
+                   'calib': calibration_folder, 'label': labels_folder}
+
+        if manifest_path is not None and os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                manifest = json.load(file)
+
+            # Adding or removing files updates the folder mtime, which invalidates the manifest
+            valid = manifest.get('version') == cls.MANIFEST_VERSION and all(
+                manifest['folders'][kind] == folder and manifest['mtimes'][kind] == cls._folder_mtime(folder)
+                for kind, folder in folders.items())
+            if valid:
+                return cls(left_image_folder, right_image_folder, calibration_folder, labels_folder,
+                           _listings=manifest['files'])
+
+        dataset = cls(left_image_folder, right_image_folder, calibration_folder, labels_folder)
+        if manifest_path is not None:
+            dataset.save_manifest(manifest_path)
+        return dataset
+
+    def save_manifest(self, manifest_path):
+        """
+        Save the index to a JSON manifest.
+
+        Args:
+            manifest_path (str): Path of the manifest file.
+        """
+        manifest = {
+            'version': self.MANIFEST_VERSION,
+            'folders': self.folders,
+            'mtimes': {kind: self._folder_mtime(folder) for kind, folder in self.folders.items()},
+            'files': {kind: sorted(files.values()) for kind, files in self._files.items()},
+        }
+
+        # Write to a temporary file first so that a crash never leaves a truncated manifest
+        temporary_path = manifest_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(temporary_path, manifest_path)
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __getitem__(self, index):
+        return self.frame_ids[index]
+
+    def index_of(self, frame_id):
+        """
+        Return the index of a frame ID.
+        """
+        return self._index[frame_id]
+
+    def _path(self, kind, frame_id):
+        name = self._files[kind].get(frame_id)
+        if name is None:
+            return None
+        return os.path.join(self.folders[kind], name)
+
+    def left_image_path(self, frame_id):
+        """
+        Return the path of the left image of a frame.
+        """
+        return self._path('left', frame_id)
+
+    def right_image_path(self, frame_id):
+        """
+        Return the path of the right image of a frame.
+        """
+        return self._path('right', frame_id)
+
+    def calibration_path(self, frame_id):
+        """
+        Return the path of the calibration file of a frame, or None if there is none.
+        """
+        return self._path('calib', frame_id)
+
+    def label_path(self, frame_id):
+        """
+        Return the path of the label file of a frame, or None if there is none.
+        """
+        return self._path('label', frame_id)
+
+
+def display_image_pair(index, left_image_folder, right_image_folder, show_picture=True, dataset=None):
     """
     Load and display a pair of left and right images from the specified folders.
 
@@ -14,13 +379,18 @@ def display_image_pair(index, left_image_folder, right_image_folder, show_pictur
         left_image_folder (str): Path to the folder containing the left images.
         right_image_folder (str): Path to the folder containing the right images.
         show_picture (bool): Whether to display the image pair using matplotlib.
+        dataset (KittiDataset): Index of the dataset. If None, the folders are listed on every call.
     """
+    if dataset is None:
+        dataset = KittiDataset(left_image_folder, right_image_folder)
+    frame_id = dataset[index]
+
     # Load the left image
-    left_image_path = os.path.join(left_image_folder, os.listdir(left_image_folder)[index])
+    left_image_path = dataset.left_image_path(frame_id)
     left_image = cv2.cvtColor(cv2.imread(left_image_path), cv2.COLOR_BGR2RGB)
 
     # Load the right image
-    right_image_path = os.path.join(right_image_folder, os.listdir(right_image_folder)[index])
+    right_image_path = dataset.right_image_path(frame_id)
     right_image = cv2.cvtColor(cv2.imread(right_image_path), cv2.COLOR_BGR2RGB)
 
     if show_picture:
@@ -39,289 +409,3160 @@ def display_image_pair(index, left_image_folder, right_image_folder, show_pictur
 
 
 
+#--- Decoded frame cache
+class FrameCache:
+    """
+    Memory-mapped cache of the decoded frames of a stereo sequence.
+
+    Each stereo pair is decoded once and stored as uint8 grayscale for the matchers and,
+    optionally, as the BGR left image for detection. Frames of all sizes are stored back to back
+    in one flat file per stream, and a per-frame offset index turns every lookup into a zero-copy
+    view of the memory map. The grayscale images are converted with COLOR_BGR2GRAY from the
+    decoded BGR images, exactly like compute_disparity does for images read with cv2.imread.
+    The cache is rebuilt when the image folders are modified.
+
+    Args:
+        cache_path (str): Folder of the cache.
+        meta (dict): Contents of meta.json.
+    """
+
+    CACHE_VERSION = 1
+    STREAMS = ('left_gray', 'right_gray', 'left_bgr')
+
+    def __init__(self, cache_path, meta):
+        self.cache_path = cache_path
+        self.meta = meta
+        self.frame_ids = meta['frame_ids']
+        self._index = {frame_id: index for index, frame_id in enumerate(self.frame_ids)}
+        self.shapes = np.load(os.path.join(cache_path, 'shapes.npy'))
+        self.offsets = np.load(os.path.join(cache_path, 'offsets.npy'))
+        self.color = meta['color']
+        self._streams = {}
+        for stream in self.STREAMS:
+            stream_path = os.path.join(cache_path, stream + '.u8')
+            if os.path.exists(stream_path) and os.path.getsize(stream_path) > 0:
+                self._streams[stream] = np.memmap(stream_path, dtype=np.uint8, mode='r')
+
+    @staticmethod
+    def _folder_mtimes(left_image_folder, right_image_folder):
+        return [os.stat(left_image_folder).st_mtime_ns, os.stat(right_image_folder).st_mtime_ns]
+
+    @classmethod
+    def build(cls, left_image_folder, right_image_folder, cache_path, color=False, num_threads=4):
+        """
+        Decode every stereo pair of the folders into the cache.
+
+        Args:
+            left_image_folder (str): Path to the folder containing the left images.
+            right_image_folder (str): Path to the folder containing the right images.
+            cache_path (str): Folder of the cache.
+            color (bool): Whether to also keep the BGR left images for detection.
+            num_threads (int): Number of decoding threads.
+
+        Returns:
+            FrameCache: The new cache.
+        """
+        dataset = KittiDataset(left_image_folder, right_image_folder)
+        os.makedirs(cache_path, exist_ok=True)
+        meta_path = os.path.join(cache_path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        def decode(frame_id):
+            # cv2.imread releases the GIL, so frames decode in parallel
+            left_image = cv2.imread(dataset.left_image_path(frame_id))
+            right_image = cv2.imread(dataset.right_image_path(frame_id))
+            if left_image is None or right_image is None:
+                raise IOError(f"Could not read stereo pair {frame_id}")
+            return (left_image, cv2.cvtColor(left_image, cv2.COLOR_BGR2GRAY),
+                    cv2.cvtColor(right_image, cv2.COLOR_BGR2GRAY))
+
+        shapes = np.zeros((len(dataset), 2), np.int64)
+        files = {stream: open(os.path.join(cache_path, stream + '.u8'), 'wb') for stream in cls.STREAMS}
+        try:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                for index, (left_image, left_gray, right_gray) in enumerate(executor.map(decode, dataset.frame_ids)):
+                    if right_gray.shape != left_gray.shape:
+                        raise ValueError(f"Left and right images of {dataset[index]} differ in size")
+                    shapes[index] = left_gray.shape
+                    files['left_gray'].write(left_gray.tobytes())
+                    files['right_gray'].write(right_gray.tobytes())
+                    if color:
+                        files['left_bgr'].write(left_image.tobytes())
+        finally:
+            for file in files.values():
+                file.close()
+
+        # Offset of every frame in the grayscale streams; the BGR stream uses three times these
+        offsets = np.concatenate([[0], np.cumsum(shapes[:, 0] * shapes[:, 1])]).astype(np.int64)
+        np.save(os.path.join(cache_path, 'shapes.npy'), shapes)
+        np.save(os.path.join(cache_path, 'offsets.npy'), offsets)
+
+        # The metadata is written last, so an interrupted build leaves an invalid cache
+        meta = {'version': cls.CACHE_VERSION, 'folders': [left_image_folder, right_image_folder],
+                'mtimes': cls._folder_mtimes(left_image_folder, right_image_folder),
+                'frame_ids': dataset.frame_ids, 'color': color}
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+        return cls(cache_path, meta)
+
+    @classmethod
+    def open(cls, left_image_folder, right_image_folder, cache_path=None, color=False, num_threads=4):
+        """
+        Open the cache if it is still valid, otherwise build it.
+
+        Args:
+            left_image_folder (str): Path to the folder containing the left images.
+            right_image_folder (str): Path to the folder containing the right images.
+            cache_path (str): Folder of the cache. Defaults to frame_cache next to the left image folder.
+            color (bool): Whether the BGR left images are needed.
+            num_threads (int): Number of decoding threads when building.
+
+        Returns:
+            FrameCache: The up-to-date cache.
+        """
+        if cache_path is None:
+            cache_path = os.path.join(os.path.dirname(os.path.normpath(left_image_folder)), 'frame_cache')
+        meta_path = os.path.join(cache_path, 'meta.json')
+
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            valid = (meta.get('version') == cls.CACHE_VERSION
+                     and meta['folders'] == [left_image_folder, right_image_folder]
+                     and meta['mtimes'] == cls._folder_mtimes(left_image_folder, right_image_folder)
+                     and (meta['color'] or not color))
+            if valid:
+                return cls(cache_path, meta)
+
+        return cls.build(left_image_folder, right_image_folder, cache_path, color=color, num_threads=num_threads)
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __contains__(self, frame_id):
+        return frame_id in self._index
+
+    def _view(self, stream, frame_id, channels=1):
+        index = self._index[frame_id]
+        height, width = self.shapes[index]
+        start = int(self.offsets[index]) * channels
+        view = self._streams[stream][start:start + height * width * channels]
+        return view.reshape((height, width, channels) if channels > 1 else (height, width))
+
+    def gray_pair(self, frame_id):
+        """
+        Return the grayscale left and right images of a frame as read-only views.
+        """
+        return self._view('left_gray', frame_id), self._view('right_gray', frame_id)
+
+    def left_color(self, frame_id):
+        """
+        Return the BGR left image of a frame as a read-only view.
+        """
+        if not self.color:
+            raise KeyError("The cache was built without color images; open it with color=True")
+        return self._view('left_bgr', frame_id, channels=3)
+
+
+_frame_caches = {}
+
+
+def get_frame_cache(cache_path):
+    """
+    Return the frame cache stored in a folder, opening it once per process.
+    """
+    cache = _frame_caches.get(cache_path)
+    if cache is None:
+        with open(os.path.join(cache_path, 'meta.json'), 'r') as file:
+            cache = _frame_caches[cache_path] = FrameCache(cache_path, json.load(file))
+    return cache
+
+
+#--- Pure NumPy block matcher
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], np.uint8)
+
+    def _popcount(values):
+        # Count the set bits of every byte and add up the bytes of each value
+        counts = _POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (values.itemsize,))
+        return counts.sum(axis=-1, dtype=np.uint8)
+
+
+class NumpyBlockMatcher:
+    """
+    Reference block matcher written with NumPy array operations only.
+
+    The matching cost is the absolute intensity difference ("sad") or the Hamming distance between
+    census transforms ("census"). The cost volume of a range of disparities is built from a strided
+    sliding-window view of the right image without copying it per disparity. It is aggregated over
+    block_size x block_size windows with separable box filters computed from cumulative sums, so the
+    cost per pixel does not depend on the block size. The disparity with the lowest aggregated cost
+    wins and is refined to sub-pixel precision by fitting a parabola through its neighbouring costs.
+
+    The disparity range is processed in chunks sized to memory_budget, with the best cost and its
+    neighbours carried over between chunks, so the result does not depend on the budget. Like
+    cv2.StereoBM, the output is an int16 map of disparity * 16, pixels whose window leaves the image
+    or whose disparity range leaves the right image are set to (min_disparity - 1) * 16.
+
+    Args:
+        num_disparities (int): Maximum disparity minus minimum disparity.
+        block_size (int): Odd size of the aggregation window.
+        min_disparity (int): Minimum possible disparity value.
+        cost (str): Matching cost, "sad" or "census".
+        census_size (int): Odd size of the census transform window; at most 7 so codes fit 64 bits.
+        memory_budget (int): Approximate peak memory of the cost volume in bytes.
+    """
+
+    def __init__(self, num_disparities=6 * 16, block_size=11, min_disparity=0, cost="sad", census_size=5,
+                 memory_budget=64 * 2**20):
+        if block_size % 2 == 0 or block_size < 1:
+            raise ValueError("block_size must be a positive odd number")
+        if census_size % 2 == 0 or not 3 <= census_size <= 7:
+            raise ValueError("census_size must be 3, 5 or 7")
+        if cost not in ("sad", "census"):
+            raise ValueError(f"Unknown cost: {cost}")
+        self.num_disparities = num_disparities
+        self.block_size = block_size
+        self.min_disparity = min_disparity
+        self.cost = cost
+        self.census_size = census_size
+        self.memory_budget = memory_budget
+
+    def census_transform(self, image):
+        """
+        Compute the census code of every pixel: one bit per neighbour darker than the center.
+
+        Returns:
+            numpy.ndarray: uint64 codes, with edge pixels replicated outside the image.
+        """
+        radius = self.census_size // 2
+        height, width = image.shape
+        padded = np.pad(image, radius, mode='edge')
+        codes = np.zeros((height, width), np.uint64)
+        for dy in range(self.census_size):
+            for dx in range(self.census_size):
+                if dy == radius and dx == radius:
+                    continue
+                codes <<= np.uint64(1)
+                codes |= padded[dy:dy + height, dx:dx + width] < image
+        return codes
+
+    def _box_sum(self, cost):
+        # Separable box filter from cumulative sums, keeping only the windows inside the image
+        block_size = self.block_size
+        summed = np.cumsum(cost, axis=2, dtype=np.int32)
+        summed[:, :, block_size:] -= summed[:, :, :-block_size].copy()
+        summed = np.cumsum(summed[:, :, block_size - 1:], axis=1)
+        summed[:, block_size:] -= summed[:, :-block_size].copy()
+        return summed[:, block_size - 1:]
+
+    def _disparities_per_chunk(self, height, width):
+        # The cost slice, its cumulative sums and the aggregated slice are alive at the same time
+        bytes_per_disparity = height * width * 4 * 3
+        return int(np.clip(self.memory_budget // bytes_per_disparity, 3, self.num_disparities + 2))
+
+    def compute(self, left_gray, right_gray):
+        """
+        Compute the disparity map of a rectified grayscale stereo pair.
+
+        Returns:
+            numpy.ndarray: int16 disparity map scaled by 16.
+        """
+        height, width = left_gray.shape
+        min_disparity, num_disparities = self.min_disparity, self.num_disparities
+        max_disparity = min_disparity + num_disparities - 1
+        radius = self.block_size // 2
+        invalid = (min_disparity - 1) * 16
+        disparity = np.full((height, width), invalid, np.int16)
+        if height < self.block_size or width < self.block_size:
+            return disparity
+
+        if self.cost == "census":
+            left_values, right_values = self.census_transform(left_gray), self.census_transform(right_gray)
+        else:
+            left_values, right_values = left_gray.astype(np.int16), right_gray.astype(np.int16)
+
+        # Column x of the window view holds the right pixels x - max_disparity - 1 ... x + 1 - min_disparity,
+        # padded on both sides so every disparity of the range and its neighbours can be sliced
+        pad_left, pad_right = max(max_disparity + 1, 0), max(1 - min_disparity, 0)
+        padded = np.pad(right_values, ((0, 0), (pad_left, pad_right)), mode='edge')
+        window = np.lib.stride_tricks.sliding_window_view(padded, width, axis=1)
+
+        def aggregated_cost(first, last):
+            # Costs of disparities first..last, built from views of the right image
+            offsets = pad_left - np.arange(first, last + 1)
+            shifted = window[:, offsets].transpose(1, 0, 2)
+            if self.cost == "census":
+                cost = _popcount(shifted ^ left_values).astype(np.int32)
+            else:
+                cost = np.abs(shifted - left_values).astype(np.int32)
+            return self._box_sum(cost)
+
+        # Winner-take-all over chunks of the range, each extended by one disparity on both sides
+        core_shape = (height - 2 * radius, width - 2 * radius)
+        best_cost = np.full(core_shape, np.iinfo(np.int32).max, np.int32)
+        best_index = np.zeros(core_shape, np.int64)
+        below_cost = np.zeros(core_shape, np.int32)
+        above_cost = np.zeros(core_shape, np.int32)
+        chunk = self._disparities_per_chunk(height, width) - 2
+        for start in range(min_disparity, max_disparity + 1, chunk):
+            stop = min(start + chunk, max_disparity + 1)
+            costs = aggregated_cost(start - 1, stop)
+            core = costs[1:-1]
+            index = np.argmin(core, axis=0)
+            cost = np.take_along_axis(core, index[None], axis=0)[0]
+            better = cost < best_cost
+            best_cost[better] = cost[better]
+            best_index[better] = index[better] + start
+            below_cost[better] = np.take_along_axis(costs, index[None], axis=0)[0][better]
+            above_cost[better] = np.take_along_axis(costs, index[None] + 2, axis=0)[0][better]
+
+        # Sub-pixel refinement with a parabola through the winner and its neighbours
+        curvature = (below_cost + above_cost - 2 * best_cost).astype(np.float32)
+        inner = (best_index > min_disparity) & (best_index < max_disparity) & (curvature > 0)
+        offset = np.zeros(core_shape, np.float32)
+        offset[inner] = (below_cost[inner] - above_cost[inner]) / (2 * curvature[inner])
+        refined = np.rint((best_index + offset) * 16).astype(np.int16)
+
+        # Keep the pixels whose window and whole disparity range lie inside both images
+        disparity[radius:height - radius, radius:width - radius] = refined
+        first_column = max(max_disparity + radius, radius)
+        disparity[:, :first_column] = invalid
+        return disparity
+
+
+#--- Reusable disparity engine
+class DisparityEngine:
+    """
+    Disparity engine that pools stereo matchers and computes disparity on a thread pool.
+
+    Matchers are created once per parameter set and reused across frames. Each frame is
+    split into horizontal bands that overlap by enough rows for the matching window, the
+    bands are matched in parallel and their core rows are stitched back together.
+
+    Banding is only bit-exact for block matching ("stereo_bm" and "numpy_bm"), whose output
+    depends on a local window. SGBM aggregates costs along paths that span the whole column (and the
+    3-way mode already stripes the frame internally), so by default SGBM frames are matched
+    monolithically and parallelism comes from compute_many() across frames. Set
+    sgbm_band_overlap to band SGBM as well, trading exactness for latency.
+
+    Args:
+        num_threads (int): Number of worker threads. Defaults to the number of CPUs.
+        min_band_rows (int): Minimum number of core rows per band.
+        sgbm_band_overlap (int): Overlap in rows used to band SGBM frames. None disables SGBM banding.
+        numpy_cost (str): Matching cost of the "numpy_bm" matcher, "sad" or "census".
+        numpy_memory_budget (int): Approximate peak memory in bytes of each "numpy_bm" cost volume.
+        max_matcher_keys (int): Maximum number of parameter sets whose idle matchers are kept;
+            the least recently used sets are dropped first.
+    """
+
+    def __init__(self, num_threads=None, min_band_rows=64, sgbm_band_overlap=None, numpy_cost="sad",
+                 numpy_memory_budget=64 * 2**20, max_matcher_keys=32):
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.min_band_rows = min_band_rows
+        self.sgbm_band_overlap = sgbm_band_overlap
+        self.numpy_cost = numpy_cost
+        self.numpy_memory_budget = numpy_memory_budget
+        self.max_matcher_keys = max_matcher_keys
+        self._matchers = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the thread pool and drop all pooled matchers.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            self._matchers.clear()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+            return self._executor
+
+    @staticmethod
+    def matcher_key(num_disparities=6 * 16, block_size=11, window_size=6, matcher="stereo_sgbm",
+                    mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY, min_disparity=0):
+        """
+        Build the key identifying a matcher parameter set in the pool.
+        """
+        if matcher in ("stereo_bm", "numpy_bm"):
+            # Block matching ignores the smoothness window and the SGBM mode
+            return matcher, num_disparities, block_size, min_disparity
+        return matcher, num_disparities, block_size, window_size, mode, min_disparity
+
+    def _create_matcher(self, key):
+        if key[0] == "numpy_bm":
+            _, num_disparities, block_size, min_disparity = key
+            # Create a pure NumPy block matcher with the cost and memory budget of the engine
+            return NumpyBlockMatcher(num_disparities, block_size, min_disparity, cost=self.numpy_cost,
+                                     memory_budget=self.numpy_memory_budget)
+        if key[0] == "stereo_bm":
+            _, num_disparities, block_size, min_disparity = key
+            # Create a Stereo BM matcher
+            stereo = cv2.StereoBM_create(numDisparities=num_disparities, blockSize=block_size)
+            stereo.setMinDisparity(min_disparity)
+            return stereo
+        if key[0] == "stereo_sgbm":
+            _, num_disparities, block_size, window_size, mode, min_disparity = key
+            # Create a Stereo SGBM matcher
+            return cv2.StereoSGBM_create(
+                minDisparity=min_disparity, numDisparities=num_disparities, blockSize=block_size,
+                P1=8 * 3 * window_size ** 2, P2=32 * 3 * window_size ** 2,
+                mode=mode
+            )
+        raise ValueError(f"Unknown matcher: {key[0]}")
+
+    def _acquire(self, key):
+        # OpenCV matchers keep internal buffers, so each thread needs its own instance
+        with self._lock:
+            idle = self._matchers.setdefault(key, [])
+            self._matchers.move_to_end(key)
+            while len(self._matchers) > self.max_matcher_keys:
+                # Drop the idle matchers of the least recently used parameter set
+                self._matchers.popitem(last=False)
+            if idle:
+                return idle.pop()
+        return self._create_matcher(key)
+
+    def _release(self, key, stereo):
+        with self._lock:
+            self._matchers.setdefault(key, []).append(stereo)
+
+    def _match(self, key, left_gray, right_gray):
+        stereo = self._acquire(key)
+        try:
+            return stereo.compute(left_gray, right_gray)
+        finally:
+            self._release(key, stereo)
+
+    def band_overlap(self, key):
+        """
+        Number of rows each band must share with its neighbours for the given matcher.
+
+        Returns:
+            int: Overlap in rows, or None if the matcher must not be banded.
+        """
+        if key[0] == "stereo_bm":
+            # Matching window radius plus the radius of the default 9x9 prefilter
+            return key[2] // 2 + 9 // 2 + 1
+        if key[0] == "numpy_bm":
+            # Matching window radius plus the radius of the default 5x5 census window
+            return key[2] // 2 + (5 // 2 if self.numpy_cost == "census" else 0) + 1
+        return self.sgbm_band_overlap
+
+    def band_layout(self, key, height):
+        """
+        Rows of the bands a frame of the given height is split into for the given matcher.
+
+        Returns:
+            tuple: (top, bottom, padded_top, padded_bottom) rows of every band, with the core rows
+                top:bottom and the matched rows padded_top:padded_bottom. Empty if the frame is matched whole.
+        """
+        overlap = self.band_overlap(key)
+        num_bands = min(self.num_threads, height // self.min_band_rows)
+        if overlap is None or num_bands < 2:
+            return ()
+
+        # Split the frame into horizontal bands, each padded with overlapping rows
+        edges = np.linspace(0, height, num_bands + 1).astype(int).tolist()
+        bands = []
+        for top, bottom in zip(edges[:-1], edges[1:]):
+            # Block matching output at the bottom border depends on row parity, so start bands on even rows
+            padded_top = max(0, top - overlap)
+            padded_top -= padded_top % 2
+            padded_bottom = min(height, bottom + overlap)
+            bands.append((top, bottom, padded_top, padded_bottom))
+        return tuple(bands)
+
+    def compute_raw(self, left_gray, right_gray, num_disparities=6 * 16, block_size=11, window_size=6,
+                    matcher="stereo_sgbm", mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY, min_disparity=0):
+        """
+        Compute the raw fixed-point disparity map of a grayscale stereo pair.
+
+        Args:
+            left_gray (numpy.ndarray): Left grayscale image.
+            right_gray (numpy.ndarray): Right grayscale image.
+            num_disparities (int): Maximum disparity minus minimum disparity.
+            block_size (int): Size of the block window. It must be an odd number.
+            window_size (int): Size of the disparity smoothness window.
+            matcher (str): Matcher algorithm to use ("stereo_bm", "stereo_sgbm" or "numpy_bm").
+            mode (int): SGBM mode (cv2.STEREO_SGBM_MODE_*).
+            min_disparity (int): Minimum possible disparity value.
+
+        Returns:
+            numpy.ndarray: int16 disparity map scaled by 16, as returned by OpenCV.
+        """
+        key = self.matcher_key(num_disparities, block_size, window_size, matcher, mode, min_disparity)
+        bands = self.band_layout(key, left_gray.shape[0])
+        if not bands:
+            return self._match(key, left_gray, right_gray)
+
+        # Match the bands in parallel
+        executor = self._get_executor()
+        futures = [executor.submit(self._match, key, left_gray[pt:pb], right_gray[pt:pb])
+                   for _, _, pt, pb in bands]
+
+        # Stitch the core rows of each band together
+        disparity = np.empty(left_gray.shape[:2], np.int16)
+        for (top, bottom, padded_top, _), future in zip(bands, futures):
+            disparity[top:bottom] = future.result()[top - padded_top:bottom - padded_top]
+        return disparity
+
+    def compute(self, left_img, right_img, raw=False, **params):
+        """
+        Compute the disparity map of a BGR or grayscale stereo pair in pixels.
+
+        Args:
+            left_img (numpy.ndarray): Left image of the stereo pair, BGR or already grayscale.
+            right_img (numpy.ndarray): Right image of the stereo pair, BGR or already grayscale.
+            raw (bool): Whether to return the int16 fixed-point map instead of pixels.
+            **params: Matcher parameters forwarded to compute_raw().
+
+        Returns:
+            numpy.ndarray: float32 disparity map, or the int16 map scaled by 16 if raw is set.
+        """
+        # Convert the images to grayscale unless they already are
+        left_gray = left_img if left_img.ndim == 2 else cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
+        right_gray = right_img if right_img.ndim == 2 else cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
+
+        disparity = self.compute_raw(left_gray, right_gray, **params)
+        if raw:
+            return disparity
+        return disparity.astype(np.float32) / 16
+
+    def compute_many(self, image_pairs, **params):
+        """
+        Compute the disparity maps of several stereo pairs concurrently.
+
+        Args:
+            image_pairs (list): List of (left_img, right_img) tuples.
+            **params: Matcher parameters forwarded to compute_raw().
+
+        Returns:
+            list: float32 disparity maps in the order of image_pairs.
+        """
+        executor = self._get_executor()
+        # Frames are matched whole so that nested band tasks cannot starve the pool
+        futures = [executor.submit(self._compute_whole, left_img, right_img, params)
+                   for left_img, right_img in image_pairs]
+        return [future.result() for future in futures]
+
+    def _compute_whole(self, left_img, right_img, params):
+        left_gray = left_img if left_img.ndim == 2 else cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
+        right_gray = right_img if right_img.ndim == 2 else cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
+        key = self.matcher_key(**params)
+        return self._match(key, left_gray, right_gray).astype(np.float32) / 16
+
+
+_disparity_engine = None
+
+
+def get_disparity_engine():
+    """
+    Return the shared disparity engine used by compute_disparity, creating it on first use.
+    """
+    global _disparity_engine
+    if _disparity_engine is None:
+        _disparity_engine = DisparityEngine()
+    return _disparity_engine
+
+
+#--- Content-addressed cache of disparity results
+class DisparityResultCache:
+    """
+    Cache of raw disparity maps keyed by a hash of the image pair bytes and the matcher parameters.
+
+    Recent results are kept in an in-memory LRU bounded by max_memory_bytes and written to a
+    cache folder as .npy files. The folder is bounded by max_disk_bytes; when it grows past the
+    bound the least recently used files, by modification time which is refreshed on every hit,
+    are removed. Several processes can share the folder: files are written atomically and a
+    file evicted by another process is simply a miss.
+
+    Args:
+        cache_path (str): Folder of the on-disk cache. None keeps results in memory only.
+        max_memory_bytes (int): Size bound of the in-memory LRU.
+        max_disk_bytes (int): Size bound of the cache folder.
+    """
+
+    def __init__(self, cache_path=None, max_memory_bytes=256 * 2**20, max_disk_bytes=4 * 2**30):
+        self.cache_path = cache_path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self.counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'memory_evictions': 0, 'disk_evictions': 0}
+        if cache_path is not None:
+            os.makedirs(cache_path, exist_ok=True)
+
+    @staticmethod
+    def key(left_img, right_img, **params):
+        """
+        Hash an image pair and its matcher parameters into a cache key.
+
+        Args:
+            left_img (numpy.ndarray): Left image of the stereo pair.
+            right_img (numpy.ndarray): Right image of the stereo pair.
+            **params: Parameters that affect the result, e.g. the matcher key.
+
+        Returns:
+            str: Hexadecimal digest.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        for image in (left_img, right_img):
+            image = np.ascontiguousarray(image)
+            digest.update(f"{image.shape}{image.dtype}".encode())
+            digest.update(memoryview(image).cast('B'))
+        digest.update(repr(sorted(params.items())).encode())
+        return digest.hexdigest()
+
+    def _file_path(self, key):
+        return os.path.join(self.cache_path, key + '.npy')
+
+    def _remember(self, key, value):
+        # Insert into the in-memory LRU and evict the oldest entries beyond the bound
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = value
+            self._memory_bytes += value.nbytes
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+                self.counts['memory_evictions'] += 1
+
+    def get(self, key):
+        """
+        Look a result up in memory, then on disk.
+
+        Returns:
+            numpy.ndarray: A copy of the cached result, or None on a miss.
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.counts['memory_hits'] += 1
+                return value.copy()
+
+        if self.cache_path is not None:
+            file_path = self._file_path(key)
+            try:
+                value = np.load(file_path)
+                os.utime(file_path)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.counts['disk_hits'] += 1
+                return value.copy()
+
+        with self._lock:
+            self.counts['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a result in memory and on disk.
+        """
+        value = np.array(value)
+        self._remember(key, value)
+        if self.cache_path is None:
+            return
+
+        # Write to a temporary file first so that readers never see a partial result
+        file_path = self._file_path(key)
+        temporary_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            np.save(file, value)
+            file_size = file.tell()
+        os.replace(temporary_path, file_path)
+
+        # Another process or thread may evict the file as soon as it is in place, so use the written size
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += file_size
+        if self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Scan the folder, shared with other processes, and remove the least recently used files
+        entries = []
+        for entry in os.scandir(self.cache_path):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+
+        entries.sort()
+        evictions = 0
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                evictions += 1
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self.counts['disk_evictions'] += evictions
+            self._disk_bytes = total
+
+    def clear(self):
+        """
+        Remove every cached result from memory and disk.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.cache_path is not None:
+            for entry in os.scandir(self.cache_path):
+                if entry.name.endswith('.npy'):
+                    os.remove(entry.path)
+            self._disk_bytes = 0
+
+    def stats(self):
+        """
+        Return the hit and miss counts, the hit rate and the cache sizes.
+        """
+        with self._lock:
+            stats = dict(self.counts)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_bytes'] = self._disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_result_caches = {}
+
+
+def get_result_cache(cache_path):
+    """
+    Return the disparity result cache stored in a folder, creating it once per process.
+    """
+    cache = _result_caches.get(cache_path)
+    if cache is None:
+        cache = _result_caches[cache_path] = DisparityResultCache(cache_path)
+    return cache
+
+
+def _print_result_cache_stats(cache_path, num_workers=1):
+    # Worker processes keep their own counters, so only serial runs are reported
+    if cache_path is not None and num_workers <= 1 and cache_path in _result_caches:
+        print(f"Result cache: {_result_caches[cache_path].stats()}")
+
+
 #--- Function to compute and display disparity
-def compute_disparity(left_img, right_img, num_disparities=6 * 16, block_size=11, window_size=6, matcher="stereo_sgbm", show_disparity=True):
+def compute_disparity(left_img, right_img, num_disparities=6 * 16, block_size=11, window_size=6, matcher="stereo_sgbm", show_disparity=True, engine=None, raw=False, cache=None):
     """
     Compute the disparity map for a given stereo image pair.
 
+    Color images are converted with COLOR_BGR2GRAY, so they must be in OpenCV's BGR order as
+    returned by cv2.imread. RGB images, such as those returned by display_image_pair, get the red
+    and blue weights swapped; pass grayscale images (e.g. from a FrameCache) to skip the conversion.
+
     Args:
-        image (numpy.ndarray): Left image of the stereo pair.
-        img_pair (numpy.ndarray): Right image of the stereo pair.
+        image (numpy.ndarray): Left image of the stereo pair, BGR or grayscale.
+        img_pair (numpy.ndarray): Right image of the stereo pair, BGR or grayscale.
         num_disparities (int): Maximum disparity minus minimum disparity.
         block_size (int): Size of the block window. It must be an odd number.
         window_size (int): Size of the disparity smoothness window.
-        matcher (str): Matcher algorithm to use ("stereo_bm" or "stereo_sgbm").
+        matcher (str): Matcher algorithm to use ("stereo_bm", "stereo_sgbm" or "numpy_bm").
         show_disparity (bool): Whether to display the disparity map using matplotlib.
+        engine (DisparityEngine): Engine providing pooled matchers. Defaults to the shared engine.
+        raw (bool): Whether to return OpenCV's int16 fixed-point map (disparity * 16), e.g. for DepthLUT.
+        cache (DisparityResultCache): Optional cache of results; a hit skips stereo matching.
 
     Returns:
         numpy.ndarray: The computed disparity map.
     """
-    if matcher == "stereo_bm":
-        # Create a Stereo BM matcher
-        matcher = cv2.StereoBM_create(numDisparities=num_disparities, blockSize=block_size)
-    elif matcher == "stereo_sgbm":
-        # Create a Stereo SGBM matcher
-        matcher = cv2.StereoSGBM_create(
-            minDisparity=0, numDisparities=num_disparities, blockSize=block_size,
-            P1=8 * 3 * window_size ** 2, P2=32 * 3 * window_size ** 2,
-            mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY
-        )
+    if engine is None:
+        engine = get_disparity_engine()
+    params = dict(num_disparities=num_disparities, block_size=block_size, window_size=window_size, matcher=matcher)
+
+    if cache is None:
+        # Compute the disparity map with pooled matchers
+        disparity = engine.compute(left_img, right_img, raw=raw, **params)
+    else:
+        # The key covers the images, the matcher and the band rows of the engine, which change SGBM results
+        matcher_key = engine.matcher_key(**params)
+        if matcher == "numpy_bm":
+            matcher_key += (engine.numpy_cost,)
+        key = cache.key(left_img, right_img, matcher_key=matcher_key,
+                        bands=engine.band_layout(matcher_key, left_img.shape[0]))
+        disparity = cache.get(key)
+        if disparity is None:
+            disparity = engine.compute(left_img, right_img, raw=True, **params)
+            cache.put(key, disparity)
+        if not raw:
+            disparity = disparity.astype(np.float32) / 16
+
+
+    if show_disparity:
+        # Display the disparity map using matplotlib
+        plt.imshow(disparity, cmap="CMRmap_r") #CMRmap_r # cividis
+        plt.title('Disparity map with SGBM', fontsize=12)
+        plt.show()
+
+    return disparity
+
+#--- Disparity restricted to regions of interest
+def disparity_strips(bbox_coordinates, shape, num_disparities, block_size, min_disparity=0, context=0):
+    """
+    Compute the image strips needed to match the pixels inside a set of boxes.
+
+    Each box is widened by the matching window radius (plus the 9x9 prefilter radius) on every
+    side, and on the left by the disparity search range, so that every candidate match of a
+    box pixel lies inside its strip. Overlapping strips are merged.
+
+    Args:
+        bbox_coordinates (list): [x1, y1, x2, y2] boxes in pixels.
+        shape (tuple): (height, width) of the images.
+        num_disparities (int): Maximum disparity minus minimum disparity.
+        block_size (int): Size of the block window.
+        min_disparity (int): Minimum disparity.
+        context (int): Extra pixels of context added on every side.
+
+    Returns:
+        list: (strip, boxes) tuples with strip = (top, bottom, left, right) and the boxes it covers.
+    """
+    height, width = shape[:2]
+    radius = block_size // 2 + 9 // 2 + 1 + context
+    search = max(num_disparities + min_disparity, 0)
+
+    strips = []
+    for x1, y1, x2, y2 in np.asarray(bbox_coordinates, np.int64).reshape(-1, 4).tolist():
+        x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+        y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        strip = [max(0, y1 - radius), min(height, y2 + radius), max(0, x1 - search - radius), min(width, x2 + radius)]
+
+        # Matchers need strips wider than the search range, so grow narrow strips to the right, then the left
+        min_width = min(width, search + 2 * radius + 1)
+        if strip[3] - strip[2] < min_width:
+            strip[3] = min(width, strip[2] + min_width)
+            strip[2] = strip[3] - min_width
+        strips.append((strip, [(x1, y1, x2, y2)]))
+
+    # Merge overlapping strips until they are disjoint
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(strips)):
+            for j in range(i + 1, len(strips)):
+                a, b = strips[i][0], strips[j][0]
+                if a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]:
+                    strip = [min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])]
+                    strips[i] = (strip, strips[i][1] + strips[j][1])
+                    del strips[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return [(tuple(strip), boxes) for strip, boxes in strips]
+
+
+def compute_disparity_roi(left_img, right_img, bbox_coordinates, num_disparities=6 * 16, block_size=11, window_size=6,
+                          matcher="stereo_sgbm", engine=None, raw=False, context=None):
+    """
+    Compute the disparity only inside the given boxes.
+
+    Stereo matching runs on the strips returned by disparity_strips() instead of the full frame.
+    Pixels outside the boxes are set to the matcher's invalid value. For "stereo_bm" and "numpy_bm" the
+    results inside the boxes are identical to the full-frame computation. SGBM aggregates costs along whole
+    rows and columns, so its results inside the boxes approach the full-frame values as context grows.
+
+    Args:
+        left_img (numpy.ndarray): Left image of the stereo pair.
+        right_img (numpy.ndarray): Right image of the stereo pair.
+        bbox_coordinates (list): [x1, y1, x2, y2] boxes in pixels.
+        num_disparities (int): Maximum disparity minus minimum disparity.
+        block_size (int): Size of the block window. It must be an odd number.
+        window_size (int): Size of the disparity smoothness window.
+        matcher (str): Matcher algorithm to use ("stereo_bm", "stereo_sgbm" or "numpy_bm").
+        engine (DisparityEngine): Engine providing pooled matchers. Defaults to the shared engine.
+        raw (bool): Whether to return the int16 fixed-point map instead of pixels.
+        context (int): Extra context around every strip. Defaults to 0 for block matching and 64 for SGBM.
+
+    Returns:
+        numpy.ndarray: Full-size disparity map, valid only inside the boxes.
+    """
+    if engine is None:
+        engine = get_disparity_engine()
+    if context is None:
+        context = 0 if matcher in ("stereo_bm", "numpy_bm") else 64
+
+    # Convert the images to grayscale
+    left_gray = left_img if left_img.ndim == 2 else cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
+    right_gray = right_img if right_img.ndim == 2 else cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
+
+    disparity = np.full(left_gray.shape, -16, np.int16)
+    strips = disparity_strips(bbox_coordinates, left_gray.shape, num_disparities, block_size, context=context)
+    for (top, bottom, left, right), boxes in strips:
+        # Block matching output depends on row parity, so start strips on even rows
+        top -= top % 2
+
+        # Match the strip and copy the pixels of its boxes
+        strip_disparity = engine.compute_raw(left_gray[top:bottom, left:right], right_gray[top:bottom, left:right],
+                                             num_disparities=num_disparities, block_size=block_size,
+                                             window_size=window_size, matcher=matcher)
+        for x1, y1, x2, y2 in boxes:
+            disparity[y1:y2, x1:x2] = strip_disparity[y1 - top:y2 - top, x1 - left:x2 - left]
+
+    if raw:
+        return disparity
+    return disparity.astype(np.float32) / 16
+
+
+def display_text_file(index, folder_path, dataset=None):
+    """
+    Display the contents of a text file based on the specified index.
+
+    Args:
+        index (int): Index of the text file to display.
+        folder_path (str): Path to the folder containing the text files.
+        dataset (KittiDataset): Index of the dataset whose calibration or labels folder is folder_path.
+            If None, the folder is listed on every call.
+
+    Returns:
+        str: Contents of the text file.
+    """
+    if dataset is not None and index >= 0 and index < len(dataset):
+        # Look the file up in the dataset index
+        kind = 'calib' if folder_path == dataset.folders['calib'] else 'label'
+        file_path = dataset.calibration_path(dataset[index]) if kind == 'calib' else dataset.label_path(dataset[index])
+    else:
+        # Get the sorted list of text files in the folder
+        txt_files = sorted(f for f in os.listdir(folder_path) if f.endswith('.txt'))
+        file_path = os.path.join(folder_path, txt_files[index]) if 0 <= index < len(txt_files) else None
+
+    if file_path is not None:
+        # Open the file and read its contents
+        with open(file_path, 'r') as file:
+            contents = file.read()
+
+        # Display the contents of the text file
+        print(f"Text file at index {index}:\n{contents}")
+
+        # Return the contents of the text file
+        return contents
+    else:
+        print("Invalid index.")
+        return None
+
+
+#--- Function to retrieve callibration parameters
+def get_calibration_parameters(file_contents):
+    """
+    Retrieve calibration parameters from the contents of a calibration file.
+
+    Args:
+        file_contents (str): Contents of the calibration file.
+
+    Returns:
+        tuple: Tuple containing the calibration parameters:
+            - p_left (numpy.ndarray): Projection matrix for the left camera.
+            - p_right (numpy.ndarray): Projection matrix for the right camera.
+            - p_ro_rect (numpy.ndarray): Rectification matrix.
+            - p_velo_to_cam (numpy.ndarray): Transformation matrix from velodyne to camera coordinates.
+            - p_imu_to_velo (numpy.ndarray): Transformation matrix from IMU to velodyne coordinates.
+    """
+    fin = file_contents.split('\n')
+    for line in fin:
+        if line[:2] == 'P2':
+            p_left = np.array(line[4:].strip().split(" ")).astype('float32').reshape(3, -1)
+        elif line[:2] == 'P3':
+            p_right = np.array(line[4:].strip().split(" ")).astype('float32').reshape(3, -1)
+        elif line[:7] == 'R0_rect':
+            p_ro_rect = np.array(line[9:].strip().split(" ")).astype('float32').reshape(3, -1)
+        elif line[:14] == 'Tr_velo_to_cam':
+            p_velo_to_cam = np.array(line[16:].strip().split(" ")).astype('float32').reshape(3, -1)
+        elif line[:14] == 'Tr_imu_to_velo':
+            p_imu_to_velo = np.array(line[16:].strip().split(" ")).astype('float32').reshape(3, -1)
+    return p_left, p_right, p_ro_rect, p_velo_to_cam, p_imu_to_velo
+
+def decompose_projection_matrix(projection_matrix):
+    """
+    Decompose a projection matrix into camera matrix, rotation matrix, and translation vector.
+
+    Args:
+        projection_matrix (numpy.ndarray): 3x4 projection matrix.
+
+    Returns:
+        tuple: Tuple containing the decomposed components:
+            - camera_matrix (numpy.ndarray): Camera matrix. [ fx   0   cx ]
+                                                            [  0  fy   cy ]
+                                                            [  0   0    1 ]
+            - rotation_matrix (numpy.ndarray): Rotation matrix.
+            - translation_vector (numpy.ndarray): Translation vector.
+    """
+
+    # Decompose the projection matrix
+    camera_matrix, rotation_matrix, translation_vector, _, _, _, _ = cv2.decomposeProjectionMatrix(projection_matrix)
+    translation_vector = translation_vector/translation_vector[3]
+    # Return the decomposed components
+    return camera_matrix, rotation_matrix, translation_vector
+
+
+def rectified_camera_to_velodyne(p_ro_rect, p_velo_to_cam):
+    """
+    Compute the transform from rectified camera coordinates to velodyne coordinates.
+
+    Args:
+        p_ro_rect (numpy.ndarray): 3x3 rectification matrix.
+        p_velo_to_cam (numpy.ndarray): 3x4 velodyne to camera transform.
+
+    Returns:
+        numpy.ndarray: 4x4 homogeneous transform, the inverse of R0_rect @ Tr_velo_to_cam.
+    """
+    velo_to_rect = np.eye(4)
+    velo_to_rect[:3, :4] = p_velo_to_cam
+    rect = np.eye(4)
+    rect[:3, :3] = p_ro_rect
+    return np.linalg.inv(rect @ velo_to_rect)
+
+
+#--- Rectification maps for raw stereo input
+def parse_raw_calibration(file_contents, left_camera="02", right_camera="03"):
+    """
+    Retrieve the intrinsics, distortion and rectification of a stereo pair from a raw calibration file.
+
+    The file follows the KITTI raw calib_cam_to_cam.txt layout, with S_xx (image size), K_xx, D_xx,
+    S_rect_xx, R_rect_xx and P_rect_xx entries for every camera xx.
+
+    Args:
+        file_contents (str): Contents of the calibration file.
+        left_camera (str): Camera number of the left camera.
+        right_camera (str): Camera number of the right camera.
+
+    Returns:
+        dict: Keyword arguments of StereoRectifier.
+    """
+    values = {}
+    for line in file_contents.split('\n'):
+        name, _, data = line.partition(':')
+        try:
+            values[name.strip()] = np.array(data.split(), dtype=np.float64)
+        except ValueError:
+            # Non-numeric entries such as calib_time
+            continue
+
+    calibration = {}
+    for side, camera in (('left', left_camera), ('right', right_camera)):
+        calibration[f'camera_matrix_{side}'] = values[f'K_{camera}'].reshape(3, 3)
+        calibration[f'dist_{side}'] = values[f'D_{camera}']
+        calibration[f'rectification_{side}'] = values[f'R_rect_{camera}'].reshape(3, 3)
+        calibration[f'projection_{side}'] = values[f'P_rect_{camera}'].reshape(3, 4)
+    calibration['image_size'] = tuple(int(value) for value in values[f'S_{left_camera}'])
+    calibration['rectified_size'] = tuple(int(value) for value in values[f'S_rect_{left_camera}'])
+    return calibration
+
+
+class StereoRectifier:
+    """
+    Precomputed undistortion and rectification maps of a stereo camera pair.
+
+    The maps are built once with cv2.initUndistortRectifyMap in the compact CV_16SC2 fixed-point
+    format (integer source coordinates plus an interpolation table index), so rectifying a frame is
+    a single cv2.remap per image. The rectified grid can be scaled to output_size, in which case the
+    same remap also resizes the images and the projection matrices, focal length and principal point
+    describe the scaled grid. Bilinear remapping does not low-pass filter, so strong downscaling
+    aliases more than cv2.resize with INTER_AREA.
+
+    Args:
+        camera_matrix_left (numpy.ndarray): 3x3 intrinsics of the raw left camera.
+        dist_left (numpy.ndarray): Distortion coefficients of the left camera.
+        rectification_left (numpy.ndarray): 3x3 rectifying rotation of the left camera.
+        projection_left (numpy.ndarray): 3x4 projection matrix of the rectified left camera.
+        camera_matrix_right (numpy.ndarray): 3x3 intrinsics of the raw right camera.
+        dist_right (numpy.ndarray): Distortion coefficients of the right camera.
+        rectification_right (numpy.ndarray): 3x3 rectifying rotation of the right camera.
+        projection_right (numpy.ndarray): 3x4 projection matrix of the rectified right camera.
+        rectified_size (tuple): (width, height) of the rectified images the projections refer to.
+        image_size (tuple): Optional (width, height) of the raw images, checked on every frame.
+        output_size (tuple): (width, height) of the output images. Defaults to rectified_size.
+        interpolation (int): cv2.remap interpolation.
+    """
+
+    def __init__(self, camera_matrix_left, dist_left, rectification_left, projection_left, camera_matrix_right,
+                 dist_right, rectification_right, projection_right, rectified_size, image_size=None,
+                 output_size=None, interpolation=cv2.INTER_LINEAR):
+        self.image_size = tuple(image_size) if image_size is not None else None
+        self.output_size = tuple(output_size) if output_size is not None else tuple(rectified_size)
+        self.interpolation = interpolation
+
+        # Scale the rectified grid, keeping pixel centers aligned: x' = (x + 0.5) * scale - 0.5
+        scale_x = self.output_size[0] / rectified_size[0]
+        scale_y = self.output_size[1] / rectified_size[1]
+        scaling = np.array([[scale_x, 0, 0.5 * scale_x - 0.5], [0, scale_y, 0.5 * scale_y - 0.5], [0, 0, 1]])
+        self.projection_left = scaling @ np.asarray(projection_left, np.float64)
+        self.projection_right = scaling @ np.asarray(projection_right, np.float64)
+
+        # Build the fixed-point maps of both cameras once
+        self.maps = []
+        for camera_matrix, dist, rectification, projection in (
+                (camera_matrix_left, dist_left, rectification_left, self.projection_left),
+                (camera_matrix_right, dist_right, rectification_right, self.projection_right)):
+            self.maps.append(cv2.initUndistortRectifyMap(
+                np.asarray(camera_matrix, np.float64), np.asarray(dist, np.float64),
+                np.asarray(rectification, np.float64), projection[:, :3], self.output_size, cv2.CV_16SC2))
+
+        # Rectified geometry used for depth
+        self.focal_length = self.projection_left[0, 0]
+        self.cx, self.cy = self.projection_left[0, 2], self.projection_left[1, 2]
+        self.baseline = abs(self.projection_left[0, 3] / self.projection_left[0, 0]
+                            - self.projection_right[0, 3] / self.projection_right[0, 0])
+
+    @classmethod
+    def from_stereo_calibration(cls, camera_matrix_left, dist_left, camera_matrix_right, dist_right, rotation,
+                                translation, image_size, output_size=None, alpha=0, interpolation=cv2.INTER_LINEAR):
+        """
+        Create the rectifier of a rig from its stereo calibration, e.g. the output of cv2.stereoCalibrate.
+
+        Args:
+            camera_matrix_left (numpy.ndarray): 3x3 intrinsics of the left camera.
+            dist_left (numpy.ndarray): Distortion coefficients of the left camera.
+            camera_matrix_right (numpy.ndarray): 3x3 intrinsics of the right camera.
+            dist_right (numpy.ndarray): Distortion coefficients of the right camera.
+            rotation (numpy.ndarray): 3x3 rotation from the left to the right camera.
+            translation (numpy.ndarray): Translation from the left to the right camera.
+            image_size (tuple): (width, height) of the raw images.
+            output_size (tuple): (width, height) of the output images. Defaults to image_size.
+            alpha (float): Free scaling of cv2.stereoRectify; 0 keeps only valid pixels, 1 keeps all pixels.
+            interpolation (int): cv2.remap interpolation.
+
+        Returns:
+            StereoRectifier: The rectifier.
+        """
+        rectification_left, rectification_right, projection_left, projection_right, _, _, _ = cv2.stereoRectify(
+            camera_matrix_left, dist_left, camera_matrix_right, dist_right, tuple(image_size),
+            np.asarray(rotation, np.float64), np.asarray(translation, np.float64).reshape(3, 1),
+            flags=cv2.CALIB_ZERO_DISPARITY, alpha=alpha)
+        return cls(camera_matrix_left, dist_left, rectification_left, projection_left, camera_matrix_right,
+                   dist_right, rectification_right, projection_right, image_size, image_size=image_size,
+                   output_size=output_size, interpolation=interpolation)
+
+    def rectify(self, left_image, right_image):
+        """
+        Undistort and rectify a raw stereo pair, resizing it to the output size.
+
+        Args:
+            left_image (numpy.ndarray): Raw left image, color or grayscale.
+            right_image (numpy.ndarray): Raw right image, color or grayscale.
+
+        Returns:
+            tuple: (left_image, right_image) rectified images of the output size.
+        """
+        if self.image_size is not None:
+            for image in (left_image, right_image):
+                if (image.shape[1], image.shape[0]) != self.image_size:
+                    raise ValueError(f"Expected {self.image_size[0]}x{self.image_size[1]} raw images, "
+                                     f"got {image.shape[1]}x{image.shape[0]}")
+
+        with _metrics.timer('rectify'):
+            return tuple(cv2.remap(image, map1, map2, self.interpolation, borderMode=cv2.BORDER_CONSTANT)
+                         for image, (map1, map2) in zip((left_image, right_image), self.maps))
+
+
+_rectifiers = {}
+
+
+def get_rectifier(calibration_file, output_size=None, left_camera="02", right_camera="03"):
+    """
+    Return the shared StereoRectifier of a raw calibration file, building its maps on first use.
+
+    The rectifier is rebuilt when the file is modified.
+    """
+    key = (calibration_file, tuple(output_size) if output_size is not None else None, left_camera, right_camera)
+    mtime = os.stat(calibration_file).st_mtime_ns
+    entry = _rectifiers.get(key)
+    if entry is None or entry[0] != mtime:
+        with open(calibration_file, 'r') as file:
+            calibration = parse_raw_calibration(file.read(), left_camera, right_camera)
+        entry = _rectifiers[key] = (mtime, StereoRectifier(**calibration, output_size=output_size))
+    return entry[1]
+
+
+#--- Pre-parsed calibration store
+Calibration = collections.namedtuple('Calibration', [
+    'p_left', 'p_right', 'p_ro_rect', 'p_velo_to_cam', 'p_imu_to_velo',
+    'camera_matrix_left', 'camera_matrix_right', 'fx', 'fy', 'cx', 'cy', 'baseline', 'cam_to_velo'])
+
+
+class CalibrationStore:
+    """
+    Calibration of every frame of a calibration folder, parsed once and kept in arrays.
+
+    The raw matrices and the quantities derived from them (camera matrices, focal lengths,
+    principal point, baseline and the rectified camera to velodyne transform) are stored in
+    a compressed .npz file next to the data. When the store is reopened only files whose
+    modification time changed are parsed again, so per-frame lookups never touch the text files.
+
+    Args:
+        arrays (dict): Arrays of the store, one row per frame.
+        store_path (str): Path of the .npz store the arrays were saved to, if any.
+    """
+
+    FIELDS = ('p_left', 'p_right', 'p_ro_rect', 'p_velo_to_cam', 'p_imu_to_velo',
+              'camera_matrix_left', 'camera_matrix_right', 'fx', 'fy', 'cx', 'cy', 'baseline', 'cam_to_velo')
+
+    def __init__(self, arrays, store_path=None):
+        self.arrays = arrays
+        self.store_path = store_path
+        self.frame_ids = [str(frame_id) for frame_id in arrays['frame_ids']]
+        self._index = {frame_id: index for index, frame_id in enumerate(self.frame_ids)}
+
+    @classmethod
+    def _field_layout(cls):
+        # Per-row shape and dtype of every field
+        shapes = {'p_left': (3, 4), 'p_right': (3, 4), 'p_ro_rect': (3, 3), 'p_velo_to_cam': (3, 4),
+                  'p_imu_to_velo': (3, 4), 'camera_matrix_left': (3, 3), 'camera_matrix_right': (3, 3),
+                  'cam_to_velo': (4, 4)}
+        return [(field, shapes.get(field, ()), np.float64 if field == 'cam_to_velo' else np.float32)
+                for field in cls.FIELDS]
+
+    @staticmethod
+    def parse_file(file_path):
+        """
+        Parse a calibration file and derive the quantities used for depth and point clouds.
+
+        Args:
+            file_path (str): Path of the calibration file.
+
+        Returns:
+            dict: One entry per field of Calibration.
+        """
+        with open(file_path, 'r') as file:
+            p_left, p_right, p_ro_rect, p_velo_to_cam, p_imu_to_velo = get_calibration_parameters(file.read())
+
+        # Decompose the projection matrices
+        camera_matrix_left, _, translation_vector_left = decompose_projection_matrix(p_left)
+        camera_matrix_right, _, translation_vector_right = decompose_projection_matrix(p_right)
+
+        return {
+            'p_left': p_left, 'p_right': p_right, 'p_ro_rect': p_ro_rect,
+            'p_velo_to_cam': p_velo_to_cam, 'p_imu_to_velo': p_imu_to_velo,
+            'camera_matrix_left': camera_matrix_left, 'camera_matrix_right': camera_matrix_right,
+            'fx': camera_matrix_right[0, 0], 'fy': camera_matrix_right[1, 1],
+            'cx': camera_matrix_left[0, 2], 'cy': camera_matrix_left[1, 2],
+            'baseline': abs(translation_vector_left[0, 0] - translation_vector_right[0, 0]),
+            'cam_to_velo': rectified_camera_to_velodyne(p_ro_rect, p_velo_to_cam),
+        }
+
+    @classmethod
+    def open(cls, calibration_folder, store_path=None):
+        """
+        Load the store and bring it up to date with the calibration folder.
+
+        Args:
+            calibration_folder (str): Path to the folder containing the calibration files.
+            store_path (str): Path of the .npz store. Defaults to calibration.npz next to the folder.
+
+        Returns:
+            CalibrationStore: The up-to-date store.
+        """
+        if store_path is None:
+            store_path = os.path.join(os.path.dirname(os.path.normpath(calibration_folder)), 'calibration.npz')
+
+        # Modification time of every calibration file
+        mtimes = {}
+        for entry in os.scandir(calibration_folder):
+            if entry.name.endswith('.txt'):
+                mtimes[os.path.splitext(entry.name)[0]] = entry.stat().st_mtime_ns
+
+        # Reuse the rows of files that did not change since the store was written, loading every array once
+        kept = {field: np.zeros((0,) + shape, dtype) for field, shape, dtype in cls._field_layout()}
+        kept_ids = np.zeros(0, dtype=str)
+        stored_count = None
+        if os.path.exists(store_path):
+            with np.load(store_path) as stored:
+                stored = {name: stored[name] for name in stored.files}
+            stored_count = len(stored['frame_ids'])
+            current = np.array([mtimes.get(str(frame_id), -1) for frame_id in stored['frame_ids']], dtype=np.int64)
+            unchanged = current == stored['mtimes']
+            kept = {field: stored[field][unchanged] for field in cls.FIELDS}
+            kept_ids = stored['frame_ids'][unchanged]
+        changed = len(kept_ids) != len(mtimes) or stored_count != len(mtimes)
+
+        # Parse the new and modified files
+        new_ids = sorted(mtimes.keys() - set(kept_ids.tolist()))
+        rows = [cls.parse_file(os.path.join(calibration_folder, frame_id + '.txt')) for frame_id in new_ids]
+
+        # Merge the kept and parsed rows in frame order
+        arrays = {}
+        for field, _, dtype in cls._field_layout():
+            parsed = np.array([row[field] for row in rows], dtype=dtype).reshape((len(rows),) + kept[field].shape[1:])
+            arrays[field] = np.concatenate([kept[field].astype(dtype), parsed])
+        frame_ids = np.concatenate([kept_ids, np.array(new_ids, dtype=str)]).astype(str)
+        order = np.argsort(frame_ids, kind='stable')
+        arrays = {field: values[order] for field, values in arrays.items()}
+        arrays['frame_ids'] = frame_ids[order]
+        arrays['mtimes'] = np.array([mtimes[frame_id] for frame_id in arrays['frame_ids'].tolist()], dtype=np.int64)
+
+        if changed:
+            np.savez_compressed(store_path, **arrays)
+        return cls(arrays, store_path)
+
+    @classmethod
+    def load(cls, store_path):
+        """
+        Load a saved store as is, without checking it against the calibration folder.
+
+        Args:
+            store_path (str): Path of the .npz store written by open().
+
+        Returns:
+            CalibrationStore: The store.
+        """
+        with np.load(store_path) as stored:
+            return cls({name: stored[name] for name in stored.files}, store_path)
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __contains__(self, frame_id):
+        return frame_id in self._index
+
+    def get(self, frame_id):
+        """
+        Return the calibration of a frame.
+
+        Args:
+            frame_id (str): Frame ID, e.g. "000013".
+
+        Returns:
+            Calibration: Raw matrices and derived quantities of the frame.
+        """
+        index = self._index[frame_id]
+        return Calibration(*(self.arrays[field][index] for field in self.FIELDS))
+
+
+_calibration_stores = {}
+
+
+def get_calibration_store(store_path):
+    """
+    Return the calibration store saved at a path, loading it once per process.
+
+    The store is loaded again when the file is rewritten.
+    """
+    mtime = os.stat(store_path).st_mtime_ns
+    entry = _calibration_stores.get(store_path)
+    if entry is None or entry[0] != mtime:
+        entry = _calibration_stores[store_path] = (mtime, CalibrationStore.load(store_path))
+    return entry[1]
+
+
+def calculate_depth_map(disparity, baseline, focal_length, show_depth_map=True):
+    """
+    Calculates the depth map from a given disparity map, baseline, and focal length.
+
+    Args:
+        disparity (numpy.ndarray): Disparity map.
+        baseline (float): Baseline between the cameras.
+        focal_length (float): Focal length of the camera.
+
+    Returns:
+        numpy.ndarray: Depth map.
+    """
+
+    # Replace all instances of 0 and -1 disparity with a small minimum value (to avoid div by 0 or negatives)
+    disparity[disparity == 0] = 0.1
+    disparity[disparity == -1] = 0.1
+
+    # Initialize the depth map to match the size of the disparity map
+    depth_map = np.ones(disparity.shape, np.single)
+
+    # Calculate the depths
+    depth_map[:] = focal_length * baseline / disparity[:]
+
+    if show_depth_map:
+        # Display the disparity map using matplotlib
+        plt.imshow(depth_map, cmap="cividis") #CMRmap_r # cividis
+        plt.title('Depth map', fontsize=12)
+        plt.show()
+
+    return depth_map
+
+
+
+
+#--- Lookup-table depth from raw fixed-point disparity
+class DepthLUT:
+    """
+    Depth lookup table indexed by the raw int16 disparity returned by OpenCV matchers.
+
+    OpenCV returns disparities in 1/16 pixel steps, so there are only 16 * num_disparities
+    possible valid values. Their depths are computed once, and converting a frame becomes a
+    single table lookup into caller-owned buffers, so one table can be shared by several
+    threads. Pixels without a valid disparity (the matcher's invalid marker, zero or negative
+    disparities) are reported in an explicit mask and get invalid_depth instead of a made-up
+    disparity.
+
+    Args:
+        baseline (float): Baseline between the cameras.
+        focal_length (float): Focal length of the camera.
+        num_disparities (int): Maximum disparity minus minimum disparity used by the matcher.
+        min_disparity (int): Minimum disparity used by the matcher.
+        invalid_depth (float): Depth assigned to invalid pixels.
+    """
+
+    def __init__(self, baseline, focal_length, num_disparities, min_disparity=0, invalid_depth=0.0):
+        self.num_disparities = num_disparities
+        self.min_disparity = min_disparity
+        self.invalid_depth = invalid_depth
+
+        # The lowest raw value is the matcher's invalid marker (min_disparity - 1) * 16
+        self.offset = (min_disparity - 1) * 16
+        raw_values = np.arange(self.offset, (min_disparity + num_disparities) * 16 + 1)
+        self.min_valid = max(min_disparity * 16, 1)
+
+        # Depth of every possible raw disparity
+        valid = raw_values >= self.min_valid
+        self.lut = np.full(raw_values.shape, invalid_depth, np.float32)
+        self.lut[valid] = float(np.squeeze(focal_length)) * float(np.squeeze(baseline)) / (raw_values[valid] / 16.0)
+
+    def compute(self, raw_disparity, out=None, valid_mask=None, index_out=None):
+        """
+        Convert a raw int16 disparity map to depth.
+
+        Args:
+            raw_disparity (numpy.ndarray): int16 disparity map scaled by 16.
+            out (numpy.ndarray): Optional float32 buffer receiving the depth map.
+            valid_mask (numpy.ndarray): Optional bool buffer receiving the valid-pixel mask.
+            index_out (numpy.ndarray): Optional int32 scratch buffer for the table indices.
+
+        Returns:
+            tuple: (depth_map, valid_mask).
+        """
+        if index_out is None:
+            index_out = np.empty(raw_disparity.shape, np.int32)
+        if out is None:
+            out = np.empty(raw_disparity.shape, np.float32)
+        if valid_mask is None:
+            valid_mask = np.empty(raw_disparity.shape, bool)
+
+        # Shift raw values to table indices and look the depths up
+        np.subtract(raw_disparity, self.offset, out=index_out, dtype=np.int32)
+        np.take(self.lut, index_out, out=out, mode='clip')
+        np.greater_equal(raw_disparity, self.min_valid, out=valid_mask)
+
+        return out, valid_mask
+
+
+_depth_luts = collections.OrderedDict()
+_depth_luts_lock = threading.Lock()
+MAX_DEPTH_LUTS = 64
+
+
+def get_depth_lut(baseline, focal_length, num_disparities, min_disparity=0, invalid_depth=0.0):
+    """
+    Return a shared DepthLUT for the given calibration and disparity range, building it on first use.
+
+    The MAX_DEPTH_LUTS most recently used tables are kept.
+    """
+    key = (float(np.squeeze(baseline)), float(np.squeeze(focal_length)), num_disparities, min_disparity, invalid_depth)
+    with _depth_luts_lock:
+        depth_lut = _depth_luts.get(key)
+        if depth_lut is None:
+            depth_lut = _depth_luts[key] = DepthLUT(*key)
+            while len(_depth_luts) > MAX_DEPTH_LUTS:
+                _depth_luts.popitem(last=False)
+        else:
+            _depth_luts.move_to_end(key)
+    return depth_lut
+
+
+def calculate_depth_map_raw(raw_disparity, baseline, focal_length, num_disparities, min_disparity=0, out=None,
+                            valid_mask=None, index_out=None):
+    """
+    Calculates the depth map from a raw int16 disparity map with a lookup table.
+
+    Args:
+        raw_disparity (numpy.ndarray): int16 disparity map scaled by 16, e.g. compute_disparity(..., raw=True).
+        baseline (float): Baseline between the cameras.
+        focal_length (float): Focal length of the camera.
+        num_disparities (int): Maximum disparity minus minimum disparity used by the matcher.
+        min_disparity (int): Minimum disparity used by the matcher.
+        out (numpy.ndarray): Optional float32 buffer receiving the depth map.
+        valid_mask (numpy.ndarray): Optional bool buffer receiving the valid-pixel mask.
+        index_out (numpy.ndarray): Optional int32 scratch buffer for the table indices.
+
+    Returns:
+        tuple: (depth_map, valid_mask). Invalid pixels have a depth of 0.
+    """
+    depth_lut = get_depth_lut(baseline, focal_length, num_disparities, min_disparity)
+    return depth_lut.compute(raw_disparity, out=out, valid_mask=valid_mask, index_out=index_out)
+
+
+_depth_buffers = threading.local()
+
+
+def get_depth_buffers(shape):
+    """
+    Return the calling thread's (disparity, depth, valid_mask, index) buffers for frames of a shape.
+
+    The buffers are reused by every frame of the thread and reallocated when the shape changes,
+    so maps computed in them must be copied if they have to outlive the thread's next frame.
+    """
+    shape = tuple(shape[:2])
+    buffers = getattr(_depth_buffers, 'buffers', None)
+    if buffers is None or buffers[0].shape != shape:
+        buffers = _depth_buffers.buffers = (np.empty(shape, np.float32), np.empty(shape, np.float32),
+                                            np.empty(shape, bool), np.empty(shape, np.int32))
+    return buffers
+
+
+def depth_from_raw_disparity(raw_disparity, baseline, focal_length, num_disparities, min_disparity=0, buffers=None):
+    """
+    Convert a raw int16 disparity map to disparity in pixels and depth through the depth lookup table.
+
+    Args:
+        raw_disparity (numpy.ndarray): int16 disparity map scaled by 16.
+        baseline (float): Baseline between the cameras.
+        focal_length (float): Focal length of the camera.
+        num_disparities (int): Maximum disparity minus minimum disparity used by the matcher.
+        min_disparity (int): Minimum disparity used by the matcher.
+        buffers (tuple): (disparity, depth, valid_mask, index) buffers, e.g. from get_depth_buffers().
+            Defaults to the calling thread's buffers.
+
+    Returns:
+        tuple: (disparity_map, depth_map, valid_mask) in the buffers. Pixels below min_disparity
+            have a disparity of -1 and invalid pixels a depth of 0.
+    """
+    if buffers is None:
+        buffers = get_depth_buffers(raw_disparity.shape)
+    disparity_map, out, valid_mask, index_out = buffers
+
+    np.multiply(raw_disparity, 1 / 16, out=disparity_map)
+    if min_disparity > 0:
+        disparity_map[raw_disparity < min_disparity * 16] = -1
+    depth_map, valid_mask = calculate_depth_map_raw(raw_disparity, baseline, focal_length, num_disparities,
+                                                    min_disparity, out=out, valid_mask=valid_mask,
+                                                    index_out=index_out)
+    return disparity_map, depth_map, valid_mask
+
+
+#--- Lossless disparity and depth storage
+KITTI_PNG_SCALE = 256.0
+
+
+def encode_fixed_point(values, valid_mask=None, scale=KITTI_PNG_SCALE):
+    """
+    Encode a float map as uint16 fixed point, with 0 for invalid pixels.
+
+    Args:
+        values (numpy.ndarray): Disparity map in pixels or depth map in meters.
+        valid_mask (numpy.ndarray): Optional mask of the valid pixels. Defaults to values > 0.
+        scale (float): Fixed-point scale.
+
+    Returns:
+        numpy.ndarray: uint16 map.
+    """
+    if valid_mask is None:
+        valid_mask = values > 0
+
+    # Values that do not fit in 16 bits are stored as invalid rather than clipped
+    encoded = np.rint(np.asarray(values, np.float64) * scale)
+    valid_mask = valid_mask & (encoded >= 1) & (encoded <= 65535)
+    return np.where(valid_mask, encoded, 0).astype(np.uint16)
+
+
+def write_kitti_png(file_path, values, valid_mask=None, scale=KITTI_PNG_SCALE):
+    """
+    Save a disparity or depth map as a KITTI-style 16-bit fixed-point PNG.
+
+    Values are stored as round(value * scale) with 0 meaning "no measurement", so disparities
+    up to 255.99 px and depths up to 255.99 m are kept with a resolution of 1/256.
+
+    Args:
+        file_path (str): Output .png path.
+        values (numpy.ndarray): Disparity map in pixels or depth map in meters.
+        valid_mask (numpy.ndarray): Optional mask of the valid pixels. Defaults to values > 0.
+        scale (float): Fixed-point scale.
+
+    Returns:
+        numpy.ndarray: The uint16 image that was written.
+    """
+    image = encode_fixed_point(values, valid_mask, scale)
+    if not cv2.imwrite(file_path, image):
+        raise IOError(f"Could not write {file_path}")
+    return image
+
+
+def write_kitti_disparity_png(file_path, raw_disparity):
+    """
+    Save a raw int16 OpenCV disparity map (scaled by 16) losslessly as a KITTI disparity PNG.
+
+    Args:
+        file_path (str): Output .png path.
+        raw_disparity (numpy.ndarray): int16 disparity map scaled by 16, e.g. compute_disparity(..., raw=True).
+
+    Returns:
+        numpy.ndarray: The uint16 image that was written.
+    """
+    # 1/16 pixel steps map exactly onto 1/256 pixel steps
+    image = np.where(raw_disparity > 0, raw_disparity.astype(np.int32) * int(KITTI_PNG_SCALE // 16), 0)
+    image = image.astype(np.uint16)
+    if not cv2.imwrite(file_path, image):
+        raise IOError(f"Could not write {file_path}")
+    return image
+
+
+def read_kitti_png(file_path, scale=KITTI_PNG_SCALE):
+    """
+    Load a KITTI-style 16-bit disparity or depth PNG.
+
+    Args:
+        file_path (str): Path of the .png file.
+        scale (float): Fixed-point scale.
+
+    Returns:
+        tuple: (float32 values, valid_mask). Invalid pixels have a value of 0.
+    """
+    image = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+    if image is None or image.dtype != np.uint16:
+        raise IOError(f"{file_path} is not a 16-bit PNG")
+    return image.astype(np.float32) / scale, image > 0
+
+
+def read_image_shape(file_path):
+    """
+    Return the (height, width) of an image file, reading only the header of PNG files.
+    """
+    with open(file_path, 'rb') as file:
+        header = file.read(24)
+    if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+        return int.from_bytes(header[20:24], 'big'), int.from_bytes(header[16:20], 'big')
+
+    # Other formats are decoded
+    image = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise IOError(f"Cannot read {file_path}")
+    return image.shape[:2]
+
+
+class DepthStore:
+    """
+    Memory-mapped store of per-frame depth or disparity maps with random access.
+
+    Frames of any size are stored back to back in flat chunk files of up to frames_per_chunk
+    frames, which are memory-mapped without decoding anything. An index.json file records the
+    chunk, offset and shape of every frame and the encoding. Three encodings are supported:
+    - "float32": exact values,
+    - "float16": half the size, about 3 significant digits,
+    - "uint16": KITTI-style fixed point with 1/scale resolution and 0 for invalid pixels.
+    Invalid pixels are stored as 0 in every encoding.
+
+    Args:
+        store_path (str): Folder of the store.
+        index (dict): Contents of index.json.
+        mode (str): "r" for read-only memory maps, "r+" to write frames.
+    """
+
+    STORE_VERSION = 2
+    ENCODINGS = ('float32', 'float16', 'uint16')
+
+    def __init__(self, store_path, index, mode='r'):
+        if index.get('version') != self.STORE_VERSION:
+            raise ValueError(f"Unsupported depth store version in {store_path}; create the store again")
+        self.store_path = store_path
+        self.index = index
+        self.mode = mode
+        self.encoding = index['encoding']
+        self.scale = index['scale']
+        self.frames_per_chunk = index['frames_per_chunk']
+        self._chunks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, store_path, encoding='float16', frames_per_chunk=256, scale=KITTI_PNG_SCALE):
+        """
+        Create an empty store.
+
+        Args:
+            store_path (str): Folder of the store.
+            encoding (str): One of ENCODINGS.
+            frames_per_chunk (int): Maximum number of frames per chunk file.
+            scale (float): Fixed-point scale of the uint16 encoding.
+
+        Returns:
+            DepthStore: The store, open for writing.
+        """
+        if encoding not in cls.ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding}")
+        os.makedirs(store_path, exist_ok=True)
+
+        # Replace the chunks of a previous store in the same folder
+        for name in os.listdir(store_path):
+            if name.startswith('chunk_'):
+                os.remove(os.path.join(store_path, name))
+
+        # chunks holds the number of frames and the size in values of every chunk file
+        index = {'version': cls.STORE_VERSION, 'encoding': encoding, 'scale': scale,
+                 'frames_per_chunk': frames_per_chunk, 'chunks': [], 'frames': {}}
+        store = cls(store_path, index, mode='r+')
+        store.flush()
+        return store
+
+    @classmethod
+    def open(cls, store_path, mode='r'):
+        """
+        Open an existing store.
+
+        Args:
+            store_path (str): Folder of the store.
+            mode (str): "r" for read-only access, "r+" to add frames.
+
+        Returns:
+            DepthStore: The store.
+        """
+        with open(os.path.join(store_path, 'index.json'), 'r') as file:
+            return cls(store_path, json.load(file), mode=mode)
+
+    def flush(self):
+        """
+        Flush the written frames and save the index atomically.
+        """
+        with self._lock:
+            for chunk in self._chunks.values():
+                if chunk.mode != 'r':
+                    chunk.flush()
+            temporary_path = os.path.join(self.store_path, 'index.json.tmp')
+            with open(temporary_path, 'w') as file:
+                json.dump(self.index, file)
+            os.replace(temporary_path, os.path.join(self.store_path, 'index.json'))
+
+    def close(self):
+        """
+        Flush a writable store and release the memory maps.
+        """
+        if self.mode != 'r':
+            self.flush()
+        self._chunks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.index['frames'])
+
+    def __contains__(self, frame_id):
+        return frame_id in self.index['frames']
+
+    @property
+    def frame_ids(self):
+        return sorted(self.index['frames'])
+
+    def frame_shape(self, frame_id):
+        """
+        Return the (height, width) of a frame.
+        """
+        return tuple(self.index['frames'][frame_id]['shape'])
+
+    def _allocate(self, frame_id, shape):
+        # Append the frame to the last chunk, or start a new one; the caller holds the lock
+        chunks = self.index['chunks']
+        if not chunks or chunks[-1][0] >= self.frames_per_chunk:
+            chunks.append([0, 0])
+        num_frames, offset = chunks[-1]
+        height, width = int(shape[0]), int(shape[1])
+        chunks[-1] = [num_frames + 1, offset + height * width]
+        entry = self.index['frames'][frame_id] = {'chunk': len(chunks) - 1, 'offset': offset,
+                                                  'shape': [height, width]}
+
+        # The chunk grew, so it is mapped again at its new size on next use
+        self._chunks.pop(entry['chunk'], None)
+        return entry
+
+    def _chunk(self, chunk_index):
+        # Memory-map the chunk file, growing it when a writable store has added frames to it
+        with self._lock:
+            chunk = self._chunks.get(chunk_index)
+            if chunk is None:
+                chunk_path = os.path.join(self.store_path, f"chunk_{chunk_index:05d}.bin")
+                size = self.index['chunks'][chunk_index][1]
+                if self.mode != 'r':
+                    with open(chunk_path, 'ab') as file:
+                        if file.tell() < size * np.dtype(self.encoding).itemsize:
+                            file.truncate(size * np.dtype(self.encoding).itemsize)
+                chunk = self._chunks[chunk_index] = np.memmap(chunk_path, dtype=self.encoding, mode=self.mode,
+                                                              shape=(size,))
+            return chunk
+
+    def _view(self, entry):
+        height, width = entry['shape']
+        start = entry['offset']
+        return self._chunk(entry['chunk'])[start:start + height * width].reshape(height, width)
+
+    def reserve(self, frame_shapes):
+        """
+        Assign space to frames and create their chunk files in advance, e.g. before worker
+        processes write them in parallel. The index is saved so that workers can open the store.
+
+        Args:
+            frame_shapes (dict): (height, width) of every frame ID.
+        """
+        with self._lock:
+            for frame_id, shape in frame_shapes.items():
+                if frame_id not in self.index['frames']:
+                    self._allocate(frame_id, shape)
+        for chunk_index in range(len(self.index['chunks'])):
+            self._chunk(chunk_index)
+        self.flush()
+
+    def encode(self, values, valid_mask=None):
+        """
+        Encode a float map into the storage type of the store.
+        """
+        if self.encoding == 'uint16':
+            return encode_fixed_point(values, valid_mask, self.scale)
+        if valid_mask is None:
+            valid_mask = values > 0
+        return np.where(valid_mask, values, 0).astype(self.encoding)
+
+    def put(self, frame_id, values, valid_mask=None):
+        """
+        Store the map of a frame.
+
+        Frames that were not reserved are appended to the store, which only the process that
+        owns the store may do.
+
+        Args:
+            frame_id (str): Frame ID, e.g. "000013".
+            values (numpy.ndarray): Depth map in meters or disparity map in pixels.
+            valid_mask (numpy.ndarray): Optional mask of the valid pixels. Defaults to values > 0.
+        """
+        with self._lock:
+            entry = self.index['frames'].get(frame_id)
+            if entry is None:
+                entry = self._allocate(frame_id, values.shape)
+        if tuple(values.shape) != tuple(entry['shape']):
+            raise ValueError(f"Frame shape {values.shape} does not match the shape {tuple(entry['shape'])} "
+                             f"reserved for {frame_id}")
+        self._view(entry)[...] = self.encode(values, valid_mask)
+
+    def raw(self, frame_id):
+        """
+        Return the stored values of a frame as a memory-mapped view, without decoding.
+        """
+        return self._view(self.index['frames'][frame_id])
+
+    def get(self, frame_id):
+        """
+        Return the map of a frame.
+
+        Args:
+            frame_id (str): Frame ID, e.g. "000013".
+
+        Returns:
+            tuple: (float32 values, valid_mask). Invalid pixels have a value of 0.
+        """
+        stored = self.raw(frame_id)
+        values = stored.astype(np.float32)
+        if self.encoding == 'uint16':
+            values /= self.scale
+        return values, stored > 0
+
+
+#--- Batch processing of image folders
+def _init_batch_worker(weights_path=None, worker_baseline=None, worker_focal_length=None):
+    """
+    Initialize a batch worker process with its own disparity engine and, optionally, the YOLO model.
+
+    Args:
+        weights_path (str): Path to the YOLO weights. If None, the model is not loaded.
+        worker_baseline (float): Baseline used by pipeline() in this worker.
+        worker_focal_length (float): Focal length used by pipeline() in this worker.
+    """
+    global _disparity_engine, _pipeline_executor, model, names, baseline, focal_length
+
+    # Each process already runs in parallel, so its engine does not need extra threads
+    _disparity_engine = DisparityEngine(num_threads=1)
+
+    # Thread pools inherited through fork have no live threads
+    _pipeline_executor = None
+
+    if weights_path is not None:
+        model = YOLO(weights_path)
+        names = model.names
+    if worker_baseline is not None:
+        baseline = worker_baseline
+    if worker_focal_length is not None:
+        focal_length = worker_focal_length
+
+
+def _run_file_task(task_args):
+    """
+    Run a per-file task and capture its outcome so that one bad file does not stop the batch.
+
+    Returns:
+        tuple: (image_file, output_file, error) where error is None on success.
+    """
+    task, image_file, args = task_args
+    try:
+        with _metrics.timer('batch.file'):
+            return image_file, task(image_file, *args), None
+    except Exception as error:
+        return image_file, None, f"{type(error).__name__}: {str(error).strip()}"
+
+
+def run_folder_batch(task, image_files, args=(), message="Saved", num_workers=1, chunksize=8, initargs=(),
+                     outputs=None):
+    """
+    Apply a per-file task to a list of image files, serially or on a process pool.
+
+    Args:
+        task (callable): Function called as task(image_file, *args) that returns the output file path.
+        image_files (list): Image file names to process.
+        args (tuple): Extra arguments passed to the task.
+        message (str): Progress message printed for every saved file. None disables the messages.
+        num_workers (int): Number of worker processes. 1 processes the files in the current process.
+        chunksize (int): Number of files sent to a worker at a time.
+        initargs (tuple): Arguments for _init_batch_worker in each worker process.
+        outputs (list): Optional list receiving an (image_file, output) tuple for every file that succeeded.
+
+    Returns:
+        list: (image_file, error) tuples for the files that failed.
+    """
+    task_args = [(task, image_file, args) for image_file in image_files]
+
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers, initializer=_init_batch_worker, initargs=initargs)
+        results = pool.imap_unordered(_run_file_task, task_args, chunksize=chunksize)
+    else:
+        pool = None
+        results = map(_run_file_task, task_args)
+
+    # Report progress and failures as files complete
+    failures = []
+    try:
+        for image_file, output_file, error in results:
+            _metrics.increment('files_processed' if error is None else 'files_failed')
+            if error is None:
+                if outputs is not None:
+                    outputs.append((image_file, output_file))
+                if message is not None:
+                    print(f"{message}: {output_file}")
+            else:
+                failures.append((image_file, error))
+                print(f"Failed: {image_file} ({error})")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return failures
+
+
+def _save_disparity_map_file(image_file, left_image_folder, right_image_folder, output_folder, kitti_png=False,
+                             cache_path=None):
+    cache = get_result_cache(cache_path) if cache_path is not None else None
+
+    # Construct the paths for the left and right images
+    left_image_path = os.path.join(left_image_folder, image_file)
+    right_image_path = os.path.join(right_image_folder, image_file)
+
+    # Read the left and right images
+    left_image = cv2.imread(left_image_path)
+    right_image = cv2.imread(right_image_path)
+
+    if kitti_png:
+        # Save the raw disparity losslessly as a 16-bit PNG
+        raw_disparity = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
+                                          matcher="stereo_sgbm", show_disparity=False, raw=True, cache=cache)
+        output_file = os.path.join(output_folder, os.path.splitext(image_file)[0] + '.png')
+        write_kitti_disparity_png(output_file, raw_disparity)
+        return output_file
+
+    # Calculate the disparity map
+    disparity_map = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
+                                      matcher="stereo_sgbm", show_disparity=False, cache=cache)
+
+    # Normalize the disparity map to [0, 255]
+    disparity_map_normalized = cv2.normalize(disparity_map, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+    # Apply a colorful colormap to the disparity map
+    colormap = cv2.COLORMAP_JET
+    disparity_map_colored = cv2.applyColorMap(disparity_map_normalized, colormap)
+
+    # Construct the output file path
+    output_file = os.path.join(output_folder, image_file)
+
+    # Save the disparity map as an image
+    cv2.imwrite(output_file, disparity_map_colored)
+
+    return output_file
+
+
+def save_disparity_maps(left_image_folder, right_image_folder, output_folder, num_workers=1, chunksize=8,
+                        kitti_png=False, cache_path=None):
+    """
+    Compute and save a colored disparity map for every image pair in the input folders.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        output_folder (str): Path to the folder where the disparity maps are saved.
+        num_workers (int): Number of worker processes. 1 processes the images one at a time.
+        chunksize (int): Number of images sent to a worker at a time.
+        kitti_png (bool): Whether to save the disparities losslessly as KITTI 16-bit PNGs
+            (disparity * 256, 0 for invalid) instead of colored images.
+        cache_path (str): Optional folder of a DisparityResultCache shared by all runs and workers.
+
+    Returns:
+        list: (image_file, error) tuples for the images that failed.
+    """
+    # Get the list of image files in the left image folder
+    left_image_files = os.listdir(left_image_folder)
+
+    failures = run_folder_batch(_save_disparity_map_file, left_image_files,
+                                args=(left_image_folder, right_image_folder, output_folder, kitti_png, cache_path),
+                                message="Disparity map saved", num_workers=num_workers, chunksize=chunksize)
+    _print_result_cache_stats(cache_path, num_workers)
+    return failures
+
+
+_depth_stores = {}
+
+
+def _get_depth_store(store_path):
+    # Keep one writable store per process so that its memory maps are reused across frames
+    store = _depth_stores.get(store_path)
+    if store is None:
+        store = _depth_stores[store_path] = DepthStore.open(store_path, mode='r+')
+    return store
+
+
+def _save_depth_map_file(image_file, left_image_folder, right_image_folder, output_folder, baseline, focal_length,
+                         output_format="png", cache_path=None):
+    # Construct the paths for the left and right images
+    left_image_path = os.path.join(left_image_folder, image_file)
+    right_image_path = os.path.join(right_image_folder, image_file)
+
+    # Read the left and right images
+    left_image = cv2.imread(left_image_path)
+    right_image = cv2.imread(right_image_path)
+
+    # Calculate the raw disparity map
+    raw_disparity = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
+                                      matcher="stereo_sgbm", show_disparity=False, raw=True,
+                                      cache=get_result_cache(cache_path) if cache_path is not None else None)
+
+    # Calculate the depth map, keeping track of the pixels without a valid disparity
+    depth_map, valid_mask = calculate_depth_map_raw(raw_disparity, baseline, focal_length, num_disparities=90)
+
+    frame_id = os.path.splitext(image_file)[0]
+    if output_format == "store":
+        # Write the frame into its reserved space of the memory-mapped store
+        _get_depth_store(output_folder).put(frame_id, depth_map, valid_mask)
+        return f"{output_folder} [{frame_id}]"
+
+    # Save the depth map as a KITTI 16-bit PNG (depth * 256, 0 for invalid)
+    output_file = os.path.join(output_folder, frame_id + '.png')
+    write_kitti_png(output_file, depth_map, valid_mask)
+
+    return output_file
+
+
+def save_depth_maps(left_image_folder, right_image_folder, output_folder, baseline, focal_length, num_workers=1, chunksize=8,
+                    output_format="png", encoding="float16", cache_path=None):
+    """
+    Compute and save a depth map for every image pair in the input folders.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        output_folder (str): Path to the folder where the depth maps are saved.
+        baseline (float): Baseline between the cameras.
+        focal_length (float): Focal length of the camera.
+        num_workers (int): Number of worker processes. 1 processes the images one at a time.
+        chunksize (int): Number of images sent to a worker at a time.
+        output_format (str): "png" for KITTI 16-bit PNGs (depth * 256, 0 for invalid), or "store"
+            for a memory-mapped DepthStore in output_folder.
+        encoding (str): Encoding of the DepthStore: "float32", "float16" or "uint16".
+        cache_path (str): Optional folder of a DisparityResultCache shared by all runs and workers.
+
+    Returns:
+        list: (image_file, error) tuples for the images that failed.
+    """
+    # Get the list of image files in the left image folder
+    left_image_files = sorted(os.listdir(left_image_folder))
+
+    failures = []
+    if output_format == "store":
+        # Create the store and assign every frame its space before the workers write them
+        frame_shapes = {}
+        readable_files = []
+        for image_file in left_image_files:
+            try:
+                shape = read_image_shape(os.path.join(left_image_folder, image_file))
+            except OSError as error:
+                failures.append((image_file, f"{type(error).__name__}: {error}"))
+                print(f"Failed: {image_file} ({failures[-1][1]})")
+                continue
+            frame_shapes[os.path.splitext(image_file)[0]] = shape
+            readable_files.append(image_file)
+        left_image_files = readable_files
+        store = DepthStore.create(output_folder, encoding=encoding)
+        store.reserve(frame_shapes)
+    elif output_format != "png":
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    failures += run_folder_batch(_save_depth_map_file, left_image_files,
+                                 args=(left_image_folder, right_image_folder, output_folder, baseline, focal_length,
+                                       output_format, cache_path),
+                                 message="Depth map saved", num_workers=num_workers, chunksize=chunksize)
+
+    if output_format == "store":
+        # Flush the frames written in this process and drop the failed frames from the index
+        worker_store = _depth_stores.pop(output_folder, None)
+        if worker_store is not None:
+            worker_store.close()
+        for image_file, _ in failures:
+            store.index['frames'].pop(os.path.splitext(image_file)[0], None)
+        store.close()
+
+    _print_result_cache_stats(cache_path, num_workers)
+    return failures
+
+
+#--- Pseudo-LiDAR point clouds
+_ray_grids = collections.OrderedDict()
+_ray_grids_lock = threading.Lock()
+MAX_RAY_GRIDS = 8
+
+
+def get_ray_grid(shape, p_left, p_ro_rect=None, p_velo_to_cam=None, coordinates="camera"):
+    """
+    Return the per-pixel ray directions and offset that map a depth map to 3D points.
+
+    A pixel (u, v) with depth z is located at z * rays[v * width + u] + offset. The grid is
+    computed once per image shape and calibration and cached, so back-projecting a frame
+    costs a single multiply-add. The MAX_RAY_GRIDS most recently used grids are kept.
+
+    Args:
+        shape (tuple): (height, width) of the depth map.
+        p_left (numpy.ndarray): 3x4 projection matrix of the left camera.
+        p_ro_rect (numpy.ndarray): 3x3 rectification matrix. Required for velodyne coordinates.
+        p_velo_to_cam (numpy.ndarray): 3x4 velodyne to camera transform. Required for velodyne coordinates.
+        coordinates (str): "camera" for rectified reference camera coordinates or "velodyne".
+
+    Returns:
+        tuple: (rays, offset) as float32 arrays of shape (height * width, 3) and (3,).
+    """
+    p_left = np.asarray(p_left, np.float64)
+    matrices = [p_left] if coordinates == "camera" else [p_left, np.asarray(p_ro_rect, np.float64),
+                                                          np.asarray(p_velo_to_cam, np.float64)]
+    key = (tuple(shape[:2]), coordinates) + tuple(matrix.tobytes() for matrix in matrices)
+    with _ray_grids_lock:
+        if key in _ray_grids:
+            _ray_grids.move_to_end(key)
+            return _ray_grids[key]
+
+    height, width = shape[:2]
+    fx, fy = p_left[0, 0], p_left[1, 1]
+    cx, cy = p_left[0, 2], p_left[1, 2]
+
+    # Ray of every pixel in the left camera, and the left camera position in the reference camera
+    u, v = np.meshgrid(np.arange(width), np.arange(height))
+    rays = np.stack([(u.ravel() - cx) / fx, (v.ravel() - cy) / fy, np.ones(height * width)], axis=1)
+    offset = np.array([-p_left[0, 3] / fx, -p_left[1, 3] / fy, 0.0])
+
+    if coordinates == "velodyne":
+        cam_to_velo = rectified_camera_to_velodyne(p_ro_rect, p_velo_to_cam)
+        rays = rays @ cam_to_velo[:3, :3].T
+        offset = cam_to_velo[:3, :3] @ offset + cam_to_velo[:3, 3]
+    elif coordinates != "camera":
+        raise ValueError(f"Unknown coordinates: {coordinates}")
+
+    ray_grid = rays.astype(np.float32), offset.astype(np.float32)
+    with _ray_grids_lock:
+        _ray_grids[key] = ray_grid
+        while len(_ray_grids) > MAX_RAY_GRIDS:
+            _ray_grids.popitem(last=False)
+    return ray_grid
+
+
+def depth_to_point_cloud(depth_map, p_left, p_ro_rect=None, p_velo_to_cam=None, coordinates="camera",
+                         image=None, valid_mask=None, max_depth=80.0):
+    """
+    Back-project a depth map into a pseudo-LiDAR point cloud.
+
+    Args:
+        depth_map (numpy.ndarray): Depth map of the left camera in meters.
+        p_left (numpy.ndarray): 3x4 projection matrix of the left camera.
+        p_ro_rect (numpy.ndarray): 3x3 rectification matrix. Required for velodyne coordinates.
+        p_velo_to_cam (numpy.ndarray): 3x4 velodyne to camera transform. Required for velodyne coordinates.
+        coordinates (str): "camera" for rectified reference camera coordinates or "velodyne".
+        image (numpy.ndarray): Optional left image. If given, its grayscale value in [0, 1] is
+            appended as a fourth intensity column.
+        valid_mask (numpy.ndarray): Optional mask of the pixels with a valid depth.
+        max_depth (float): Points farther than this depth are dropped.
+
+    Returns:
+        numpy.ndarray: Nx3 (or Nx4 with intensity) float32 point cloud.
+    """
+    rays, offset = get_ray_grid(depth_map.shape, p_left, p_ro_rect, p_velo_to_cam, coordinates)
+
+    # Keep the pixels with a usable depth
+    depth = depth_map.reshape(-1)
+    keep = (depth > 0) & (depth < max_depth)
+    if valid_mask is not None:
+        keep &= valid_mask.reshape(-1)
+
+    # One multiply-add per point
+    points = rays[keep] * depth[keep, None] + offset
+
+    if image is not None:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        intensity = gray.reshape(-1)[keep].astype(np.float32) / 255
+        points = np.column_stack([points, intensity])
+
+    return points.astype(np.float32, copy=False)
+
+
+def save_velodyne_bin(points, output_file):
+    """
+    Save a point cloud in the KITTI velodyne .bin layout (float32 x, y, z, reflectance).
+
+    Args:
+        points (numpy.ndarray): Nx3 or Nx4 point cloud in velodyne coordinates.
+        output_file (str): Path of the .bin file.
+    """
+    if points.shape[1] == 3:
+        points = np.column_stack([points, np.zeros(len(points), np.float32)])
+    np.ascontiguousarray(points, dtype=np.float32).tofile(output_file)
+
+
+def load_velodyne_bin(input_file):
+    """
+    Load a point cloud saved in the KITTI velodyne .bin layout.
+
+    Returns:
+        numpy.ndarray: Nx4 float32 point cloud.
+    """
+    return np.fromfile(input_file, dtype=np.float32).reshape(-1, 4)
+
+
+def _save_point_cloud_file(image_file, left_image_folder, right_image_folder, output_folder, calibration_store_path,
+                           max_depth):
+    frame_id = os.path.splitext(image_file)[0]
+    calibration = get_calibration_store(calibration_store_path).get(frame_id)
+
+    # Read the left and right images
+    left_image = cv2.imread(os.path.join(left_image_folder, image_file))
+    right_image = cv2.imread(os.path.join(right_image_folder, image_file))
+
+    # Calculate the raw disparity map and the depth map
+    raw_disparity = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
+                                      matcher="stereo_sgbm", show_disparity=False, raw=True)
+    depth_map, valid_mask = calculate_depth_map_raw(raw_disparity, calibration.baseline, calibration.fx, 90)
+
+    # Back-project to the velodyne frame and save in the KITTI layout
+    points = depth_to_point_cloud(depth_map, calibration.p_left, calibration.p_ro_rect, calibration.p_velo_to_cam,
+                                  coordinates="velodyne", image=left_image, valid_mask=valid_mask, max_depth=max_depth)
+    output_file = os.path.join(output_folder, frame_id + '.bin')
+    save_velodyne_bin(points, output_file)
+
+    return output_file
+
+
+def save_point_clouds(left_image_folder, right_image_folder, output_folder, calibration_store, max_depth=80.0,
+                      num_workers=1, chunksize=8):
+    """
+    Compute and save a pseudo-LiDAR point cloud in the KITTI velodyne layout for every image pair.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        output_folder (str): Path to the folder where the .bin files are saved.
+        calibration_store (CalibrationStore): Calibration of every frame, as returned by CalibrationStore.open.
+            Workers load it once from its .npz file instead of receiving it with every chunk of images.
+        max_depth (float): Points farther than this depth are dropped.
+        num_workers (int): Number of worker processes. 1 processes the images one at a time.
+        chunksize (int): Number of images sent to a worker at a time.
+
+    Returns:
+        list: (image_file, error) tuples for the images that failed.
+    """
+    if calibration_store.store_path is None:
+        raise ValueError("The calibration store has no .npz file; open it with CalibrationStore.open")
+
+    # Get the list of image files in the left image folder
+    left_image_files = sorted(os.listdir(left_image_folder))
 
-    # Convert the images to grayscale
-    left_gray = cv2.cvtColor(left_img, cv2.COLOR_BGR2GRAY)
-    right_gray = cv2.cvtColor(right_img, cv2.COLOR_BGR2GRAY)
+    return run_folder_batch(_save_point_cloud_file, left_image_files,
+                            args=(left_image_folder, right_image_folder, output_folder, calibration_store.store_path,
+                                  max_depth),
+                            message="Point cloud saved", num_workers=num_workers, chunksize=chunksize)
 
-    # Compute the disparity map
-    disparity = matcher.compute(left_gray, right_gray).astype(np.float32) / 16
 
 
-    if show_disparity:
-        # Display the disparity map using matplotlib
-        plt.imshow(disparity, cmap="CMRmap_r") #CMRmap_r # cividis
-        plt.title('Disparity map with SGBM', fontsize=12)
-        plt.show()
 
-    return disparity
+#--- Voxel grid downsampling and spatial index for point clouds
+VOXEL_KEY_BITS = 21
+
 
-def display_text_file(index, folder_path):
+def voxel_coordinates(points, voxel_size, origin=None):
     """
-    Display the contents of a text file based on the specified index.
+    Compute the integer voxel coordinates of a point cloud.
 
     Args:
-        index (int): Index of the text file to display.
-        folder_path (str): Path to the folder containing the text files.
+        points (numpy.ndarray): Nx3 or Nx4 point cloud.
+        voxel_size (float): Edge length of a voxel in meters.
+        origin (numpy.ndarray): Corner of voxel (0, 0, 0). Defaults to the minimum of the points.
 
     Returns:
-        str: Contents of the text file.
+        tuple: (coordinates, origin) with coordinates an Nx3 int64 array.
     """
-    # Get the list of text files in the folder
-    txt_files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
+    xyz = points[:, :3]
+    if origin is None:
+        origin = xyz.min(axis=0) if len(xyz) else np.zeros(3, np.float32)
+    coordinates = np.floor((xyz - origin) / voxel_size).astype(np.int64)
+    return coordinates, np.asarray(origin, np.float32)
 
-    if index >= 0 and index < len(txt_files):
-        # Get the file path of the text file based on the index
-        file_path = os.path.join(folder_path, txt_files[index])
-
-        # Open the file and read its contents
-        with open(file_path, 'r') as file:
-            contents = file.read()
 
-        # Display the contents of the text file
-        print(f"Text file at index {index}:\n{contents}")
+def voxel_keys(coordinates):
+    """
+    Pack Nx3 integer voxel coordinates into one int64 key per voxel.
 
-        # Return the contents of the text file
-        return contents
-    else:
-        print("Invalid index.")
-        return None
+    Each axis uses VOXEL_KEY_BITS bits, which covers more than two million voxels per axis.
+    """
+    mask = (1 << VOXEL_KEY_BITS) - 1
+    return ((coordinates[:, 0] & mask) << (2 * VOXEL_KEY_BITS)) | ((coordinates[:, 1] & mask) << VOXEL_KEY_BITS) \
+        | (coordinates[:, 2] & mask)
 
 
-#--- Function to retrieve callibration parameters
-def get_calibration_parameters(file_contents):
+def voxel_downsample(points, voxel_size):
     """
-    Retrieve calibration parameters from the contents of a calibration file.
+    Downsample a point cloud to the centroid of the points in each occupied voxel.
 
     Args:
-        file_contents (str): Contents of the calibration file.
+        points (numpy.ndarray): Nx3 or Nx4 point cloud. The intensity column is averaged too.
+        voxel_size (float): Edge length of a voxel in meters.
 
     Returns:
-        tuple: Tuple containing the calibration parameters:
-            - p_left (numpy.ndarray): Projection matrix for the left camera.
-            - p_right (numpy.ndarray): Projection matrix for the right camera.
-            - p_ro_rect (numpy.ndarray): Rectification matrix.
-            - p_velo_to_cam (numpy.ndarray): Transformation matrix from velodyne to camera coordinates.
-            - p_imu_to_velo (numpy.ndarray): Transformation matrix from IMU to velodyne coordinates.
+        numpy.ndarray: Downsampled float32 point cloud with one point per occupied voxel.
     """
-    fin = file_contents.split('\n')
-    for line in fin:
-        if line[:2] == 'P2':
-            p_left = np.array(line[4:].strip().split(" ")).astype('float32').reshape(3, -1)
-        elif line[:2] == 'P3':
-            p_right = np.array(line[4:].strip().split(" ")).astype('float32').reshape(3, -1)
-        elif line[:7] == 'R0_rect':
-            p_ro_rect = np.array(line[9:].strip().split(" ")).astype('float32').reshape(3, -1)
-        elif line[:14] == 'Tr_velo_to_cam':
-            p_velo_to_cam = np.array(line[16:].strip().split(" ")).astype('float32').reshape(3, -1)
-        elif line[:14] == 'Tr_imu_to_velo':
-            p_imu_to_velo = np.array(line[16:].strip().split(" ")).astype('float32').reshape(3, -1)
-    return p_left, p_right, p_ro_rect, p_velo_to_cam, p_imu_to_velo
+    if len(points) == 0:
+        return points.astype(np.float32)
 
-def decompose_projection_matrix(projection_matrix):
+    coordinates, _ = voxel_coordinates(points, voxel_size)
+    _, inverse, counts = np.unique(voxel_keys(coordinates), return_inverse=True, return_counts=True)
+
+    # Average every column of the points falling into the same voxel, one bincount per column
+    inverse = inverse.ravel()
+    sums = np.column_stack([np.bincount(inverse, weights=points[:, column], minlength=len(counts))
+                            for column in range(points.shape[1])])
+    return (sums / counts[:, None]).astype(np.float32)
+
+
+def crop_point_cloud(points, min_range=0.0, max_range=None, horizontal_fov=None, coordinates="velodyne"):
     """
-    Decompose a projection matrix into camera matrix, rotation matrix, and translation vector.
+    Keep the points within a range interval and a horizontal field of view.
 
     Args:
-        projection_matrix (numpy.ndarray): 3x4 projection matrix.
+        points (numpy.ndarray): Nx3 or Nx4 point cloud.
+        min_range (float): Minimum Euclidean range in meters.
+        max_range (float): Maximum Euclidean range in meters. None disables the limit.
+        horizontal_fov (float): Full horizontal field of view in degrees centered on the forward axis.
+            None disables the limit.
+        coordinates (str): "velodyne" (x forward, y left) or "camera" (z forward, x right).
 
     Returns:
-        tuple: Tuple containing the decomposed components:
-            - camera_matrix (numpy.ndarray): Camera matrix. [ fx   0   cx ]
-                                                            [  0  fy   cy ]
-                                                            [  0   0    1 ]
-            - rotation_matrix (numpy.ndarray): Rotation matrix.
-            - translation_vector (numpy.ndarray): Translation vector.
+        numpy.ndarray: The cropped point cloud.
     """
+    xyz = points[:, :3]
+    squared_range = np.einsum('ij,ij->i', xyz, xyz)
+    keep = squared_range >= min_range ** 2
+    if max_range is not None:
+        keep &= squared_range <= max_range ** 2
 
-    # Decompose the projection matrix
-    camera_matrix, rotation_matrix, translation_vector, _, _, _, _ = cv2.decomposeProjectionMatrix(projection_matrix)
-    translation_vector = translation_vector/translation_vector[3]
-    # Return the decomposed components
-    return camera_matrix, rotation_matrix, translation_vector
+    if horizontal_fov is not None:
+        forward, lateral = (xyz[:, 0], xyz[:, 1]) if coordinates == "velodyne" else (xyz[:, 2], xyz[:, 0])
+        keep &= np.abs(np.arctan2(lateral, forward)) <= np.radians(horizontal_fov) / 2
 
+    return points[keep]
 
-def calculate_depth_map(disparity, baseline, focal_length, show_depth_map=True):
+
+def frustum_planes(bbox, p_left, near=0.5, far=80.0):
     """
-    Calculates the depth map from a given disparity map, baseline, and focal length.
+    Build the planes of the viewing frustum of a 2D bounding box in rectified camera coordinates.
 
     Args:
-        disparity (numpy.ndarray): Disparity map.
-        baseline (float): Baseline between the cameras.
-        focal_length (float): Focal length of the camera.
+        bbox (list): [x1, y1, x2, y2] bounding box in the left image.
+        p_left (numpy.ndarray): 3x4 projection matrix of the left camera.
+        near (float): Depth of the near plane.
+        far (float): Depth of the far plane.
 
     Returns:
-        numpy.ndarray: Depth map.
+        numpy.ndarray: 6x4 array of planes (a, b, c, d); a point p is inside when a*x + b*y + c*z + d >= 0
+            for every plane.
     """
+    p_left = np.asarray(p_left, np.float64)
+    fx, fy = p_left[0, 0], p_left[1, 1]
+    cx, cy = p_left[0, 2], p_left[1, 2]
+    center = np.array([-p_left[0, 3] / fx, -p_left[1, 3] / fy, 0.0])
+    x1, y1, x2, y2 = bbox
+
+    # Rays through the corners of the box, clockwise in the image
+    corners = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.float64)
+    rays = np.column_stack([(corners[:, 0] - cx) / fx, (corners[:, 1] - cy) / fy, np.ones(4)])
+
+    planes = []
+    for ray_a, ray_b in zip(rays, np.roll(rays, -1, axis=0)):
+        # Side plane through the camera center, with its normal pointing into the frustum
+        normal = np.cross(ray_a, ray_b)
+        planes.append(np.append(normal, -normal @ center))
+    planes.append([0.0, 0.0, 1.0, -near])
+    planes.append([0.0, 0.0, -1.0, far])
+    return np.array(planes)
+
+
+class VoxelGridIndex:
+    """
+    Spatial index of a point cloud bucketed into a regular voxel grid.
 
-    # Replace all instances of 0 and -1 disparity with a small minimum value (to avoid div by 0 or negatives)
-    disparity[disparity == 0] = 0.1
-    disparity[disparity == -1] = 0.1
+    Points are sorted by their packed voxel key, so the points of a voxel are a contiguous
+    slice. Queries select the candidate voxels first and only test the points inside them,
+    so their cost grows with the number of points returned rather than the cloud size.
 
-    # Initialize the depth map to match the size of the disparity map
-    depth_map = np.ones(disparity.shape, np.single)
+    Args:
+        points (numpy.ndarray): Nx3 or Nx4 point cloud.
+        voxel_size (float): Edge length of a voxel in meters.
+    """
 
-    # Calculate the depths
-    depth_map[:] = focal_length * baseline / disparity[:]
+    def __init__(self, points, voxel_size=0.5):
+        self.points = points
+        self.voxel_size = voxel_size
+        coordinates, self.origin = voxel_coordinates(points, voxel_size)
+
+        # Sort the points by voxel and record where each occupied voxel starts
+        keys = voxel_keys(coordinates)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.voxel_coordinates = coordinates[self.order][self.starts]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _gather(self, voxels):
+        # Indices of the points of the selected voxels, in the original point order
+        if len(voxels) == 0:
+            return np.empty(0, np.int64)
+        starts = self.starts[voxels]
+        counts = self.counts[voxels]
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self.order[offsets]
+
+    def _voxels_in_range(self, low, high):
+        # Occupied voxels whose integer coordinates lie in [low, high]
+        span = high - low + 1
+        if np.any(span <= 0):
+            return np.empty(0, np.int64)
+        if np.prod(span) < len(self.keys):
+            # Enumerate the voxels of the range and look them up
+            grid = np.stack(np.meshgrid(*[np.arange(l, h + 1) for l, h in zip(low, high)], indexing='ij'), -1)
+            candidates = voxel_keys(grid.reshape(-1, 3))
+            found = np.searchsorted(self.keys, candidates)
+            found = found[found < len(self.keys)]
+            return np.unique(found[np.isin(self.keys[found], candidates)])
+        inside = np.all((self.voxel_coordinates >= low) & (self.voxel_coordinates <= high), axis=1)
+        return np.flatnonzero(inside)
+
+    def query_box(self, min_corner, max_corner):
+        """
+        Return the indices of the points inside an axis-aligned 3D box.
+
+        Args:
+            min_corner (numpy.ndarray): (x, y, z) minimum corner of the box.
+            max_corner (numpy.ndarray): (x, y, z) maximum corner of the box.
+
+        Returns:
+            numpy.ndarray: Indices into the indexed points.
+        """
+        min_corner = np.asarray(min_corner, np.float32)
+        max_corner = np.asarray(max_corner, np.float32)
+        low = np.maximum(np.floor((min_corner - self.origin) / self.voxel_size).astype(np.int64), 0)
+        high = np.floor((max_corner - self.origin) / self.voxel_size).astype(np.int64)
+        high = np.minimum(high, (1 << VOXEL_KEY_BITS) - 1)
+
+        # Test the points of the candidate voxels exactly
+        indices = self._gather(self._voxels_in_range(low, high))
+        xyz = self.points[indices, :3]
+        inside = np.all((xyz >= min_corner) & (xyz <= max_corner), axis=1)
+        return indices[inside]
+
+    def query_frustum(self, planes):
+        """
+        Return the indices of the points inside a convex region bounded by planes, e.g. a frustum.
+
+        Args:
+            planes (numpy.ndarray): Mx4 planes (a, b, c, d) as returned by frustum_planes().
+
+        Returns:
+            numpy.ndarray: Indices into the indexed points.
+        """
+        planes = np.asarray(planes, np.float64)
+        normals, offsets = planes[:, :3], planes[:, 3]
+
+        # A voxel can intersect the region only if its corner farthest along each normal is inside
+        voxel_min = self.origin + self.voxel_coordinates * self.voxel_size
+        farthest = voxel_min[:, None, :] + (normals[None, :, :] > 0) * self.voxel_size
+        reachable = np.all(np.einsum('vpk,pk->vp', farthest, normals) + offsets >= 0, axis=1)
+
+        # Test the points of the candidate voxels exactly
+        indices = self._gather(np.flatnonzero(reachable))
+        xyz = self.points[indices, :3].astype(np.float64)
+        inside = np.all(xyz @ normals.T + offsets >= 0, axis=1)
+        return indices[inside]
+
+
+def get_class_ids(names, object_class):
+    """
+    Convert a list of class names into the matching detector class IDs.
 
-    if show_depth_map:
-        # Display the disparity map using matplotlib
-        plt.imshow(depth_map, cmap="cividis") #CMRmap_r # cividis
-        plt.title('Depth map', fontsize=12)
-        plt.show()
+    Args:
+        names (dict): Mapping from class ID to class name, as given by model.names.
+        object_class (list): Object classes of interest.
 
-    return depth_map
+    Returns:
+        numpy.ndarray: Class IDs of the requested classes.
+    """
+    return np.array([class_id for class_id, name in names.items() if name in object_class], dtype=np.float32)
 
 
+def filter_boxes(boxes, class_ids, score_threshold=0.5):
+    """
+    Keep the detections of the requested classes whose score is above a threshold.
 
+    Args:
+        boxes (numpy.ndarray): Nx6 array of detections [x1, y1, x2, y2, score, class_id].
+        class_ids (numpy.ndarray): Class IDs to keep.
+        score_threshold (float): Minimum detection score (exclusive).
 
-def save_disparity_maps(left_image_folder, right_image_folder, output_folder):
-    # Get the list of image files in the left image folder
-    left_image_files = os.listdir(left_image_folder)
+    Returns:
+        numpy.ndarray: Mx6 float32 array of the kept detections.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+    keep = np.isin(boxes[:, 5], class_ids) & (boxes[:, 4] > score_threshold)
+    return boxes[keep]
 
-    # Iterate over the image files
-    for image_file in left_image_files:
-        # Construct the paths for the left and right images
-        left_image_path = os.path.join(left_image_folder, image_file)
-        right_image_path = os.path.join(right_image_folder, image_file)
 
-        # Read the left and right images
-        left_image = cv2.imread(left_image_path)
-        right_image = cv2.imread(right_image_path)
+def _result_boxes(result):
+    # Move the detections of one result to the CPU as an Nx6 array
+    data = result.boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    return np.asarray(data, dtype=np.float32)
 
-        # Calculate the disparity map
-        disparity_map = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
-                                          matcher="stereo_sgbm", show_disparity=False)
 
-        # Normalize the disparity map to [0, 255]
-        disparity_map_normalized = cv2.normalize(disparity_map, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+def get_bounding_box_center_frame(frame, model, names, object_class, show_output=True):
 
-        # Apply a colorful colormap to the disparity map
-        colormap = cv2.COLORMAP_JET
-        disparity_map_colored = cv2.applyColorMap(disparity_map_normalized, colormap)
+    frame_copy = frame.copy()
 
-        # Construct the output file path
-        output_file = os.path.join(output_folder, image_file)
+    # Perform object detection on the input frame using the specified model
+    results = model(frame)
 
-        # Save the disparity map as an image
-        cv2.imwrite(output_file, disparity_map_colored)
+    # Keep the boxes of the specified object classes with a detection score above a threshold
+    class_ids = get_class_ids(names, object_class)
+    boxes = [filter_boxes(_result_boxes(result), class_ids) for result in results]
+    boxes = np.concatenate(boxes) if boxes else np.empty((0, 6), np.float32)
+    bbox_coordinates = boxes[:, :4].astype(int).tolist()
 
-        print(f"Disparity map saved: {output_file}")
+    for x1, y1, x2, y2 in bbox_coordinates:
+        # Draw bounding box on the frame
+        cv2.rectangle(frame_copy, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
 
+    if show_output:
+        # Convert frame from BGR to RGB
+        frame_rgb = cv2.cvtColor(frame_copy, cv2.COLOR_BGR2RGB)
+        # Show the output frame with bounding boxes
+        cv2.imshow("Output", frame_rgb)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
 
-def save_depth_maps(left_image_folder, right_image_folder, output_folder, baseline, focal_length):
-    # Get the list of image files in the left image folder
-    left_image_files = os.listdir(left_image_folder)
 
-    # Iterate over the image files
-    for image_file in left_image_files:
-        # Construct the paths for the left and right images
-        left_image_path = os.path.join(left_image_folder, image_file)
-        right_image_path = os.path.join(right_image_folder, image_file)
+    # Return the list of center coordinates
+    return bbox_coordinates
 
-        # Read the left and right images
-        left_image = cv2.imread(left_image_path)
-        right_image = cv2.imread(right_image_path)
 
-        # Calculate the disparity map
-        disparity_map = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
-                                          matcher="stereo_sgbm", show_disparity=False)
+def get_bounding_boxes_batch(frames, model, names, object_class, score_threshold=0.5, batch_size=16):
+    """
+    Detect objects on a list of frames with one detector call per batch.
 
-        # Calculate the depth map
-        depth_map = calculate_depth_map(disparity_map, baseline, focal_length, show_depth_map=False)
+    Args:
+        frames (list): Frames to run the detector on.
+        model: YOLO model used for detection.
+        names (dict): Mapping from class ID to class name, as given by model.names.
+        object_class (list): Object classes of interest.
+        score_threshold (float): Minimum detection score (exclusive).
+        batch_size (int): Number of frames passed to the detector at a time.
 
-        # # Normalize the depth map to [0, 255]
-        # depth_map_normalized = cv2.normalize(depth_map, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
-        #
-        # # Apply a colorful colormap to the depth map
-        # colormap = cv2.COLORMAP_BONE
-        # depth_map_colored = cv2.applyColorMap(depth_map_normalized, colormap)
+    Returns:
+        list: One Nx6 float32 array [x1, y1, x2, y2, score, class_id] per frame.
+    """
+    class_ids = get_class_ids(names, object_class)
+    boxes = []
 
-        # Construct the output file path
-        output_file = os.path.join(output_folder, image_file)
+    for start in range(0, len(frames), batch_size):
+        # Run the detector once on the whole batch
+        results = model(list(frames[start:start + batch_size]), verbose=False)
 
-        # Save the depth map as an image
-        cv2.imwrite(output_file, depth_map)
+        # Filter the boxes of each frame with array operations
+        boxes.extend(filter_boxes(_result_boxes(result), class_ids, score_threshold) for result in results)
 
-        print(f"Depth map saved: {output_file}")
+    return boxes
 
 
+def box_iou(boxes_a, boxes_b):
+    """
+    Compute the intersection over union of every pair of boxes.
 
+    Args:
+        boxes_a (numpy.ndarray): Nx4 [x1, y1, x2, y2] boxes.
+        boxes_b (numpy.ndarray): Mx4 [x1, y1, x2, y2] boxes.
 
-def get_bounding_box_center_frame(frame, model, names, object_class, show_output=True):
+    Returns:
+        numpy.ndarray: NxM IoU matrix.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
 
-    bbox_coordinates = []
-    frame_copy = frame.copy()
+    # Intersection rectangles by broadcasting the two sets against each other
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
 
-    # Perform object detection on the input frame using the specified model
-    results = model(frame)
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
 
-    # Iterate over the results of object detection
-    for result in results:
 
-        # Iterate over each bounding box detected in the result
-        for r in result.boxes.data.tolist():
-            # Extract the coordinates, score, and class ID from the bounding box
-            x1, y1, x2, y2, score, class_id = r
-            x1 = int(x1)
-            x2 = int(x2)
-            y1 = int(y1)
-            y2 = int(y2)
+#--- Detector scheduling with optical-flow box propagation
+class DetectorScheduler:
+    """
+    Run the detector on keyframes only and propagate the boxes with sparse optical flow in between.
 
-            # Get the class name based on the class ID
-            class_name = names.get(class_id)
+    The detector runs every interval frames, or earlier when a box can no longer be tracked or the
+    frame size changes. On the other frames a grid of points inside each box is tracked with
+    pyramidal Lucas-Kanade, checked with a forward-backward pass, and the box is moved by the
+    median displacement and scaled by the median change of the point spread. Detections are matched to the existing tracks by IoU, so each
+    object keeps a stable track ID that is used to smooth its distance over time.
 
+    Args:
+        model: YOLO model used for detection.
+        names (dict): Mapping from class ID to class name, as given by model.names.
+        object_class (list): Object classes of interest.
+        interval (int): Number of frames between two detector runs.
+        score_threshold (float): Minimum detection score (exclusive).
+        grid_size (int): Tracked points per box side, grid_size**2 points per box.
+        max_flow_error (float): Maximum forward-backward error in pixels of a tracked point.
+        min_tracked_fraction (float): Fraction of points of a box that must be tracked to keep it.
+        match_iou (float): Minimum IoU between a detection and a propagated box to keep the track ID.
+        distance_smoothing (float): Weight of the new distance in the exponential moving average.
+    """
 
-            # Check if the class name matches the specified object_class and the detection score is above a threshold
-            if class_name in object_class  and score > 0.5:
-                bbox_coordinates.append([x1, y1, x2, y2])
+    def __init__(self, model, names, object_class=['car', 'bicycle'], interval=5, score_threshold=0.5, grid_size=4,
+                 max_flow_error=1.0, min_tracked_fraction=0.5, match_iou=0.3, distance_smoothing=0.5):
+        self.model = model
+        self.class_ids = get_class_ids(names, object_class)
+        self.interval = interval
+        self.score_threshold = score_threshold
+        self.grid_size = grid_size
+        self.max_flow_error = max_flow_error
+        self.min_tracked_fraction = min_tracked_fraction
+        self.match_iou = match_iou
+        self.distance_smoothing = distance_smoothing
+        self.lk_params = dict(winSize=(15, 15), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all tracks, e.g. at the start of a new sequence.
+        """
+        self.boxes = np.empty((0, 4), np.float32)
+        self.track_ids = np.empty(0, np.int64)
+        self.distances = {}
+        self.next_track_id = 0
+        self.previous_gray = None
+        self.frames_since_detection = 0
+        self.frame_count = 0
+        self.detector_calls = 0
+        self.start_time = None
+
+    def _grid_points(self, boxes):
+        # Regular grid over the inner 80% of every box
+        steps = (np.arange(self.grid_size, dtype=np.float32) + 0.5) / self.grid_size * 0.8 + 0.1
+        fx, fy = np.meshgrid(steps, steps)
+        fx, fy = fx.ravel(), fy.ravel()
+        x = boxes[:, 0:1] + fx * (boxes[:, 2:3] - boxes[:, 0:1])
+        y = boxes[:, 1:2] + fy * (boxes[:, 3:4] - boxes[:, 1:2])
+        return np.stack([x, y], axis=-1).astype(np.float32)
+
+    def _propagate(self, gray):
+        """
+        Move the boxes from the previous frame to the current one.
+
+        Returns:
+            numpy.ndarray: Boolean mask of the boxes that were tracked reliably.
+        """
+        num_boxes = len(self.boxes)
+        if num_boxes == 0:
+            return np.ones(0, bool)
+
+        # Forward and backward sparse optical flow on the grid points of all boxes at once
+        points = self._grid_points(self.boxes)
+        start = points.reshape(-1, 1, 2)
+        forward, status_forward, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, start, None, **self.lk_params)
+        backward, status_backward, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous_gray, forward, None,
+                                                                **self.lk_params)
+        error = np.linalg.norm((backward - start).reshape(num_boxes, -1, 2), axis=2)
+        good = ((status_forward & status_backward).reshape(num_boxes, -1) == 1) & (error < self.max_flow_error)
+        tracked = good.mean(axis=1) >= self.min_tracked_fraction
+
+        moved = forward.reshape(num_boxes, -1, 2)
+        for index in np.flatnonzero(tracked):
+            old, new = points[index][good[index]], moved[index][good[index]]
+
+            # Median translation and median change of the distances to the centroid
+            shift = np.median(new - old, axis=0)
+            old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = old_spread > 1e-3
+            scale = np.median(new_spread[valid] / old_spread[valid]) if valid.any() else 1.0
+
+            center = (self.boxes[index, :2] + self.boxes[index, 2:]) / 2 + shift
+            half_size = (self.boxes[index, 2:] - self.boxes[index, :2]) / 2 * scale
+            self.boxes[index] = np.concatenate([center - half_size, center + half_size])
+
+        return tracked
+
+    def _detect(self, frame):
+        # Run the detector and match its boxes to the propagated tracks
+        results = self.model(frame)
+        detections = [filter_boxes(_result_boxes(result), self.class_ids, self.score_threshold) for result in results]
+        detections = np.concatenate(detections)[:, :4] if detections else np.empty((0, 4), np.float32)
+        self.detector_calls += 1
+        self.frames_since_detection = 0
+        _metrics.increment('detector_calls')
+
+        track_ids = np.full(len(detections), -1, np.int64)
+        if len(detections) and len(self.boxes):
+            # Greedy assignment in decreasing IoU order
+            iou = box_iou(detections, self.boxes)
+            for flat_index in np.argsort(iou, axis=None)[::-1]:
+                detection, track = np.unravel_index(flat_index, iou.shape)
+                if iou[detection, track] < self.match_iou:
+                    break
+                if track_ids[detection] == -1 and self.track_ids[track] not in track_ids:
+                    track_ids[detection] = self.track_ids[track]
+
+        # New IDs for the unmatched detections
+        new_tracks = track_ids == -1
+        track_ids[new_tracks] = np.arange(self.next_track_id, self.next_track_id + new_tracks.sum())
+        self.next_track_id += int(new_tracks.sum())
+
+        self.boxes = detections.astype(np.float32)
+        self.track_ids = track_ids
+
+    def update(self, frame):
+        """
+        Get the boxes of the next frame, from the detector or by propagating the previous ones.
+
+        Args:
+            frame (numpy.ndarray): Left image of the next frame.
+
+        Returns:
+            tuple: ([x1, y1, x2, y2] box list, numpy.ndarray of track IDs).
+        """
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # Boxes cannot be propagated into a frame of another size, so it gets a fresh detection
+        detect = (self.previous_gray is None or self.previous_gray.shape != gray.shape
+                  or self.frames_since_detection + 1 >= self.interval)
+        if not detect:
+            tracked = self._propagate(gray)
+            self.frames_since_detection += 1
+
+            # Fall back to the detector as soon as a box is lost
+            detect = not tracked.all()
+        if detect:
+            self._detect(frame)
+
+        # Clip the boxes to the frame and forget the distances of dropped tracks
+        height, width = gray.shape
+        np.clip(self.boxes, 0, [width - 1, height - 1, width - 1, height - 1], out=self.boxes)
+        self.distances = {track_id: self.distances[track_id] for track_id in self.track_ids.tolist()
+                          if track_id in self.distances}
+
+        self.previous_gray = gray
+        self.frame_count += 1
+        return self.boxes.astype(int).tolist(), self.track_ids.copy()
+
+    def smooth_distances(self, track_ids, distances):
+        """
+        Smooth the distances of each track with an exponential moving average.
+
+        Args:
+            track_ids (numpy.ndarray): Track ID of each box.
+            distances (numpy.ndarray): Distance of each box in the current frame.
+
+        Returns:
+            numpy.ndarray: Smoothed float32 distances.
+        """
+        smoothed = np.asarray(distances, dtype=np.float32).copy()
+        for index, (track_id, distance) in enumerate(zip(np.asarray(track_ids).tolist(), smoothed.tolist())):
+            previous = self.distances.get(track_id)
+            if previous is not None and np.isfinite(distance):
+                smoothed[index] = previous + self.distance_smoothing * (distance - previous)
+            if np.isfinite(smoothed[index]):
+                self.distances[track_id] = float(smoothed[index])
+        return smoothed
+
+    def stats(self):
+        """
+        Get the detector invocation statistics.
+
+        Returns:
+            dict: Frames processed, detector calls, and detector calls and frames per second.
+        """
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        return {
+            'frames': self.frame_count,
+            'detector_calls': self.detector_calls,
+            'detector_calls_per_frame': self.detector_calls / max(self.frame_count, 1),
+            'detector_calls_per_second': self.detector_calls / elapsed if elapsed > 0 else 0.0,
+            'frames_per_second': self.frame_count / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+#--- Per-box depth statistics from summed-area tables
+BOX_STATS_DTYPE = np.dtype([
+    ('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+    ('center_depth', np.float32), ('mean_depth', np.float32), ('valid_fraction', np.float32),
+    ('median_depth', np.float32), ('p10_depth', np.float32), ('p90_depth', np.float32),
+])
+
+
+class BoxDepthStatistics:
+    """
+    Per-frame precomputation that answers depth statistics of any box in constant time.
 
-                # Draw bounding box on the frame
-                cv2.rectangle(frame_copy, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    Integral images of the valid-depth mask and of the valid depths give the exact valid
+    fraction and mean depth of a box with four lookups. Percentiles come from integral
+    histograms: the depth range is split into num_bins bins and the per-bin counts are
+    accumulated on a grid of cell_size x cell_size cells. A percentile query snaps the box
+    outwards to that grid and interpolates inside the bin, so the median is approximate to
+    about one cell of extent and one bin of depth.
 
+    Args:
+        depth_map (numpy.ndarray): Depth map in meters.
+        valid_mask (numpy.ndarray): Mask of the valid pixels. Defaults to depths in (0, max_depth).
+        max_depth (float): Upper end of the histogram range; farther depths count as invalid.
+        num_bins (int): Number of histogram bins.
+        cell_size (int): Cell size in pixels of the histogram grid.
+    """
 
-    if show_output:
-        # Convert frame from BGR to RGB
-        frame_rgb = cv2.cvtColor(frame_copy, cv2.COLOR_BGR2RGB)
-        # Show the output frame with bounding boxes
-        cv2.imshow("Output", frame_rgb)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+    def __init__(self, depth_map, valid_mask=None, max_depth=80.0, num_bins=64, cell_size=4):
+        self.depth_map = depth_map
+        self.max_depth = max_depth
+        self.num_bins = num_bins
+        self.cell_size = cell_size
+        height, width = depth_map.shape
+
+        if valid_mask is None:
+            valid_mask = (depth_map > 0) & (depth_map < max_depth)
+        else:
+            valid_mask = valid_mask & (depth_map < max_depth)
+
+        # Summed-area tables of the valid mask and the valid depths
+        self.valid_integral = cv2.integral(valid_mask.astype(np.uint8))
+        self.depth_integral = cv2.integral(np.where(valid_mask, depth_map, 0).astype(np.float64))
+
+        # Histogram of every cell, with invalid pixels counted in an extra bin that is dropped
+        bins = np.minimum((depth_map * (num_bins / max_depth)).astype(np.int64), num_bins - 1)
+        bins[~valid_mask] = num_bins
+        cell_rows = -(-height // cell_size)
+        cell_cols = -(-width // cell_size)
+        rows = np.arange(height)[:, None] // cell_size
+        cols = np.arange(width)[None, :] // cell_size
+        flat = ((rows * cell_cols + cols) * (num_bins + 1) + bins).ravel()
+        histogram = np.bincount(flat, minlength=cell_rows * cell_cols * (num_bins + 1))
+        histogram = histogram.reshape(cell_rows, cell_cols, num_bins + 1)[:, :, :num_bins]
+
+        # Integral histogram over the cell grid
+        self.histogram_integral = np.zeros((cell_rows + 1, cell_cols + 1, num_bins), np.int32)
+        self.histogram_integral[1:, 1:] = histogram.cumsum(axis=0).cumsum(axis=1)
+
+    @staticmethod
+    def _box_sum(integral, x1, y1, x2, y2):
+        return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+    def query(self, bbox_coordinates, percentiles=(10, 50, 90)):
+        """
+        Compute depth statistics for a list of boxes.
+
+        Args:
+            bbox_coordinates (list): [x1, y1, x2, y2] boxes in pixels.
+            percentiles (tuple): Percentiles stored in p10_depth, median_depth and p90_depth.
+
+        Returns:
+            numpy.ndarray: Structured array of BOX_STATS_DTYPE, one record per box. Depths are NaN
+                for boxes without valid pixels.
+        """
+        boxes = np.asarray(bbox_coordinates, np.int64).reshape(-1, 4)
+        stats = np.zeros(len(boxes), BOX_STATS_DTYPE)
+        if len(boxes) == 0:
+            return stats
+        height, width = self.depth_map.shape
+
+        # Clip the boxes to the image, keeping at least one pixel
+        x1 = np.clip(boxes[:, 0], 0, width - 1)
+        y1 = np.clip(boxes[:, 1], 0, height - 1)
+        x2 = np.clip(boxes[:, 2], x1 + 1, width)
+        y2 = np.clip(boxes[:, 3], y1 + 1, height)
+        stats['x1'], stats['y1'], stats['x2'], stats['y2'] = boxes.T
+
+        # Depth at the center of the box, as used for the displayed distance
+        center_x = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, width - 1)
+        center_y = np.clip((boxes[:, 1] + boxes[:, 3]) // 2, 0, height - 1)
+        stats['center_depth'] = self.depth_map[center_y, center_x]
+
+        # Exact valid fraction and mean from the summed-area tables
+        valid_count = self._box_sum(self.valid_integral, x1, y1, x2, y2)
+        depth_sum = self._box_sum(self.depth_integral, x1, y1, x2, y2)
+        stats['valid_fraction'] = valid_count / ((x2 - x1) * (y2 - y1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats['mean_depth'] = np.where(valid_count > 0, depth_sum / valid_count, np.nan)
+
+        # Approximate percentiles from the integral histogram of the enclosing cells
+        cell_x1, cell_y1 = x1 // self.cell_size, y1 // self.cell_size
+        cell_x2, cell_y2 = -(-x2 // self.cell_size), -(-y2 // self.cell_size)
+        counts = self._box_sum(self.histogram_integral, cell_x1, cell_y1, cell_x2, cell_y2)
+        cumulative = counts.cumsum(axis=1)
+        total = cumulative[:, -1]
+        bin_width = self.max_depth / self.num_bins
+        for field, percentile in zip(('p10_depth', 'median_depth', 'p90_depth'), percentiles):
+            target = total * (percentile / 100)
+            bins = np.minimum((cumulative < target[:, None]).sum(axis=1), self.num_bins - 1)
+            rows = np.arange(len(boxes))
+            below = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                fraction = np.clip((target - below) / counts[rows, bins], 0, 1)
+                stats[field] = np.where(total > 0, (bins + fraction) * bin_width, np.nan)
+
+        return stats
+
+
+#--- Single-pass overlay renderer
+class DistanceRenderer:
+    """
+    Renderer for calculate_distance that draws each annotation once and reuses its buffers.
 
+    The boxes and distance labels are drawn a single time into an annotation layer and copied
+    onto every canvas (frame, colored disparity map and colored depth map). The maps are colored
+    with a fixed value range instead of a per-frame min/max normalization, so
+    colors are comparable between frames. Output images are preallocated and overwritten on
+    every call: copy them if they must outlive the next frame.
 
-    # Return the list of center coordinates
-    return bbox_coordinates
+    Args:
+        disparity_range (tuple): (min, max) disparity mapped to the ends of the disparity colormap.
+        depth_range (tuple): (min, max) depth mapped to the ends of the depth colormap.
+        disparity_colormap (int): OpenCV colormap of the disparity map.
+        depth_colormap (int): OpenCV colormap of the depth map.
+    """
+
+    def __init__(self, disparity_range=(0, 90), depth_range=(0, 80), disparity_colormap=cv2.COLORMAP_JET,
+                 depth_colormap=cv2.COLORMAP_BONE):
+        self.disparity_range = disparity_range
+        self.depth_range = depth_range
+        self.disparity_colormap = disparity_colormap
+        self.depth_colormap = depth_colormap
+        self._shape = None
+
+    def _allocate(self, shape):
+        height, width = shape[:2]
+        self._shape = shape[:2]
+        self._clipped = np.empty((height, width), np.float32)
+        self._levels = np.empty((height, width), np.uint8)
+        self.frame = np.empty((height, width, 3), np.uint8)
+        self.disparity = np.empty((height, width, 3), np.uint8)
+        self.depth = np.empty((height, width, 3), np.uint8)
+        self.layer = np.zeros((height, width, 3), np.uint8)
+        self.mask = np.zeros((height, width), np.uint8)
+
+    def colorize(self, values, value_range, colormap, out):
+        """
+        Color a map with a fixed value range into a preallocated BGR image.
+        """
+        low, high = value_range
+        scale = 255.0 / (high - low)
+
+        # Map the range to [0, 255] with saturation, then look the colors up
+        np.maximum(values, low, out=self._clipped)
+        cv2.convertScaleAbs(self._clipped, dst=self._levels, alpha=scale, beta=-low * scale)
+        cv2.applyColorMap(self._levels, colormap, dst=out)
+        return out
+
+    def _draw_layer(self, boxes, distances):
+        # Clear what the previous frame drew
+        self.layer.fill(0)
+        self.mask.fill(0)
+
+        for (x1, y1, x2, y2), distance in zip(boxes.tolist(), distances.tolist()):
+            distance_str = f"{distance:.2f} m"
+            center_x = (x1 + x2) // 2
+
+            # Calculate the text size and the label rectangle above the box
+            text_size, _ = cv2.getTextSize(distance_str, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+            text_x = center_x - text_size[0] // 2
+            text_y = y1 - 10
+            rect_x1, rect_y1 = text_x - 5, text_y - text_size[1] - 5
+            rect_x2, rect_y2 = text_x + text_size[0] + 5, text_y + 5
+
+            # Draw the box, the white label background and the text into the layer and the mask
+            for image, box_color, fill_color in ((self.layer, (0, 255, 0), (255, 255, 255)), (self.mask, 255, 255)):
+                cv2.rectangle(image, (x1, y1), (x2, y2), box_color, 2)
+                cv2.rectangle(image, (rect_x1, rect_y1), (rect_x2, rect_y2), fill_color, cv2.FILLED)
+            cv2.putText(self.layer, distance_str, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2,
+                        cv2.LINE_AA)
+
+    def render(self, boxes, distances, frame, disparity_map, depth_map, canvases=("disparity", "frame", "depth")):
+        """
+        Render the annotated frame, disparity map and depth map.
+
+        Args:
+            boxes (numpy.ndarray): Nx4 [x1, y1, x2, y2] boxes.
+            distances (numpy.ndarray): N distances in meters.
+            frame (numpy.ndarray): Left image.
+            disparity_map (numpy.ndarray): Disparity map in pixels.
+            depth_map (numpy.ndarray): Depth map in meters.
+            canvases (tuple): Canvases to render; the others are returned as None.
+
+        Returns:
+            tuple: (disparity_map_colored, frame, depth_map_colored) preallocated buffers.
+        """
+        if self._shape != frame.shape[:2]:
+            self._allocate(frame.shape)
+        self._draw_layer(np.asarray(boxes).reshape(-1, 4), np.asarray(distances).reshape(-1))
+
+        outputs = {}
+        if "disparity" in canvases:
+            outputs["disparity"] = self.colorize(disparity_map, self.disparity_range, self.disparity_colormap,
+                                                 self.disparity)
+        if "frame" in canvases:
+            np.copyto(self.frame, frame)
+            outputs["frame"] = self.frame
+        if "depth" in canvases:
+            outputs["depth"] = self.colorize(depth_map, self.depth_range, self.depth_colormap, self.depth)
+
+        # Copy the annotation layer onto every canvas where something was drawn
+        for canvas in outputs.values():
+            cv2.copyTo(self.layer, self.mask, dst=canvas)
+
+        return outputs.get("disparity"), outputs.get("frame"), outputs.get("depth")
+
+
+def calculate_distance(bbox_coordinates, frame, depth_map, disparity_map, show_output=True, box_statistics=False,
+                       distance_field="center_depth", render=True, renderer=None, track_ids=None, scheduler=None,
+                       valid_mask=None):
+    """
+    Draw the bounding boxes and their distances on the frame, disparity map and depth map.
+
+    Args:
+        bbox_coordinates (list): [x1, y1, x2, y2] boxes in pixels.
+        frame (numpy.ndarray): Left image.
+        depth_map (numpy.ndarray): Depth map in meters.
+        disparity_map (numpy.ndarray): Disparity map in pixels.
+        show_output (bool): Whether to display the rendered images.
+        box_statistics (bool): Whether to also return per-box depth statistics.
+        distance_field (str): Field of BOX_STATS_DTYPE displayed as the distance, e.g. "median_depth".
+            "center_depth" reads the pixel at the center of the box.
+        render (bool): Whether to render images. If False, only the numeric results are returned.
+        renderer (DistanceRenderer): Optional renderer that draws the annotations once and reuses
+            its buffers across frames instead of normalizing and drawing each image separately.
+        track_ids (numpy.ndarray): Track ID of each box, as returned by DetectorScheduler.update().
+        scheduler (DetectorScheduler): Scheduler whose per-track history smooths the distances.
+        valid_mask (numpy.ndarray): Mask of the pixels with a valid depth, e.g. from calculate_depth_map_raw().
+            Defaults to the positive depths.
 
+    Returns:
+        tuple: (disparity_map_colored, frame_copy, depth_map_colored), or (boxes, distances) with
+            an Nx4 int32 array and N float32 distances if render is False. The structured array of
+            BoxDepthStatistics.query() is appended if box_statistics is set.
+    """
+    # Depth statistics of every box from one precomputation over the frame
+    stats = None
+    if box_statistics or distance_field != "center_depth":
+        stats = BoxDepthStatistics(depth_map, valid_mask).query(bbox_coordinates)
+
+    smoothed = None
+    if not render or renderer is not None or scheduler is not None:
+        boxes = np.asarray(bbox_coordinates, np.int32).reshape(-1, 4)
+        if stats is None:
+            # Depth at the center of every box
+            distances = depth_map[(boxes[:, 1] + boxes[:, 3]) // 2, (boxes[:, 0] + boxes[:, 2]) // 2]
+        else:
+            distances = stats[distance_field]
+        distances = distances.astype(np.float32)
+
+        if scheduler is not None and track_ids is not None:
+            # Smooth the distances over time along each track
+            distances = smoothed = scheduler.smooth_distances(track_ids, distances)
+
+    if not render or renderer is not None:
+        if not render:
+            # Numeric results only, without touching any image
+            return (boxes, distances, stats) if box_statistics else (boxes, distances)
+
+        disparity_map_colored, frame_copy, depth_map_colored = renderer.render(boxes, distances, frame,
+                                                                               disparity_map, depth_map)
+        if show_output:
+            cv2.imshow("Output disparity map", disparity_map_colored)
+            cv2.imshow("Output frame", frame_copy)
+            cv2.imshow("Output depth map", depth_map_colored)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+
+        if box_statistics:
+            return disparity_map_colored, frame_copy, depth_map_colored, stats
+        return disparity_map_colored, frame_copy, depth_map_colored
 
-def calculate_distance(bbox_coordinates, frame, depth_map, disparity_map, show_output=True):
     frame_copy = frame.copy()
 
     # Normalize the disparity map to [0, 255]
@@ -338,12 +3579,15 @@ def calculate_distance(bbox_coordinates, frame, depth_map, disparity_map, show_o
     colormap = cv2.COLORMAP_BONE
     depth_map_colored = cv2.applyColorMap(depth_map_normalized, colormap)
 
-    for bbox_coor in bbox_coordinates:
+    for box_index, bbox_coor in enumerate(bbox_coordinates):
         x1, y1, x2, y2 = bbox_coor
         center_x = (x1 + x2) // 2
         center_y = (y1 + y2) // 2
 
-        distance = depth_map[center_y][center_x]
+        if smoothed is not None:
+            distance = smoothed[box_index]
+        else:
+            distance = depth_map[center_y][center_x] if stats is None else stats[distance_field][box_index]
         print("Calculated distance:", distance)
 
         # Convert distance to string
@@ -405,49 +3649,300 @@ def calculate_distance(bbox_coordinates, frame, depth_map, disparity_map, show_o
         cv2.waitKey(0)
         cv2.destroyAllWindows()
 
+    if box_statistics:
+        return disparity_map_colored, frame_copy, depth_map_colored, stats
     return disparity_map_colored, frame_copy, depth_map_colored
 
 
 
 
-def ground_truth_bbox(labels_file, object_class):
-    lines = labels_file.split('\n')  # Split the input string into lines
-    bounding_boxes = []
+#--- KITTI labels as structured arrays
+KITTI_CLASSES = ('Car', 'Van', 'Truck', 'Pedestrian', 'Person_sitting', 'Cyclist', 'Tram', 'Misc', 'DontCare')
+
+LABEL_DTYPE = np.dtype([
+    ('type_id', np.int16), ('truncated', np.float32), ('occluded', np.int8), ('alpha', np.float32),
+    ('bbox', np.float32, (4,)), ('dimensions', np.float32, (3,)), ('location', np.float32, (3,)),
+    ('rotation_y', np.float32),
+])
+
+
+def parse_labels(labels_file):
+    """
+    Parse the contents of a KITTI label file into a structured array.
+
+    Args:
+        labels_file (str): Contents of the label file.
+
+    Returns:
+        numpy.ndarray: One LABEL_DTYPE record per object. Unknown types get type_id -1.
+    """
+    rows = [line.split() for line in labels_file.splitlines() if line.strip()]
+    labels = np.zeros(len(rows), dtype=LABEL_DTYPE)
+    if not rows:
+        return labels
+
+    # Convert all numeric fields at once; columns 1-14 follow the KITTI object format
+    values = np.array([row[1:15] for row in rows], dtype=np.float32)
+    class_index = {name: type_id for type_id, name in enumerate(KITTI_CLASSES)}
+    labels['type_id'] = [class_index.get(row[0], -1) for row in rows]
+    labels['truncated'] = values[:, 0]
+    labels['occluded'] = values[:, 1]
+    labels['alpha'] = values[:, 2]
+    labels['bbox'] = values[:, 3:7]
+    labels['dimensions'] = values[:, 7:10]
+    labels['location'] = values[:, 10:13]
+    labels['rotation_y'] = values[:, 13]
+    return labels
+
+
+def class_type_ids(object_class):
+    """
+    Convert KITTI class names into type IDs.
+    """
+    return np.array([KITTI_CLASSES.index(name) for name in object_class if name in KITTI_CLASSES], dtype=np.int16)
+
+
+def label_distances(labels, distance="depth"):
+    """
+    Get the distance of labelled objects.
+
+    Args:
+        labels (numpy.ndarray): LABEL_DTYPE records.
+        distance (str): "depth" for the z coordinate of the location, comparable with the depth map,
+            or "range" for the Euclidean distance from the camera.
+
+    Returns:
+        numpy.ndarray: float32 distances.
+    """
+    if distance == "depth":
+        return labels['location'][:, 2].copy()
+    if distance == "range":
+        return np.linalg.norm(labels['location'], axis=1).astype(np.float32)
+    raise ValueError(f"Unknown distance: {distance}")
+
+
+def ground_truth_bbox(labels_file, object_class, verbose=False, distance="depth"):
+    """
+    Get the ground-truth boxes and distances of the objects of the requested classes.
 
-    for line in lines:
-        line = line.strip()  # Remove leading/trailing whitespace
+    Args:
+        labels_file (str): Contents of the label file.
+        object_class (list): KITTI classes of interest, e.g. ['Car', 'Cyclist'].
+        verbose (bool): Whether to print the 3D bounding box information of every object.
+        distance (str): "depth" for the z coordinate of the object location, which is what the depth
+            map measures, or "range" for the Euclidean distance from the camera.
 
-        if line:
-            data = line.split()
+    Returns:
+        list: (bbox, distance) tuples.
+    """
+    labels = parse_labels(labels_file)
+    labels = labels[np.isin(labels['type_id'], class_type_ids(object_class))]
+
+    if verbose:
+        for label in labels:
+            # Print the 3D bounding box information
+            print("Object Type:", KITTI_CLASSES[label['type_id']])
+            print("Truncated:", label['truncated'])
+            print("Occluded:", label['occluded'])
+            print("Alpha:", label['alpha'])
+            print("Bounding Box:", label['bbox'].tolist())
+            print("Dimensions:", label['dimensions'].tolist())
+            print("Location:", label['location'].tolist())
+            print("True Distance:", label['location'][2])
+            print("True Range:", np.linalg.norm(label['location']))
+            print("Rotation Y:", label['rotation_y'])
+            print("------------------------")
+
+    distances = label_distances(labels, distance)
+    return [(bbox, value) for bbox, value in zip(labels['bbox'].tolist(), distances.tolist())]
+
+
+#--- Columnar label store
+class LabelStore:
+    """
+    Labels of every frame of a labels folder, parsed once and kept in column arrays.
 
-            # Extract relevant values for each object
-            obj_type = data[0]
-            #print(obj_type)
-            truncated = float(data[1])
-            occluded = int(data[2])
-            alpha = float(data[3])
-            bbox = [float(val) for val in data[4:8]]
-            dimensions = [float(val) for val in data[8:11]]
-            location = [float(val) for val in data[11:14]]
-            distance = float(data[13])
-            rotation_y = float(data[14])
+    Objects are stored frame after frame, one array per field, so the labels of frame i are the
+    rows frame_offsets[i]:frame_offsets[i + 1]. A class index lists the rows of each class in frame
+    order, so class and frame range queries reduce to a slice and a binary search. The columns are
+    saved as .npy files in a store folder and memory-mapped when reopened; the folder is parsed
+    again only when the labels folder was modified.
 
-            if obj_type in object_class:  # Check if obj_type is in the desired classes
-                # Append bounding box dimensions and distance to the list
-                bounding_boxes.append((bbox, distance))
+    Args:
+        columns (dict): Column arrays of the store.
+        frame_ids (list): Sorted frame IDs, e.g. "000013".
+    """
 
-                # Print the 3D bounding box information
-                print("Object Type:", obj_type)
-                print("Truncated:", truncated)
-                print("Occluded:", occluded)
-                print("Alpha:", alpha)
-                print("Bounding Box:", bbox)
-                print("Dimensions:", dimensions)
-                print("Location:", location)
-                print("True Distance:", distance)
-                print("Rotation Y:", rotation_y)
-                print("------------------------")
-    return bounding_boxes
+    STORE_VERSION = 1
+    COLUMNS = ('frame', 'type_id', 'truncated', 'occluded', 'alpha', 'bbox', 'dimensions', 'location', 'rotation_y',
+               'depth', 'range')
+
+    def __init__(self, columns, frame_ids):
+        self.columns = columns
+        self.frame_ids = list(frame_ids)
+        self._frame_index = {frame_id: index for index, frame_id in enumerate(self.frame_ids)}
+        self.frame_offsets = columns['frame_offsets']
+        self.class_rows = columns['class_rows']
+        self.class_offsets = columns['class_offsets']
+
+    @classmethod
+    def build(cls, labels_folder):
+        """
+        Parse every label file of a folder into column arrays.
+
+        Args:
+            labels_folder (str): Path to the folder containing the label files.
+
+        Returns:
+            LabelStore: The new store.
+        """
+        frame_ids = sorted(os.path.splitext(name)[0] for name in os.listdir(labels_folder) if name.endswith('.txt'))
+        labels = []
+        for frame_id in frame_ids:
+            with open(os.path.join(labels_folder, frame_id + '.txt'), 'r') as file:
+                labels.append(parse_labels(file.read()))
+
+        counts = np.array([len(frame_labels) for frame_labels in labels], dtype=np.int64)
+        labels = np.concatenate(labels) if labels else np.zeros(0, LABEL_DTYPE)
+
+        # One array per field, plus the frame of every row and both distances
+        columns = {field: np.ascontiguousarray(labels[field]) for field in LABEL_DTYPE.names}
+        columns['frame'] = np.repeat(np.arange(len(frame_ids), dtype=np.int32), counts)
+        columns['depth'] = label_distances(labels, "depth")
+        columns['range'] = label_distances(labels, "range")
+
+        # Frame and class indexes
+        columns['frame_offsets'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        columns['class_rows'] = np.argsort(columns['type_id'], kind='stable').astype(np.int64)
+        columns['class_offsets'] = np.searchsorted(columns['type_id'][columns['class_rows']],
+                                                   np.arange(len(KITTI_CLASSES) + 1)).astype(np.int64)
+        return cls(columns, frame_ids)
+
+    @classmethod
+    def open(cls, labels_folder, store_path=None):
+        """
+        Memory-map the store if it is still valid, otherwise parse the labels folder and save it.
+
+        Args:
+            labels_folder (str): Path to the folder containing the label files.
+            store_path (str): Folder of the store. Defaults to label_store next to the labels folder.
+
+        Returns:
+            LabelStore: The up-to-date store.
+        """
+        if store_path is None:
+            store_path = os.path.join(os.path.dirname(os.path.normpath(labels_folder)), 'label_store')
+        meta_path = os.path.join(store_path, 'meta.json')
+
+        # Adding, removing or replacing label files updates the folder mtime
+        mtime = os.stat(labels_folder).st_mtime_ns
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta.get('version') == cls.STORE_VERSION and meta.get('mtime') == mtime:
+                columns = {name: np.load(os.path.join(store_path, name + '.npy'), mmap_mode='r')
+                           for name in meta['columns']}
+                return cls(columns, meta['frame_ids'])
+
+        store = cls.build(labels_folder)
+        store.save(store_path, mtime)
+        return store
+
+    def save(self, store_path, mtime=None):
+        """
+        Save the columns of the store as .npy files.
+
+        Args:
+            store_path (str): Folder of the store.
+            mtime (int): Modification time of the labels folder the store was built from.
+        """
+        os.makedirs(store_path, exist_ok=True)
+        meta_path = os.path.join(store_path, 'meta.json')
+
+        # The metadata is written last, so an interrupted save leaves an invalid store
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, column in self.columns.items():
+            np.save(os.path.join(store_path, name + '.npy'), column)
+        with open(meta_path, 'w') as file:
+            json.dump({'version': self.STORE_VERSION, 'mtime': mtime, 'frame_ids': self.frame_ids,
+                       'columns': sorted(self.columns)}, file)
+
+    def __len__(self):
+        return len(self.columns['frame'])
+
+    def frame_rows(self, frame_id):
+        """
+        Return the rows of the objects of a frame as a slice.
+        """
+        index = self._frame_index[frame_id]
+        return slice(int(self.frame_offsets[index]), int(self.frame_offsets[index + 1]))
+
+    def labels(self, rows):
+        """
+        Gather rows of the store into LABEL_DTYPE records.
+
+        Args:
+            rows: Row indices, boolean mask or slice.
+
+        Returns:
+            numpy.ndarray: LABEL_DTYPE records.
+        """
+        labels = np.zeros(len(self.columns['type_id'][rows]), dtype=LABEL_DTYPE)
+        for field in LABEL_DTYPE.names:
+            labels[field] = self.columns[field][rows]
+        return labels
+
+    def frame_labels(self, frame_id):
+        """
+        Return the labels of a frame as LABEL_DTYPE records.
+        """
+        return self.labels(self.frame_rows(frame_id))
+
+    def query(self, object_class=None, frames=None, min_distance=None, max_distance=None, distance="range",
+              max_occluded=None, max_truncated=None):
+        """
+        Find the objects matching all the given conditions.
+
+        Args:
+            object_class (list): KITTI classes of interest. None keeps every class.
+            frames (tuple): (start, stop) range of frame indexes in the sorted frame order, stop excluded.
+            min_distance (float): Minimum distance in meters.
+            max_distance (float): Maximum distance in meters (exclusive).
+            distance (str): "range" for the Euclidean distance or "depth" for the z coordinate.
+            max_occluded (int): Maximum occlusion level.
+            max_truncated (float): Maximum truncation.
+
+        Returns:
+            numpy.ndarray: Sorted row indices of the matching objects.
+        """
+        frame_offsets = self.frame_offsets
+        start, stop = (0, len(self.frame_ids)) if frames is None else frames
+        row_start, row_stop = int(frame_offsets[max(start, 0)]), int(frame_offsets[min(stop, len(self.frame_ids))])
+
+        if object_class is None:
+            rows = np.arange(row_start, row_stop)
+        else:
+            # Rows of each class are in frame order, so the frame range is a binary search within the class
+            rows = []
+            for type_id in class_type_ids(object_class):
+                class_rows = self.class_rows[self.class_offsets[type_id]:self.class_offsets[type_id + 1]]
+                low, high = np.searchsorted(class_rows, (row_start, row_stop))
+                rows.append(class_rows[low:high])
+            rows = np.sort(np.concatenate(rows)) if rows else np.zeros(0, np.int64)
+
+        keep = np.ones(len(rows), bool)
+        if min_distance is not None or max_distance is not None:
+            values = self.columns[distance][rows]
+            if min_distance is not None:
+                keep &= values >= min_distance
+            if max_distance is not None:
+                keep &= values < max_distance
+        if max_occluded is not None:
+            keep &= self.columns['occluded'][rows] <= max_occluded
+        if max_truncated is not None:
+            keep &= self.columns['truncated'][rows] <= max_truncated
+        return rows[keep]
 
 
 def display_ground_truth(frame, bounding_boxes, show_output=True):
@@ -492,7 +3987,52 @@ def display_ground_truth(frame, bounding_boxes, show_output=True):
         cv2.destroyAllWindows()
 
 
-def pipeline(left_image, right_image, object_class):
+_pipeline_executor = None
+
+
+def get_pipeline_executor():
+    """
+    Return the shared thread pool running the stereo branch of pipeline(), creating it on first use.
+    """
+    global _pipeline_executor
+    if _pipeline_executor is None:
+        _pipeline_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline-stereo")
+    return _pipeline_executor
+
+
+# Matcher parameters of the pipeline's stereo branch
+PIPELINE_STEREO_PARAMS = dict(num_disparities=90, block_size=5, window_size=5, matcher="stereo_sgbm")
+
+
+def _stereo_branch(left_image, right_image, cache=None, buffers=None):
+    # Calculate the raw fixed-point disparity map
+    with _metrics.timer('pipeline.disparity'):
+        raw_disparity = compute_disparity(left_image, right_image, show_disparity=False, raw=True, cache=cache,
+                                          **PIPELINE_STEREO_PARAMS)
+
+    # Calculate the disparity and depth maps into the caller's buffers
+    with _metrics.timer('pipeline.depth'):
+        disparity_map, depth_map, valid_mask = depth_from_raw_disparity(
+            raw_disparity, baseline, focal_length, PIPELINE_STEREO_PARAMS['num_disparities'], buffers=buffers)
+    if _metrics.enabled:
+        _metrics.observe('pipeline.invalid_disparity_fraction', 1 - np.count_nonzero(valid_mask) / valid_mask.size)
+    return disparity_map, depth_map, valid_mask
+
+
+def _detect_boxes(left_image, object_class, scheduler=None):
+    # Boxes from the scheduler when given, otherwise from running the detector on the frame
+    with _metrics.timer('pipeline.detection'):
+        if scheduler is not None:
+            bbox_coordinates, track_ids = scheduler.update(left_image)
+        else:
+            bbox_coordinates, track_ids = get_bounding_box_center_frame(left_image, model, names, object_class,
+                                                                        show_output=False), None
+    _metrics.increment('boxes_detected', len(bbox_coordinates))
+    return bbox_coordinates, track_ids
+
+
+def pipeline(left_image, right_image, object_class, render=True, renderer=None, roi_only=False, scheduler=None,
+             concurrent=True, gray_images=None, cache=None):
     """
     Performs a pipeline of operations on stereo images to obtain a colored disparity map, RGB frame, and colored depth map.
 
@@ -500,53 +4040,837 @@ def pipeline(left_image, right_image, object_class):
     - left_image: Left stereo image (RGB format)
     - right_image: Right stereo image (RGB format)
     - object_class: List of object classes of interest for bounding box retrieval
+    - render: Whether to render images; if False only the boxes and distances are returned
+    - renderer: Optional DistanceRenderer reused across frames
+    - roi_only: Whether to run detection first and compute the disparity only inside the detected boxes
+    - scheduler: Optional DetectorScheduler that runs the detector on keyframes only and smooths the distances
+    - concurrent: Whether to run the stereo branch on a background thread while the detector runs
+    - gray_images: Optional (left_gray, right_gray) pair, e.g. from a FrameCache, matched instead of converting the images
+    - cache: Optional DisparityResultCache; a hit skips stereo matching
 
     Output:
     - disparity_map_colored: Colored disparity map (RGB format)
     - frame_rgb: RGB frame
     - depth_map_colored: Colored depth map (RGB format)
+    or, if render is False:
+    - boxes: Nx4 array of bounding boxes
+    - distances: Distance of each box in meters
     """
     global focal_length
+    start = time.perf_counter()
+
+    # Grayscale images for the matcher, converted from the color images unless given
+    stereo_left, stereo_right = gray_images if gray_images is not None else (left_image, right_image)
+
+    # Depth buffers of the calling thread, also when the stereo branch runs on the executor
+    buffers = get_depth_buffers(left_image.shape)
+
+    if roi_only:
+        # Get bounding box coordinates first and match only the strips covering them
+        bbox_coordinates, track_ids = _detect_boxes(left_image, object_class, scheduler)
+        with _metrics.timer('pipeline.disparity_roi'):
+            raw_disparity = compute_disparity_roi(stereo_left, stereo_right, bbox_coordinates, block_size=5,
+                                                  window_size=5, matcher="stereo_sgbm", raw=True,
+                                                  num_disparities=PIPELINE_STEREO_PARAMS['num_disparities'])
+        disparity_map, depth_map, valid_mask = depth_from_raw_disparity(
+            raw_disparity, baseline, focal_length, PIPELINE_STEREO_PARAMS['num_disparities'], buffers=buffers)
+    elif concurrent:
+        # Start the disparity and depth maps in the background; OpenCV and torch release the GIL
+        stereo_future = get_pipeline_executor().submit(_stereo_branch, stereo_left, stereo_right, cache, buffers)
+
+        # Get bounding box coordinates for specified object classes in the meantime
+        try:
+            bbox_coordinates, track_ids = _detect_boxes(left_image, object_class, scheduler)
+        except BaseException:
+            # Let the stereo branch finish with the caller's buffers, but report the detector's error
+            stereo_future.exception()
+            raise
+
+        # Synchronize both branches before computing the distances
+        with _metrics.timer('pipeline.stereo_wait'):
+            disparity_map, depth_map, valid_mask = stereo_future.result()
+    else:
+        # Calculate the disparity and depth maps
+        disparity_map, depth_map, valid_mask = _stereo_branch(stereo_left, stereo_right, cache, buffers)
 
-    # Calculate the disparity map
-    disparity_map = compute_disparity(left_image, right_image, num_disparities=90, block_size=5, window_size=5,
-                                      matcher="stereo_sgbm", show_disparity=False)
+        # Get bounding box coordinates for specified object classes
+        bbox_coordinates, track_ids = _detect_boxes(left_image, object_class, scheduler)
+
+    with _metrics.timer('pipeline.distance'):
+        if not render:
+            # Only the boxes and their distances
+            results = calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False,
+                                         render=False, track_ids=track_ids, scheduler=scheduler,
+                                         valid_mask=valid_mask)
+        else:
+            # Calculate colored disparity map, RGB frame, and colored depth map
+            results = calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False, renderer=renderer, track_ids=track_ids, scheduler=scheduler, valid_mask=valid_mask)
+
+    _metrics.observe('pipeline.total_seconds', time.perf_counter() - start)
+    _metrics.frame_done()
+    return results
+
+
+#--- Temporal mode for video sequences
+class TemporalStereoProcessor:
+    """
+    Sequence-aware replacement for pipeline() that exploits the redundancy of consecutive frames.
+
+    Every frame is compared with the previous one on a downsampled grayscale image:
+    - near-static frames reuse the previous results without matching or detection,
+    - large scene changes and every keyframe_interval-th frame get a full recompute with the
+      fixed disparity range,
+    - other frames run SGBM on a disparity range narrowed to the percentiles of the previous
+      frame's disparity histogram, plus a margin.
+    If the narrowed range loses too many valid pixels compared to the last full frame, the next
+    frame is recomputed in full, as is the first frame after a change of the frame size.
+
+    Args:
+        object_class (list): Object classes of interest for bounding box retrieval.
+        num_disparities (int): Disparity range of full recomputes.
+        block_size (int): Size of the block window.
+        window_size (int): Size of the disparity smoothness window.
+        keyframe_interval (int): Maximum number of frames between two full recomputes.
+        static_threshold (float): Mean absolute gray-level difference below which a frame is reused.
+        scene_change_threshold (float): Mean absolute gray-level difference above which a frame is recomputed in full.
+        downsample (int): Downsampling factor of the frame difference.
+        margin (int): Disparity margin in pixels added around the previous frame's range.
+        percentiles (tuple): Lower and upper percentiles of the previous disparity histogram kept in range.
+        min_valid_ratio (float): Minimum valid-pixel ratio relative to the last full frame before forcing a recompute.
+        engine (DisparityEngine): Engine providing pooled matchers. Defaults to the shared engine.
+        scheduler (DetectorScheduler): Optional scheduler that runs the detector on keyframes only.
+        range_step (int): Step the minimum disparity of adaptive ranges is rounded down to, which
+            keeps the number of distinct pooled matchers small.
+    """
+
+    def __init__(self, object_class=['car', 'bicycle'], num_disparities=90, block_size=5, window_size=5,
+                 keyframe_interval=30, static_threshold=1.5, scene_change_threshold=20.0, downsample=8, margin=8,
+                 percentiles=(1, 99), min_valid_ratio=0.9, engine=None, scheduler=None, range_step=8):
+        self.object_class = object_class
+        self.num_disparities = num_disparities
+        self.block_size = block_size
+        self.window_size = window_size
+        self.keyframe_interval = keyframe_interval
+        self.static_threshold = static_threshold
+        self.scene_change_threshold = scene_change_threshold
+        self.downsample = downsample
+        self.margin = margin
+        self.percentiles = percentiles
+        self.min_valid_ratio = min_valid_ratio
+        self.engine = engine
+        self.scheduler = scheduler
+        self.range_step = range_step
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the previous frames, e.g. at the start of a new sequence.
+        """
+        self.frame_index = 0
+        self.last_full_index = None
+        self.force_full = True
+        self.frame_shape = None
+        self.previous_small = None
+        self.previous_raw = None
+        self.previous_min_disparity = 0
+        self.previous_results = None
+        self.full_valid_fraction = None
+        self.last_status = None
+        self.counts = {'full': 0, 'adaptive': 0, 'reused': 0}
+
+    def disparity_range(self, raw_disparity, min_disparity):
+        """
+        Compute the (min_disparity, num_disparities) range covering the valid disparities of a frame.
+        """
+        # Histogram of the valid disparities in whole pixels
+        values = raw_disparity[raw_disparity >= max(min_disparity * 16, 1)] // 16
+        if len(values) == 0:
+            return 0, self.num_disparities
+        cumulative = np.cumsum(np.bincount(values)) / len(values)
+        low = int(np.searchsorted(cumulative, self.percentiles[0] / 100))
+        high = int(np.searchsorted(cumulative, self.percentiles[1] / 100)) + 1
+
+        # Widen by the margin, snap the minimum to the range step and round the range up to a multiple of 16
+        new_min = max(0, low - self.margin) // self.range_step * self.range_step
+        new_num = -(-(high + self.margin - new_min) // 16) * 16
+        return new_min, max(16, min(new_num, self.num_disparities))
+
+    def _status(self, small):
+        if self.force_full or self.previous_small is None:
+            return 'full'
+        if self.frame_index - self.last_full_index >= self.keyframe_interval:
+            return 'full'
+        difference = cv2.absdiff(small, self.previous_small).mean()
+        if difference > self.scene_change_threshold:
+            return 'full'
+        if difference < self.static_threshold:
+            return 'reused'
+        return 'adaptive'
+
+    def process(self, left_image, right_image, object_class=None):
+        """
+        Process the next stereo pair of the sequence.
+
+        Args:
+            left_image (numpy.ndarray): Left image.
+            right_image (numpy.ndarray): Right image.
+            object_class (list): Object classes of interest. Defaults to the processor's classes.
+
+        Returns:
+            tuple: (disparity_map_colored, frame_rgb, depth_map_colored) as returned by pipeline().
+                last_status tells whether the frame was "full", "adaptive" or "reused".
+        """
+        object_class = self.object_class if object_class is None else object_class
+        engine = self.engine if self.engine is not None else get_disparity_engine()
+
+        # Cheap downsampled difference with the previous frame
+        left_gray = cv2.cvtColor(left_image, cv2.COLOR_BGR2GRAY)
+        if left_gray.shape != self.frame_shape:
+            # Frames of a new size are not compared with the previous ones
+            self.force_full = True
+            self.frame_shape = left_gray.shape
+        small = cv2.resize(left_gray, None, fx=1 / self.downsample, fy=1 / self.downsample,
+                           interpolation=cv2.INTER_AREA)
+        status = self._status(small)
+        self.previous_small = small
+
+        if status == 'reused':
+            self.frame_index += 1
+            self.counts[status] += 1
+            self.last_status = status
+            _metrics.increment('temporal.reused_frames')
+            _metrics.frame_done()
+            return self.previous_results
+
+        if status == 'full':
+            min_disparity, num_disparities = 0, self.num_disparities
+        else:
+            min_disparity, num_disparities = self.disparity_range(self.previous_raw, self.previous_min_disparity)
+
+        # Calculate the disparity map on the selected range, marking pixels outside it as invalid
+        right_gray = cv2.cvtColor(right_image, cv2.COLOR_BGR2GRAY)
+        raw_disparity = engine.compute_raw(left_gray, right_gray, num_disparities=num_disparities,
+                                           block_size=self.block_size, window_size=self.window_size,
+                                           min_disparity=min_disparity)
+        # Guard against a range that became too narrow
+        valid_fraction = np.count_nonzero(raw_disparity >= max(min_disparity * 16, 1)) / raw_disparity.size
+        if status == 'full':
+            self.full_valid_fraction = valid_fraction
+            self.last_full_index = self.frame_index
+        self.force_full = valid_fraction < self.min_valid_ratio * self.full_valid_fraction
+
+        # Calculate the disparity and depth maps, detect objects and render the distances
+        disparity_map, depth_map, valid_mask = depth_from_raw_disparity(raw_disparity, baseline, focal_length,
+                                                                        num_disparities, min_disparity)
+        bbox_coordinates, track_ids = _detect_boxes(left_image, object_class, self.scheduler)
+        results = calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False,
+                                     track_ids=track_ids, scheduler=self.scheduler, valid_mask=valid_mask)
+
+        self.previous_raw = raw_disparity
+        self.previous_min_disparity = min_disparity
+        self.previous_results = results
+        self.frame_index += 1
+        self.counts[status] += 1
+        self.last_status = status
+        _metrics.increment(f'temporal.{status}_frames')
+        _metrics.frame_done()
+        return results
+
+
+def _process_pipeline_image_file(image_file, left_image_folder, right_image_folder, output_folder_distance, object_class,
+                                 compute=None, cache_path=None, rectification=None):
+    # Construct the paths for the left and right images
+    left_image_path = os.path.join(left_image_folder, image_file)
+    right_image_path = os.path.join(right_image_folder, image_file)
+
+    # Read the left and right images
+    left_image = cv2.imread(left_image_path)
+    right_image = cv2.imread(right_image_path)
+
+    # Rectify raw images with the maps cached by this process
+    if rectification is not None:
+        left_image, right_image = get_rectifier(*rectification).rectify(left_image, right_image)
+
+    if compute is None:
+        cache = get_result_cache(cache_path) if cache_path is not None else None
+        disparity_map_colored, frame_rgb, depth_map_colored = pipeline(left_image, right_image, object_class,
+                                                                       cache=cache)
+    else:
+        disparity_map_colored, frame_rgb, depth_map_colored = compute(left_image, right_image, object_class)
+
+    # Construct the output file path
+    output_file = os.path.join(output_folder_distance, image_file)
+
+    # Save the disparity map as an image
+    cv2.imwrite(output_file, disparity_map_colored)
+
+    return output_file
 
-    # Calculate the depth map
-    depth_map = calculate_depth_map(disparity_map, baseline, focal_length, show_depth_map=False)
 
-    # Get bounding box coordinates for specified object classes
-    bbox_coordinates = get_bounding_box_center_frame(left_image, model, names, object_class, show_output=False)
+def process_pipeline_images(left_image_folder, right_image_folder, output_folder_distance, object_class=['car', 'bicycle'],
+                            num_workers=1, chunksize=4, weights_path=None, streaming=False, temporal=False,
+                            detector_interval=None, cache_path=None, rectification_file=None, rectified_size=None):
+    """
+    Run the pipeline on every image pair in the input folders and save the annotated disparity maps.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        output_folder_distance (str): Path to the folder where the annotated disparity maps are saved.
+        object_class (list): Object classes of interest for bounding box retrieval.
+        num_workers (int): Number of worker processes. 1 processes the images one at a time.
+        chunksize (int): Number of images sent to a worker at a time.
+        weights_path (str): Path to the YOLO weights loaded once by each worker process.
+            Required when num_workers > 1.
+        streaming (bool): Whether to overlap reading, computing and writing with a StreamingPipeline.
+        temporal (bool): Whether to treat the images as a video sequence with a TemporalStereoProcessor.
+        detector_interval (int): If set, run the detector every detector_interval frames with a
+            DetectorScheduler and propagate the boxes with optical flow in between.
+        cache_path (str): Optional folder of a DisparityResultCache shared by all runs and workers.
+            Temporal mode matches adaptive disparity ranges and does not use it.
+        rectification_file (str): Optional raw calibration file (see parse_raw_calibration) of
+            unrectified input. The images are rectified before the pipeline, and the baseline and
+            focal length are taken from the rectified geometry.
+        rectified_size (tuple): Optional (width, height) the images are rectified into, so that
+            the same remap also downscales them.
 
-    # Calculate colored disparity map, RGB frame, and colored depth map
-    disparity_map_colored, frame_rgb, depth_map_colored = calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False)
+    Returns:
+        list: (image_file, error) tuples for the images that failed.
 
-    return disparity_map_colored, frame_rgb, depth_map_colored
+    Raises:
+        ValueError: If num_workers > 1 without weights_path, or with streaming, temporal or detector scheduling.
+    """
+    global baseline, focal_length
 
+    # Worker processes do not share the model of this process, which only fork would copy
+    if num_workers > 1 and weights_path is None:
+        raise ValueError("Worker processes load their own model; pass weights_path or use num_workers=1.")
 
-def process_pipeline_images(left_image_folder, right_image_folder, output_folder_distance, object_class=['car', 'bicycle']):
     # Get the list of image files in the left image folder
-    left_image_files = os.listdir(left_image_folder)
+    left_image_files = sorted(os.listdir(left_image_folder))
+
+    rectification = None
+    if rectification_file is not None:
+        # Build the maps once and compute depth on the rectified grid
+        rectification = (rectification_file, rectified_size)
+        rectifier = get_rectifier(*rectification)
+        baseline, focal_length = rectifier.baseline, rectifier.focal_length
+
+    compute = None
+    sequential = temporal or detector_interval is not None
+    if sequential:
+        if num_workers > 1:
+            raise ValueError("Temporal mode and detector scheduling process frames in order; use num_workers=1.")
+
+        scheduler = None
+        if detector_interval is not None:
+            scheduler = DetectorScheduler(model, names, object_class, interval=detector_interval)
+            cache = get_result_cache(cache_path) if cache_path is not None else None
+            compute = lambda left_image, right_image, object_class: pipeline(left_image, right_image, object_class,
+                                                                             scheduler=scheduler, cache=cache)
+        if temporal:
+            processor = TemporalStereoProcessor(object_class, scheduler=scheduler)
+            compute = processor.process
+
+    if streaming:
+        if num_workers > 1:
+            raise ValueError("Streaming mode runs in a single process; use num_workers=1.")
+
+        # Overlap reading, computing and writing within this process
+        if compute is None and cache_path is not None:
+            cache = get_result_cache(cache_path)
+            compute = lambda left_image, right_image, object_class: pipeline(left_image, right_image, object_class,
+                                                                             cache=cache)
+        if rectification is not None:
+            # Rectify in the compute stage, after the reader threads decoded the raw images
+            unrectified_compute = compute if compute is not None else pipeline
+            compute = lambda left_image, right_image, object_class: unrectified_compute(
+                *rectifier.rectify(left_image, right_image), object_class)
+        stream = StreamingPipeline(left_image_folder, right_image_folder, output_folder_distance, object_class,
+                                   image_files=left_image_files, compute=compute)
+        for _ in stream.run():
+            pass
+        print(f"Streaming stats: {stream.stats()}")
+        failures = stream.failures
+    elif sequential:
+        # Serial loop sharing the tracking state between consecutive frames
+        failures = run_folder_batch(_process_pipeline_image_file, left_image_files,
+                                    args=(left_image_folder, right_image_folder, output_folder_distance, object_class,
+                                          compute, None, rectification),
+                                    message="Disparity map saved")
+
+    if temporal:
+        print(f"Temporal frames: {processor.counts}")
+    if detector_interval is not None:
+        print(f"Detector stats: {scheduler.stats()}")
+    if streaming or sequential:
+        _print_result_cache_stats(cache_path)
+        return failures
+
+    # Workers receive the calibration used by pipeline() and load their own model
+    initargs = (weights_path, globals().get('baseline'), globals().get('focal_length'))
+
+    failures = run_folder_batch(_process_pipeline_image_file, left_image_files,
+                                args=(left_image_folder, right_image_folder, output_folder_distance, object_class,
+                                      None, cache_path, rectification),
+                                message="Disparity map saved", num_workers=num_workers, chunksize=chunksize,
+                                initargs=initargs)
+    _print_result_cache_stats(cache_path, num_workers)
+    return failures
+
+#--- Streaming pipeline with bounded prefetch, compute and write stages
+class StreamingPipeline:
+    """
+    Streaming version of process_pipeline_images that overlaps disk I/O with computation.
+
+    A reader stage prefetches stereo pairs on background threads, the compute stage runs
+    pipeline() in the consuming thread and a writer stage encodes and saves the results on
+    background threads. The stages are connected by bounded queues, so at most
+    prefetch + write_queue_size frames are held in memory regardless of the sequence length.
+
+    Args:
+        left_image_folder (str): Path to the folder containing the left images.
+        right_image_folder (str): Path to the folder containing the right images.
+        output_folder (str): Path to the folder where the annotated disparity maps are saved.
+        object_class (list): Object classes of interest for bounding box retrieval.
+        image_files (list): Image file names to process. Defaults to the sorted left folder listing.
+        num_readers (int): Number of reader threads.
+        num_writers (int): Number of writer threads.
+        prefetch (int): Maximum number of stereo pairs read ahead of the compute stage.
+        write_queue_size (int): Maximum number of results waiting to be written.
+        compute (callable): Function called as compute(left_image, right_image, object_class) in the
+            compute stage. Defaults to pipeline().
+    """
 
-    # Iterate over the image files
-    for image_file in left_image_files:
-        # Construct the paths for the left and right images
-        left_image_path = os.path.join(left_image_folder, image_file)
-        right_image_path = os.path.join(right_image_folder, image_file)
+    def __init__(self, left_image_folder, right_image_folder, output_folder, object_class=['car', 'bicycle'],
+                 image_files=None, num_readers=2, num_writers=2, prefetch=4, write_queue_size=4, compute=None):
+        self.left_image_folder = left_image_folder
+        self.right_image_folder = right_image_folder
+        self.output_folder = output_folder
+        self.object_class = object_class
+        self.image_files = image_files if image_files is not None else sorted(os.listdir(left_image_folder))
+        self.num_readers = num_readers
+        self.num_writers = num_writers
+        self.prefetch = prefetch
+        self.write_queue_size = write_queue_size
+        self.compute = pipeline if compute is None else compute
+        self.failures = []
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {
+            'frames_read': 0, 'frames_computed': 0, 'frames_written': 0,
+            'read_time': 0.0, 'compute_time': 0.0, 'write_time': 0.0,
+            'read_wait_time': 0.0, 'write_wait_time': 0.0,
+            'read_queue_depth_sum': 0, 'write_queue_depth_sum': 0,
+            'read_queue_depth_max': 0, 'write_queue_depth_max': 0,
+        }
+        self._start_time = None
+        self._end_time = None
+
+    def _add_stats(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                self._stats[name] += value
+
+    def _read(self, image_file):
+        start = time.perf_counter()
 
         # Read the left and right images
-        left_image = cv2.imread(left_image_path)
-        right_image = cv2.imread(right_image_path)
+        left_image = cv2.imread(os.path.join(self.left_image_folder, image_file))
+        right_image = cv2.imread(os.path.join(self.right_image_folder, image_file))
+        if left_image is None or right_image is None:
+            raise IOError(f"Could not read stereo pair {image_file}")
+
+        self._add_stats(frames_read=1, read_time=time.perf_counter() - start)
+        _metrics.observe('streaming.read_seconds', time.perf_counter() - start)
+        return left_image, right_image
+
+    def _write_loop(self, write_queue):
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            image_file, disparity_map_colored = item
+            start = time.perf_counter()
+            try:
+                # Save the disparity map as an image
+                output_file = os.path.join(self.output_folder, image_file)
+                if not cv2.imwrite(output_file, disparity_map_colored):
+                    raise IOError(f"Could not write {output_file}")
+                print(f"Disparity map saved: {output_file}")
+                self._add_stats(frames_written=1, write_time=time.perf_counter() - start)
+                _metrics.observe('streaming.write_seconds', time.perf_counter() - start)
+            except Exception as error:
+                self._fail(image_file, error)
+
+    def _fail(self, image_file, error):
+        message = f"{type(error).__name__}: {str(error).strip()}"
+        with self._lock:
+            self.failures.append((image_file, message))
+        print(f"Failed: {image_file} ({message})")
+
+    def run(self):
+        """
+        Process the sequence, yielding results as the compute stage produces them.
+
+        Yields:
+            tuple: (image_file, disparity_map_colored, frame_rgb, depth_map_colored) for every
+                stereo pair, in the order of image_files.
+        """
+        self._reset_stats()
+        self.failures = []
+        self._start_time = time.perf_counter()
+
+        files = iter(self.image_files)
+        pending = collections.deque()
+        write_queue = queue.Queue(maxsize=self.write_queue_size)
+        writers = [threading.Thread(target=self._write_loop, args=(write_queue,), daemon=True)
+                   for _ in range(self.num_writers)]
+        for writer in writers:
+            writer.start()
+
+        readers = ThreadPoolExecutor(max_workers=self.num_readers)
+        try:
+            # Fill the prefetch queue
+            for image_file in itertools.islice(files, self.prefetch):
+                pending.append((image_file, readers.submit(self._read, image_file)))
+
+            while pending:
+                self._add_stats(read_queue_depth_sum=len(pending))
+                with self._lock:
+                    self._stats['read_queue_depth_max'] = max(self._stats['read_queue_depth_max'], len(pending))
+
+                # Wait for the oldest stereo pair and schedule the next read
+                image_file, future = pending.popleft()
+                start = time.perf_counter()
+                try:
+                    left_image, right_image = future.result()
+                except Exception as error:
+                    left_image = right_image = None
+                    self._fail(image_file, error)
+                self._add_stats(read_wait_time=time.perf_counter() - start)
+                _metrics.observe('streaming.read_wait_seconds', time.perf_counter() - start)
+                for next_file in itertools.islice(files, 1):
+                    pending.append((next_file, readers.submit(self._read, next_file)))
+                if left_image is None:
+                    continue
+
+                # Compute the disparity map, depth map and detections
+                start = time.perf_counter()
+                try:
+                    disparity_map_colored, frame_rgb, depth_map_colored = self.compute(left_image, right_image,
+                                                                                       self.object_class)
+                except Exception as error:
+                    self._fail(image_file, error)
+                    continue
+                self._add_stats(frames_computed=1, compute_time=time.perf_counter() - start)
+
+                # Hand the result to the writer stage, blocking while it is full
+                depth = write_queue.qsize()
+                self._add_stats(write_queue_depth_sum=depth)
+                with self._lock:
+                    self._stats['write_queue_depth_max'] = max(self._stats['write_queue_depth_max'], depth)
+                start = time.perf_counter()
+                write_queue.put((image_file, disparity_map_colored))
+                self._add_stats(write_wait_time=time.perf_counter() - start)
+                _metrics.observe('streaming.write_wait_seconds', time.perf_counter() - start)
+                _metrics.observe('streaming.write_queue_depth', depth)
+
+                yield image_file, disparity_map_colored, frame_rgb, depth_map_colored
+        finally:
+            # Drain the writers and stop the readers
+            for _, future in pending:
+                future.cancel()
+            readers.shutdown(wait=True)
+            for _ in writers:
+                write_queue.put(None)
+            for writer in writers:
+                writer.join()
+            self._end_time = time.perf_counter()
+
+    def stats(self):
+        """
+        Return throughput and queue statistics for each stage.
+
+        The stage with the highest busy time per frame is the bottleneck. A large read_wait_time
+        means the compute stage is starved by the readers, and a large write_wait_time means it is
+        blocked by the writers.
+
+        Returns:
+            dict: Frame counts, throughput in frames per second, per-stage time per frame, waiting
+                times of the compute stage and mean/max queue depths.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        end_time = self._end_time if self._end_time is not None else time.perf_counter()
+        elapsed = end_time - self._start_time if self._start_time is not None else 0.0
+        computed = max(stats['frames_computed'], 1)
+
+        return {
+            'frames_read': stats['frames_read'],
+            'frames_computed': stats['frames_computed'],
+            'frames_written': stats['frames_written'],
+            'elapsed': elapsed,
+            'throughput': stats['frames_written'] / elapsed if elapsed > 0 else 0.0,
+            'read_time_per_frame': stats['read_time'] / max(stats['frames_read'], 1),
+            'compute_time_per_frame': stats['compute_time'] / computed,
+            'write_time_per_frame': stats['write_time'] / max(stats['frames_written'], 1),
+            'read_wait_time': stats['read_wait_time'],
+            'write_wait_time': stats['write_wait_time'],
+            'read_queue_depth_mean': stats['read_queue_depth_sum'] / computed,
+            'read_queue_depth_max': stats['read_queue_depth_max'],
+            'write_queue_depth_mean': stats['write_queue_depth_sum'] / computed,
+            'write_queue_depth_max': stats['write_queue_depth_max'],
+        }
+
+
+#--- Ground-truth evaluation over a labelled dataset
+EVALUATION_DTYPE = np.dtype([
+    ('frame', np.int32), ('type_id', np.int16), ('occluded', np.int8), ('truncated', np.float32),
+    ('true_distance', np.float32), ('predicted_distance', np.float32), ('iou', np.float32),
+])
+
+
+# Detector (COCO) classes that may describe each KITTI class
+KITTI_DETECTOR_CLASSES = {
+    'Car': ('car',), 'Van': ('car', 'truck'), 'Truck': ('truck',), 'Pedestrian': ('person',),
+    'Person_sitting': ('person',), 'Cyclist': ('bicycle', 'person'), 'Tram': ('train', 'bus'),
+}
+
+
+def class_compatibility(type_ids, class_ids, names):
+    """
+    Tell which detector classes may describe which KITTI objects.
+
+    Args:
+        type_ids (numpy.ndarray): KITTI type IDs of the ground-truth objects.
+        class_ids (numpy.ndarray): Detector class IDs of the predicted boxes.
+        names (dict): Mapping from detector class ID to class name, as given by model.names.
+
+    Returns:
+        numpy.ndarray: NxM bool matrix, True where the predicted class fits the ground-truth type.
+    """
+    compatible = np.zeros((len(type_ids), len(class_ids)), bool)
+    for row, type_id in enumerate(np.asarray(type_ids).tolist()):
+        detector_classes = KITTI_DETECTOR_CLASSES.get(KITTI_CLASSES[type_id], ()) if type_id >= 0 else ()
+        compatible[row] = [names.get(int(class_id)) in detector_classes for class_id in class_ids]
+    return compatible
+
+
+def match_boxes(true_boxes, predicted_boxes, iou_threshold=0.5, compatible=None):
+    """
+    Match predicted boxes to ground-truth boxes greedily in decreasing IoU order.
+
+    Args:
+        true_boxes (numpy.ndarray): Nx4 ground-truth boxes.
+        predicted_boxes (numpy.ndarray): Mx4 predicted boxes.
+        iou_threshold (float): Minimum IoU of a match.
+        compatible (numpy.ndarray): Optional NxM bool matrix of the class pairs allowed to match,
+            e.g. from class_compatibility().
+
+    Returns:
+        tuple: (matched predicted box index per ground-truth box or -1, IoU of each match).
+    """
+    matches = np.full(len(true_boxes), -1, np.int64)
+    match_iou = np.zeros(len(true_boxes), np.float32)
+    if len(true_boxes) == 0 or len(predicted_boxes) == 0:
+        return matches, match_iou
+
+    iou = box_iou(true_boxes, predicted_boxes)
+    if compatible is not None:
+        # Boxes of different classes never match
+        iou = np.where(compatible, iou, 0)
+    used = np.zeros(len(predicted_boxes), bool)
+    for flat_index in np.argsort(iou, axis=None)[::-1]:
+        true_index, predicted_index = np.unravel_index(flat_index, iou.shape)
+        if iou[true_index, predicted_index] < iou_threshold or iou[true_index, predicted_index] == 0:
+            break
+        if matches[true_index] == -1 and not used[predicted_index]:
+            matches[true_index] = predicted_index
+            match_iou[true_index] = iou[true_index, predicted_index]
+            used[predicted_index] = True
+    return matches, match_iou
+
+
+def _evaluate_frame_file(frame, left_image_folder, right_image_folder, labels_folder, object_class,
+                         ground_truth_classes, iou_threshold, distance_field="median_depth", verbose=False,
+                         frame_cache_path=None):
+    image_file, frame_baseline, frame_focal_length = frame
+    frame_id = os.path.splitext(image_file)[0]
+
+    # Ground-truth objects of the evaluated classes
+    with open(os.path.join(labels_folder, frame_id + '.txt'), 'r') as file:
+        labels = parse_labels(file.read())
+    labels = labels[np.isin(labels['type_id'], class_type_ids(ground_truth_classes))]
+
+    # Decoded frames from the cache when available
+    if frame_cache_path is not None:
+        frame_cache = get_frame_cache(frame_cache_path)
+        left_image = frame_cache.left_color(frame_id)
+        stereo_left, stereo_right = frame_cache.gray_pair(frame_id)
+    else:
+        stereo_left = left_image = cv2.imread(os.path.join(left_image_folder, image_file))
+        stereo_right = cv2.imread(os.path.join(right_image_folder, image_file))
+
+    # Detections with their classes, as filtered by the pipeline
+    detections = get_bounding_boxes_batch([left_image], model, names, object_class)[0]
+    boxes = detections[:, :4].astype(int)
+
+    # Depth of the pipeline's disparity with the frame's calibration; boxes without valid depth get NaN
+    raw_disparity = compute_disparity(stereo_left, stereo_right, show_disparity=False, raw=True,
+                                      **PIPELINE_STEREO_PARAMS)
+    depth_map, valid_mask = calculate_depth_map_raw(raw_disparity, frame_baseline, frame_focal_length,
+                                                    PIPELINE_STEREO_PARAMS['num_disparities'])
+    distances = BoxDepthStatistics(depth_map, valid_mask).query(boxes)[distance_field]
+    distances[~(distances > 0)] = np.nan
+
+    compatible = class_compatibility(labels['type_id'], detections[:, 5], names)
+    matches, match_iou = match_boxes(labels['bbox'], boxes, iou_threshold, compatible)
+    records = np.zeros(len(labels), dtype=EVALUATION_DTYPE)
+    records['frame'] = int(frame_id) if frame_id.isdigit() else -1
+    records['type_id'] = labels['type_id']
+    records['occluded'] = labels['occluded']
+    records['truncated'] = labels['truncated']
+    records['true_distance'] = labels['location'][:, 2]
+    records['predicted_distance'] = np.nan
+    records['predicted_distance'][matches >= 0] = distances[matches[matches >= 0]]
+    records['iou'] = match_iou
+
+    if verbose:
+        print(f"Evaluated {frame_id}: {int((matches >= 0).sum())}/{len(labels)} objects matched")
+    return records
+
+
+def summarize_distance_errors(records, range_edges=(0, 10, 20, 30, 40, 50, np.inf)):
+    """
+    Summarize the distance errors overall and by class, range bucket and occlusion level.
+
+    Matched objects without a valid depth are counted as no_depth and left out of the errors.
+    Objects of a type outside KITTI_CLASSES are grouped under the class 'Unknown'.
+
+    Args:
+        records (numpy.ndarray): EVALUATION_DTYPE records, one per ground-truth object.
+        range_edges (tuple): Edges of the ground-truth distance buckets in meters.
+
+    Returns:
+        dict: For each breakdown, a dict of groups with the object, matched and no-depth counts,
+            the recall and the mean absolute, mean relative and root mean square distance errors.
+    """
+    matched = records['iou'] > 0
+    measured = matched & np.isfinite(records['predicted_distance'])
+    error = records['predicted_distance'] - records['true_distance']
+    relative_error = np.abs(error) / np.maximum(records['true_distance'], 1e-6)
+
+    def summarize(group_ids, labels):
+        # Per-group sums with one bincount per quantity
+        count = np.bincount(group_ids, minlength=len(labels))
+        matched_count = np.bincount(group_ids[matched], minlength=len(labels))
+        measured_count = np.bincount(group_ids[measured], minlength=len(labels))
+        abs_sum = np.bincount(group_ids[measured], np.abs(error[measured]), minlength=len(labels))
+        rel_sum = np.bincount(group_ids[measured], relative_error[measured], minlength=len(labels))
+        squared_sum = np.bincount(group_ids[measured], error[measured] ** 2, minlength=len(labels))
+        summary = {}
+        for group, label in enumerate(labels):
+            if count[group] == 0:
+                continue
+            n = max(measured_count[group], 1)
+            summary[label] = {
+                'objects': int(count[group]),
+                'matched': int(matched_count[group]),
+                'no_depth': int(matched_count[group] - measured_count[group]),
+                'recall': float(matched_count[group] / count[group]),
+                'abs_error': float(abs_sum[group] / n) if measured_count[group] else None,
+                'rel_error': float(rel_sum[group] / n) if measured_count[group] else None,
+                'rmse': float(np.sqrt(squared_sum[group] / n)) if measured_count[group] else None,
+            }
+        return summary
+
+    range_labels = [f"{low:g}-{high:g} m" for low, high in zip(range_edges[:-1], range_edges[1:])]
+    range_ids = np.clip(np.searchsorted(range_edges, records['true_distance'], side='right') - 1,
+                        0, len(range_labels) - 1)
+    occlusion_ids = np.clip(records['occluded'].astype(np.int64), 0, 3)
+
+    return {
+        'overall': summarize(np.zeros(len(records), np.int64), ['all'])['all'] if len(records) else {},
+        'class': summarize(np.where(records['type_id'] >= 0, records['type_id'], len(KITTI_CLASSES)).astype(np.int64),
+                           list(KITTI_CLASSES) + ['Unknown']),
+        'range': summarize(range_ids, range_labels),
+        'occlusion': summarize(occlusion_ids, ['fully visible', 'partly occluded', 'largely occluded', 'unknown']),
+    }
+
+
+def evaluate_dataset(dataset, object_class=['car', 'bicycle', 'person'],
+                     ground_truth_classes=('Car', 'Cyclist', 'Pedestrian'), iou_threshold=0.5, frame_ids=None,
+                     num_workers=1, chunksize=16, weights_path=None, verbose=False, frame_cache=None,
+                     distance_field="median_depth", baseline=None, focal_length=None):
+    """
+    Run the pipeline on a labelled dataset and compare the distances with the ground truth.
+
+    Every frame runs the pipeline's detector filter and stereo matcher. Depth is computed with the
+    frame's own calibration through the depth lookup table, so pixels without a valid disparity
+    never produce a distance. A detection only matches ground-truth objects of a compatible class
+    (see KITTI_DETECTOR_CLASSES).
 
-        disparity_map_colored, frame_rgb, depth_map_colored = pipeline(left_image, right_image, object_class)
+    Args:
+        dataset (KittiDataset): Dataset with labels and, optionally, calibration files.
+        object_class (list): Detector classes of interest.
+        ground_truth_classes (tuple): KITTI classes of the ground-truth objects to evaluate.
+        iou_threshold (float): Minimum IoU between a predicted and a ground-truth box.
+        frame_ids (list): Frame IDs to evaluate. Defaults to every labelled frame.
+        num_workers (int): Number of worker processes.
+        chunksize (int): Number of frames sent to a worker at a time.
+        weights_path (str): Path to the YOLO weights loaded once by each worker process.
+        verbose (bool): Whether to print the number of matched objects of every frame.
+        frame_cache (FrameCache): Optional cache with color images of the dataset frames, read
+            instead of decoding the PNG files.
+        distance_field (str): Field of BOX_STATS_DTYPE used as the predicted distance, e.g.
+            "median_depth" or "center_depth".
+        baseline (float): Baseline in meters of the frames without a calibration file.
+        focal_length (float): Focal length in pixels of the frames without a calibration file.
 
-        # Construct the output file path
-        output_file = os.path.join(output_folder_distance, image_file)
+    Returns:
+        tuple: (EVALUATION_DTYPE records, summary dict of summarize_distance_errors, failures).
 
-        # Save the disparity map as an image
-        cv2.imwrite(output_file, disparity_map_colored)
+    Raises:
+        ValueError: If some frames have no calibration file and no baseline and focal length are given.
+    """
+    if frame_ids is None:
+        frame_ids = [frame_id for frame_id in dataset.frame_ids if dataset.label_path(frame_id) is not None]
+
+    # Calibration of every frame from the store, or the given calibration for frames without a file
+    calibration_store = None
+    if dataset.folders['calib'] is not None:
+        calibration_store = CalibrationStore.open(dataset.folders['calib'])
+    uncalibrated = [frame_id for frame_id in frame_ids
+                    if calibration_store is None or frame_id not in calibration_store]
+    if uncalibrated and (baseline is None or focal_length is None):
+        raise ValueError(f"{len(uncalibrated)} frames have no calibration file (first: {uncalibrated[0]}); "
+                         "pass baseline and focal_length")
+    frames = []
+    for frame_id in frame_ids:
+        if calibration_store is not None and frame_id in calibration_store:
+            calibration = calibration_store.get(frame_id)
+            frame_baseline, frame_focal_length = float(calibration.baseline), float(calibration.fx)
+        else:
+            frame_baseline, frame_focal_length = baseline, focal_length
+        frames.append((os.path.basename(dataset.left_image_path(frame_id)), frame_baseline, frame_focal_length))
+
+    # Workers load their own model
+    outputs = []
+    failures = run_folder_batch(_evaluate_frame_file, frames,
+                                args=(dataset.folders['left'], dataset.folders['right'], dataset.folders['label'],
+                                      object_class, ground_truth_classes, iou_threshold, distance_field, verbose,
+                                      frame_cache.cache_path if frame_cache is not None else None),
+                                message=None, num_workers=num_workers,
+                                chunksize=chunksize, initargs=(weights_path,), outputs=outputs)
+    failures = [(frame[0], error) for frame, error in failures]
+
+    records = np.concatenate([output for _, output in outputs]) if outputs else np.zeros(0, EVALUATION_DTYPE)
+    records = records[np.argsort(records['frame'], kind='stable')]
+    return records, summarize_distance_errors(records), failures
 
-        print(f"Disparity map saved: {output_file}")
 
 def frames_to_video(frame_folder, output_folder, output_filename):
     """
@@ -650,11 +4974,15 @@ if __name__ == '__main__':
     output_depth_folder = os.path.join(parent_directory, 'Data', 'Output_Depth_1')
 
 
+    # Index the dataset once
+    dataset = KittiDataset.open(left_image_folder, right_image_folder, calibration_folder, labels_folder,
+                                manifest_path=os.path.join(parent_directory, 'Data', 'kitti_manifest.json'))
+
     # Choose index of image
     index = 13
 
     # Display the image pair and get the left and right images
-    left_image, right_image = display_image_pair(index=index, left_image_folder=left_image_folder, right_image_folder=right_image_folder, show_picture=True)
+    left_image, right_image = display_image_pair(index=index, left_image_folder=left_image_folder, right_image_folder=right_image_folder, show_picture=True, dataset=dataset)
     print("\nImage shape: ", left_image.shape)
 
     # Compute disparity map
@@ -663,8 +4991,8 @@ if __name__ == '__main__':
     print("\nDisparity map shape: ", disparity_map.shape)
 
     # Display the text file contents
-    calibration_file = display_text_file(index, calibration_folder)
-    label_file = display_text_file(index, labels_folder)
+    calibration_file = display_text_file(index, calibration_folder, dataset=dataset)
+    label_file = display_text_file(index, labels_folder, dataset=dataset)
 
     # Extract calibration parameters
     p_left, p_right, p_ro_rect, p_velo_to_cam, p_imu_to_velo = get_calibration_parameters(calibration_file)
@@ -732,7 +5060,7 @@ if __name__ == '__main__':
     ###-------COMPARE WITH GROUND TRUTH
 
     # Get data from labels.txt
-    bounding_boxes_ground_truth = ground_truth_bbox(label_file, object_class=['Car', 'Cyclist', 'Pedestrian'])
+    bounding_boxes_ground_truth = ground_truth_bbox(label_file, object_class=['Car', 'Cyclist', 'Pedestrian'], verbose=True)
 
     # Display ground truth image with distance
     display_ground_truth(left_image, bounding_boxes_ground_truth, show_output=True)
@@ -746,12 +5074,12 @@ if __name__ == '__main__':
     index = 7
 
     # Load the left image
-    left_image_path = os.path.join(left_image_folder, os.listdir(left_image_folder)[index])
+    left_image_path = dataset.left_image_path(dataset[index])
     left_image = cv2.cvtColor(cv2.imread(left_image_path), cv2.COLOR_BGR2RGB)
     print(left_image)
 
     # Load the right image
-    right_image_path = os.path.join(right_image_folder, os.listdir(right_image_folder)[index])
+    right_image_path = dataset.right_image_path(dataset[index])
     right_image = cv2.cvtColor(cv2.imread(right_image_path), cv2.COLOR_BGR2RGB)
 
 
@@ -777,7 +5105,11 @@ if __name__ == '__main__':
     output_video_folder = os.path.join(parent_directory, 'Data', 'Output_Video')
 
     # ##--- Process all images in folder and save disparity map
+    # metrics = enable_metrics()
+    # metrics.start_profiling(num_frames=20, output_prefix=os.path.join(parent_directory, 'Data', 'profile'))
     # process_pipeline_images(left_image_folder, right_image_folder, output_folder_distance, object_class=['car', 'bicycle', 'person'])
+    # metrics.write_jsonl(os.path.join(parent_directory, 'Data', 'metrics.jsonl'))
+    # metrics.write_prometheus(os.path.join(parent_directory, 'Data', 'metrics.prom'))
     #
     # ### ---- Convert frames to video
     # frames_to_video(output_folder_distance, output_video_folder, 'output_disparity_4.mp4')
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import Stereo_Vision as sv
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#--- Synthetic stereo pairs with known disparity
+def synthetic_stereo_pair(height=375, width=1242, background_disparity=8, objects=((400, 150, 640, 300, 40),),
+                          seed=0):
+    """
+    Generate a rectified stereo pair of a random-texture scene with known disparity.
+
+    The scene is a textured background plane and textured fronto-parallel rectangles, each
+    shifted horizontally by its own disparity between the left and the right image.
+
+    Args:
+        height (int): Image height in pixels. Defaults to the KITTI resolution.
+        width (int): Image width in pixels.
+        background_disparity (int): Disparity of the background plane in pixels.
+        objects (tuple): (x1, y1, x2, y2, disparity) rectangles in left image coordinates.
+        seed (int): Seed of the random texture.
+
+    Returns:
+        tuple: (left_image, right_image, disparity) with BGR uint8 images and the float32 ground-truth disparity.
+    """
+    rng = np.random.default_rng(seed)
+
+    def texture(texture_height, texture_width):
+        # Blurred noise gives the matchers structure at every scale
+        noise = rng.integers(0, 256, (texture_height, texture_width), dtype=np.uint8)
+        return cv2.GaussianBlur(noise, (3, 3), 0)
+
+    # A point at column x of the left image appears at column x - disparity of the right image
+    background = texture(height, width + background_disparity)
+    left = background[:, :width].copy()
+    right = background[:, background_disparity:background_disparity + width].copy()
+    disparity = np.full((height, width), background_disparity, np.float32)
+
+    for x1, y1, x2, y2, object_disparity in objects:
+        patch = texture(y2 - y1, x2 - x1)
+        left[y1:y2, x1:x2] = patch
+        right[y1:y2, x1 - object_disparity:x2 - object_disparity] = patch
+        disparity[y1:y2, x1:x2] = object_disparity
+
+    return cv2.cvtColor(left, cv2.COLOR_GRAY2BGR), cv2.cvtColor(right, cv2.COLOR_GRAY2BGR), disparity
+
+
+#--- Timing helpers
+def time_stage(function, iterations, warmup=1):
+    """
+    Time a function over several iterations after a few warm-up calls.
+
+    Args:
+        function (callable): Function called without arguments.
+        iterations (int): Number of timed calls.
+        warmup (int): Number of untimed calls.
+
+    Returns:
+        tuple: (statistics dict, result of the last call).
+    """
+    for _ in range(warmup):
+        result = function()
+
+    durations = np.empty(iterations)
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        result = function()
+        durations[iteration] = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(durations, (50, 95, 99)) * 1000
+    statistics = {
+        'iterations': iterations,
+        'mean_ms': float(durations.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'throughput_fps': float(iterations / durations.sum()),
+    }
+    return statistics, result
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of the process in megabytes, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def disparity_error(disparity_map, true_disparity, border=0):
+    """
+    Compare a disparity map with the ground truth on the valid pixels.
+
+    Returns:
+        dict: Mean absolute error, fraction of pixels off by more than 3 px, and valid fraction.
+    """
+    valid = disparity_map > 0
+    if border:
+        valid[:, :border] = False
+    error = np.abs(disparity_map[valid] - true_disparity[valid])
+    return {
+        'mean_abs_error_px': float(error.mean()) if error.size else None,
+        'bad_3px_fraction': float((error > 3).mean()) if error.size else None,
+        'valid_fraction': float(valid.mean()),
+    }
+
+
+#--- Benchmark suite
+def run_benchmark(height=375, width=1242, iterations=20, warmup=2, num_disparities=(64, 96), block_sizes=(5, 11),
+                  matchers=("stereo_bm", "stereo_sgbm", "numpy_bm"), weights_path=None, baseline=0.54, focal_length=721.5,
+                  numpy_cost="sad", numpy_memory_budget=64 * 2**20):
+    """
+    Time every stage of the pipeline on a synthetic stereo pair.
+
+    Args:
+        height (int): Image height in pixels.
+        width (int): Image width in pixels.
+        iterations (int): Number of timed calls per stage.
+        warmup (int): Number of untimed calls per stage.
+        num_disparities (tuple): Disparity ranges benchmarked for every matcher.
+        block_sizes (tuple): Block sizes benchmarked for every matcher.
+        matchers (tuple): Matchers passed to compute_disparity.
+        weights_path (str): Path to the YOLO weights. The detection stage is skipped if None.
+        baseline (float): Baseline used for the depth map in meters.
+        focal_length (float): Focal length used for the depth map in pixels.
+        numpy_cost (str): Matching cost of the "numpy_bm" matcher, "sad" or "census".
+        numpy_memory_budget (int): Cost volume memory budget of the "numpy_bm" matcher in bytes.
+
+    Returns:
+        dict: Benchmark configuration, environment, per-stage statistics and peak RSS.
+    """
+    sv.baseline, sv.focal_length = baseline, focal_length
+    objects = ((width // 3, height // 3, width // 3 + width // 5, height // 3 + height // 3, 40),)
+    left_image, right_image, true_disparity = synthetic_stereo_pair(height, width, objects=objects)
+    bbox_coordinates = [list(box[:4]) for box in objects]
+    stages = {}
+    accuracy = {}
+
+    # Image decode from in-memory PNG files
+    encoded = cv2.imencode('.png', left_image)[1]
+    stages['decode'], _ = time_stage(lambda: cv2.imdecode(encoded, cv2.IMREAD_COLOR), iterations, warmup)
+
+    # Color conversion
+    stages['cvtColor'], _ = time_stage(lambda: cv2.cvtColor(left_image, cv2.COLOR_BGR2GRAY), iterations, warmup)
+
+    # Disparity for every matcher configuration
+    engine = sv.DisparityEngine(numpy_cost=numpy_cost, numpy_memory_budget=numpy_memory_budget)
+    disparity_map = None
+    for matcher in matchers:
+        for disparities in num_disparities:
+            for block_size in block_sizes:
+                label = f"{matcher}:{numpy_cost}" if matcher == "numpy_bm" else matcher
+                name = f"compute_disparity[{label},num_disparities={disparities},block_size={block_size}]"
+                compute = lambda: sv.compute_disparity(left_image, right_image, num_disparities=disparities,
+                                                       block_size=block_size, window_size=block_size,
+                                                       matcher=matcher, show_disparity=False, engine=engine)
+                stages[name], result = time_stage(compute, iterations, warmup)
+                accuracy[name] = disparity_error(result, true_disparity, border=disparities)
+                if disparity_map is None or matcher == "stereo_sgbm":
+                    disparity_map = result
+    engine.close()
+
+    # Depth map; calculate_depth_map modifies the disparity map in place, so each call gets a copy
+    depth = lambda: sv.calculate_depth_map(disparity_map.copy(), baseline, focal_length, show_depth_map=False)
+    stages['calculate_depth_map'], depth_map = time_stage(depth, iterations, warmup)
+
+    # Detection, only with weights since CI machines have neither the weights nor a GPU
+    if weights_path is not None:
+        model = sv.YOLO(weights_path)
+        detect = lambda: sv.get_bounding_box_center_frame(left_image, model, model.names, ['car'], show_output=False)
+        stages['detection'], _ = time_stage(detect, iterations, warmup)
+
+    # Distance rendering, as done by pipeline() and with a reused DistanceRenderer
+    render = lambda: sv.calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False)
+    stages['calculate_distance'], rendered = time_stage(render, iterations, warmup)
+    renderer = sv.DistanceRenderer()
+    render = lambda: sv.calculate_distance(bbox_coordinates, left_image, depth_map, disparity_map, show_output=False,
+                                           renderer=renderer)
+    stages['calculate_distance[renderer]'], _ = time_stage(render, iterations, warmup)
+
+    # Image encoding and writing
+    with tempfile.TemporaryDirectory() as output_folder:
+        output_file = os.path.join(output_folder, 'frame.png')
+        stages['imwrite'], _ = time_stage(lambda: cv2.imwrite(output_file, rendered[0]), iterations, warmup)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'height': height, 'width': width, 'iterations': iterations, 'warmup': warmup,
+            'num_disparities': list(num_disparities), 'block_sizes': list(block_sizes), 'matchers': list(matchers),
+            'numpy_cost': numpy_cost, 'numpy_memory_budget': numpy_memory_budget,
+            'detection': weights_path is not None,
+        },
+        'environment': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+            'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+        },
+        'stages': stages,
+        'disparity_accuracy': accuracy,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the stereo pipeline on synthetic data.")
+    parser.add_argument('--height', type=int, default=375, help="Image height; defaults to the KITTI resolution.")
+    parser.add_argument('--width', type=int, default=1242, help="Image width; defaults to the KITTI resolution.")
+    parser.add_argument('--iterations', type=int, default=20, help="Number of timed calls per stage.")
+    parser.add_argument('--warmup', type=int, default=2, help="Number of untimed calls per stage.")
+    parser.add_argument('--num-disparities', type=int, nargs='+', default=[64, 96], help="Disparity ranges to benchmark.")
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[5, 11], help="Block sizes to benchmark.")
+    parser.add_argument('--matchers', nargs='+', default=['stereo_bm', 'stereo_sgbm', 'numpy_bm'], help="Matchers to benchmark.")
+    parser.add_argument('--numpy-cost', choices=['sad', 'census'], default='sad', help="Matching cost of the numpy_bm matcher.")
+    parser.add_argument('--numpy-memory-mb', type=float, default=64, help="Cost volume memory budget of the numpy_bm matcher in MB.")
+    parser.add_argument('--weights', default=None, help="Path to the YOLO weights; the detection stage is skipped without them.")
+    parser.add_argument('--output', default='benchmark.json', help="JSON file receiving the results.")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    results = run_benchmark(arguments.height, arguments.width, arguments.iterations, arguments.warmup,
+                            tuple(arguments.num_disparities), tuple(arguments.block_sizes), tuple(arguments.matchers),
+                            arguments.weights, numpy_cost=arguments.numpy_cost,
+                            numpy_memory_budget=int(arguments.numpy_memory_mb * 2**20))
+
+    # Print one line per stage
+    for name, statistics in results['stages'].items():
+        print(f"{name:70s} p50 {statistics['p50_ms']:8.2f} ms  p95 {statistics['p95_ms']:8.2f} ms  "
+              f"p99 {statistics['p99_ms']:8.2f} ms  {statistics['throughput_fps']:8.1f} fps")
+    print(f"Peak RSS: {results['peak_rss_mb']} MB")
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved: {arguments.output}")
+
+
+if __name__ == '__main__':
+    main()
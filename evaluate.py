@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import Stereo_Vision as sv
+
+
+#--- Command line evaluation of the pipeline against the KITTI labels
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Evaluate the distances of the stereo pipeline against the KITTI labels.")
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.getcwd()), 'Data'),
+                        help="Data folder containing Left/image_2, Right/image_3, Labels/training and Callibration/training/calib.")
+    parser.add_argument('--weights', default=None, help="Path to the YOLO weights. Defaults to Weights/yolov8m.pt next to the data folder.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--chunksize', type=int, default=16, help="Number of frames sent to a worker at a time.")
+    parser.add_argument('--limit', type=int, default=None, help="Only evaluate the first LIMIT labelled frames.")
+    parser.add_argument('--iou', type=float, default=0.5, help="Minimum IoU between a predicted and a ground-truth box.")
+    parser.add_argument('--classes', nargs='+', default=['car', 'bicycle', 'person'], help="Detector classes of interest.")
+    parser.add_argument('--ground-truth-classes', nargs='+', default=['Car', 'Cyclist', 'Pedestrian'],
+                        help="KITTI classes of the evaluated ground-truth objects.")
+    parser.add_argument('--distance-field', default='median_depth',
+                        help="Box depth statistic used as the predicted distance, e.g. median_depth or center_depth.")
+    parser.add_argument('--output', default=None, help="Optional JSON file receiving the summary.")
+    parser.add_argument('--records', default=None, help="Optional .npy file receiving the per-object records.")
+    parser.add_argument('--frame-cache', default=None,
+                        help="Folder of a frame cache holding the decoded frames; built on the first run.")
+    parser.add_argument('--verbose', action='store_true', help="Print the number of matched objects of every frame.")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    data_folder = arguments.data
+    weights_path = arguments.weights or os.path.join(os.path.dirname(os.path.normpath(data_folder)), 'Weights', 'yolov8m.pt')
+
+    # Index the dataset once
+    dataset = sv.KittiDataset.open(os.path.join(data_folder, 'Left', 'image_2'),
+                                   os.path.join(data_folder, 'Right', 'image_3'),
+                                   os.path.join(data_folder, 'Callibration', 'training', 'calib'),
+                                   os.path.join(data_folder, 'Labels', 'training'),
+                                   manifest_path=os.path.join(data_folder, 'kitti_manifest.json'))
+    frame_ids = [frame_id for frame_id in dataset.frame_ids if dataset.label_path(frame_id) is not None]
+    if arguments.limit is not None:
+        frame_ids = frame_ids[:arguments.limit]
+
+    # Decode the frames once and reuse them in later runs
+    frame_cache = None
+    if arguments.frame_cache is not None:
+        frame_cache = sv.FrameCache.open(dataset.folders['left'], dataset.folders['right'], arguments.frame_cache,
+                                         color=True)
+
+    # The serial path runs the model of this process, the workers load their own
+    if arguments.workers <= 1:
+        sv.model = sv.YOLO(weights_path)
+        sv.names = sv.model.names
+
+    start = time.perf_counter()
+    records, summary, failures = sv.evaluate_dataset(dataset, arguments.classes, arguments.ground_truth_classes,
+                                                     iou_threshold=arguments.iou, frame_ids=frame_ids,
+                                                     num_workers=arguments.workers, chunksize=arguments.chunksize,
+                                                     weights_path=weights_path, verbose=arguments.verbose,
+                                                     frame_cache=frame_cache, distance_field=arguments.distance_field)
+    summary['frames'] = len(frame_ids) - len(failures)
+    summary['failures'] = [{'frame': image_file, 'error': error} for image_file, error in failures]
+    summary['elapsed'] = time.perf_counter() - start
+
+    print(json.dumps(summary, indent=2))
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+    if arguments.records is not None:
+        np.save(arguments.records, records)
+
+
+if __name__ == '__main__':
+    main()
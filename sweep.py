@@ -0,0 +1,342 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import Stereo_Vision as sv
+
+
+#--- Matcher configurations
+def parameter_grid(matchers=("stereo_bm", "stereo_sgbm"), num_disparities=(64, 96, 128), block_sizes=(5, 7, 11, 15),
+                   window_sizes=(3, 5, 7)):
+    """
+    Build every distinct matcher configuration of a parameter grid.
+
+    Block matching ignores the smoothness window, so its configurations are deduplicated with
+    DisparityEngine.matcher_key() and keep the first window size.
+
+    Args:
+        matchers (tuple): Matchers passed to compute_disparity.
+        num_disparities (tuple): Disparity ranges; multiples of 16.
+        block_sizes (tuple): Odd block sizes. Block matching needs at least 5.
+        window_sizes (tuple): SGBM smoothness windows.
+
+    Returns:
+        list: Configuration dicts with matcher, num_disparities, block_size and window_size.
+    """
+    configurations = []
+    seen = set()
+    for matcher, disparities, block_size, window_size in itertools.product(matchers, num_disparities, block_sizes,
+                                                                           window_sizes):
+        if matcher == "stereo_bm" and block_size < 5:
+            continue
+        key = sv.DisparityEngine.matcher_key(disparities, block_size, window_size, matcher)
+        if key in seen:
+            continue
+        seen.add(key)
+        configurations.append({'matcher': matcher, 'num_disparities': disparities, 'block_size': block_size,
+                               'window_size': window_size})
+    return configurations
+
+
+def sample_configurations(configurations, num_samples, seed=0):
+    """
+    Draw a random subset of the configurations without replacement.
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(len(configurations), size=min(num_samples, len(configurations)), replace=False)
+    return [configurations[index] for index in sorted(indices)]
+
+
+def configuration_name(configuration):
+    if configuration['matcher'] == "stereo_bm":
+        return f"stereo_bm[num_disparities={configuration['num_disparities']},block_size={configuration['block_size']}]"
+    return (f"{configuration['matcher']}[num_disparities={configuration['num_disparities']},"
+            f"block_size={configuration['block_size']},window_size={configuration['window_size']}]")
+
+
+#--- Ground truth of the swept frames
+def load_ground_truth(dataset, frame_ids, ground_truth_classes):
+    """
+    Read the ground-truth boxes, distances and calibration of every frame once.
+
+    Args:
+        dataset (KittiDataset): Dataset with labels and calibration files.
+        frame_ids (list): Frames of the sweep.
+        ground_truth_classes (tuple): KITTI classes of the evaluated objects.
+
+    Returns:
+        dict: Per frame, a (baseline, focal_length, boxes, distances) tuple with Nx4 float32 boxes
+            and N float32 depths as returned by ground_truth_bbox.
+    """
+    ground_truth = {}
+    for frame_id in frame_ids:
+        with open(dataset.label_path(frame_id), 'r') as file:
+            objects = sv.ground_truth_bbox(file.read(), ground_truth_classes)
+        calibration = sv.CalibrationStore.parse_file(dataset.calibration_path(frame_id))
+        boxes = np.array([bbox for bbox, _ in objects], np.float32).reshape(-1, 4)
+        distances = np.array([distance for _, distance in objects], np.float32)
+        ground_truth[frame_id] = (calibration['baseline'], calibration['fx'], boxes, distances)
+    return ground_truth
+
+
+#--- Per-frame evaluation of a configuration
+def _evaluate_configuration_frame(task, frame_cache_path, distance_field, max_depth):
+    configuration_index, configuration, frame_id, frame_baseline, frame_focal_length, boxes, true_distances = task
+
+    # The decoded grayscale frames are shared by every configuration through the memory map
+    left_gray, right_gray = sv.get_frame_cache(frame_cache_path).gray_pair(frame_id)
+
+    start = time.perf_counter()
+    raw_disparity = sv.get_disparity_engine().compute_raw(left_gray, right_gray, **configuration)
+    runtime = time.perf_counter() - start
+
+    # Distance of every ground-truth box, with 0 m when the box has no valid depth
+    depth_map, valid_mask = sv.calculate_depth_map_raw(raw_disparity, frame_baseline, frame_focal_length,
+                                                       configuration['num_disparities'])
+    stats = sv.BoxDepthStatistics(depth_map, valid_mask, max_depth=max_depth).query(boxes.astype(np.int64))
+    predicted_distances = np.nan_to_num(stats[distance_field], nan=0.0)
+    return configuration_index, runtime, true_distances, predicted_distances
+
+
+def evaluate_configurations(configurations, ground_truth, frame_ids, frame_cache, distance_field="median_depth",
+                            max_depth=80.0, num_workers=1, chunksize=4):
+    """
+    Evaluate configurations on frames, spreading the (configuration, frame) pairs over a process pool.
+
+    Args:
+        configurations (list): Configuration dicts.
+        ground_truth (dict): Output of load_ground_truth.
+        frame_ids (list): Frames to evaluate every configuration on.
+        frame_cache (FrameCache): Cache holding the decoded grayscale frames.
+        distance_field (str): Field of BOX_STATS_DTYPE used as the predicted distance.
+        max_depth (float): Farthest depth counted as valid.
+        num_workers (int): Number of worker processes.
+        chunksize (int): Number of pairs sent to a worker at a time.
+
+    Returns:
+        tuple: (per-configuration list of (runtimes, true distances, predicted distances) arrays, failures).
+    """
+    tasks = [(index, configuration, frame_id) + ground_truth[frame_id]
+             for index, configuration in enumerate(configurations) for frame_id in frame_ids]
+
+    # Workers only need their own single-threaded disparity engine
+    outputs = []
+    failures = sv.run_folder_batch(_evaluate_configuration_frame, tasks,
+                                   args=(frame_cache.cache_path, distance_field, max_depth),
+                                   message=None, num_workers=num_workers, chunksize=chunksize, outputs=outputs)
+
+    results = [([], [], []) for _ in configurations]
+    for _, (index, runtime, true_distances, predicted_distances) in outputs:
+        results[index][0].append(runtime)
+        results[index][1].append(true_distances)
+        results[index][2].append(predicted_distances)
+    results = [(np.array(runtimes), np.concatenate(true_distances or [np.zeros(0, np.float32)]),
+                np.concatenate(predicted_distances or [np.zeros(0, np.float32)]))
+               for runtimes, true_distances, predicted_distances in results]
+    return results, [((task[0], task[2]), error) for task, error in failures]
+
+
+def score_configuration(runtimes, true_distances, predicted_distances):
+    """
+    Summarize the distance errors and runtime of a configuration.
+
+    Objects without a valid depth count as predicted at 0 m, so sparse disparity maps are not
+    rewarded for only answering on easy objects.
+
+    Returns:
+        dict: Object and frame counts, error statistics in meters and runtime statistics in milliseconds.
+    """
+    error = np.abs(predicted_distances - true_distances)
+    relative_error = error / np.maximum(true_distances, 1e-6)
+    has_objects = len(error) > 0
+    return {
+        'frames': len(runtimes),
+        'objects': len(error),
+        'valid_fraction': float((predicted_distances > 0).mean()) if has_objects else None,
+        'abs_error': float(error.mean()) if has_objects else None,
+        'median_abs_error': float(np.median(error)) if has_objects else None,
+        'rel_error': float(relative_error.mean()) if has_objects else None,
+        'rmse': float(np.sqrt((error ** 2).mean())) if has_objects else None,
+        'runtime_ms': float(runtimes.mean() * 1000) if len(runtimes) else None,
+        'runtime_p95_ms': float(np.percentile(runtimes, 95) * 1000) if len(runtimes) else None,
+    }
+
+
+def pareto_front(scores, error_key="abs_error", runtime_key="runtime_ms"):
+    """
+    Find the configurations that no other configuration beats on both error and runtime.
+
+    Args:
+        scores (list): Score dicts of score_configuration; entries with missing values are ignored.
+
+    Returns:
+        list: Indices of the Pareto-optimal scores, fastest first.
+    """
+    candidates = [index for index, score in enumerate(scores)
+                  if score.get(error_key) is not None and score.get(runtime_key) is not None]
+    candidates.sort(key=lambda index: (scores[index][runtime_key], scores[index][error_key]))
+
+    # Walking from the fastest configuration, keep every one that lowers the best error so far
+    front = []
+    best_error = np.inf
+    for index in candidates:
+        if scores[index][error_key] < best_error:
+            front.append(index)
+            best_error = scores[index][error_key]
+    return front
+
+
+#--- Search strategies
+def run_sweep(configurations, ground_truth, frame_ids, frame_cache, strategy="grid", eta=3, min_frames=None,
+              metric="abs_error", **evaluate_args):
+    """
+    Evaluate configurations with a full sweep or successive halving.
+
+    Successive halving evaluates every configuration on a small frame budget, keeps the best
+    1/eta by the metric, and repeats with eta times more frames until one rung uses every frame.
+    Frames are added incrementally, so a surviving configuration is never evaluated twice on
+    the same frame.
+
+    Args:
+        configurations (list): Configuration dicts, e.g. from parameter_grid or sample_configurations.
+        ground_truth (dict): Output of load_ground_truth.
+        frame_ids (list): Frames of the sweep.
+        frame_cache (FrameCache): Cache holding the decoded grayscale frames.
+        strategy (str): "grid" to evaluate every configuration on every frame, or "halving".
+        eta (int): Reduction factor of successive halving.
+        min_frames (int): Frame budget of the first rung. Defaults to the number of frames
+            divided by eta once per elimination round.
+        metric (str): Score field minimized when eliminating configurations.
+        **evaluate_args: Arguments forwarded to evaluate_configurations.
+
+    Returns:
+        tuple: (list of result dicts with the configuration, its name and score, failures).
+    """
+    if strategy == "grid":
+        rungs = [len(frame_ids)]
+    elif strategy == "halving":
+        num_rounds = max(int(math.ceil(math.log(max(len(configurations), 1), eta))), 0)
+        if min_frames is None:
+            min_frames = max(1, len(frame_ids) // eta ** num_rounds)
+        rungs = [min_frames * eta ** rung for rung in range(num_rounds) if min_frames * eta ** rung < len(frame_ids)]
+        rungs.append(len(frame_ids))
+    else:
+        raise ValueError(f"Unknown strategy: {strategy}")
+
+    accumulated = [(np.zeros(0), np.zeros(0, np.float32), np.zeros(0, np.float32)) for _ in configurations]
+    scores = [None] * len(configurations)
+    survivors = list(range(len(configurations)))
+    failures = []
+    evaluated_frames = 0
+
+    for rung, budget in enumerate(rungs):
+        new_frames = frame_ids[evaluated_frames:budget]
+        if new_frames:
+            results, rung_failures = evaluate_configurations([configurations[index] for index in survivors],
+                                                             ground_truth, new_frames, frame_cache, **evaluate_args)
+            failures += [((survivors[position], frame_id), error) for (position, frame_id), error in rung_failures]
+            for position, index in enumerate(survivors):
+                accumulated[index] = tuple(np.concatenate([old, new])
+                                           for old, new in zip(accumulated[index], results[position]))
+                scores[index] = score_configuration(*accumulated[index])
+            evaluated_frames = budget
+        print(f"Rung {rung}: {len(survivors)} configurations on {evaluated_frames} frames")
+
+        if rung < len(rungs) - 1:
+            # Keep the best configurations for the next rung
+            keep = max(1, len(survivors) // eta)
+            survivors = sorted(survivors, key=lambda index: (scores[index][metric] is None,
+                                                            scores[index][metric] or 0.0))[:keep]
+
+    results = [{'name': configuration_name(configuration), 'configuration': configuration, 'score': score}
+               for configuration, score in zip(configurations, scores) if score is not None]
+    return results, failures
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Sweep the stereo matcher parameters against the KITTI labels.")
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.getcwd()), 'Data'),
+                        help="Data folder containing Left/image_2, Right/image_3, Labels/training and Callibration/training/calib.")
+    parser.add_argument('--strategy', choices=['grid', 'random', 'halving'], default='grid',
+                        help="Evaluate the whole grid, a random subset of it, or successive halving over it.")
+    parser.add_argument('--samples', type=int, default=16, help="Number of configurations drawn by the random strategy.")
+    parser.add_argument('--eta', type=int, default=3, help="Reduction factor of successive halving.")
+    parser.add_argument('--min-frames', type=int, default=None, help="Frame budget of the first successive-halving rung.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random strategy.")
+    parser.add_argument('--matchers', nargs='+', default=['stereo_bm', 'stereo_sgbm'], help="Matchers to sweep.")
+    parser.add_argument('--num-disparities', type=int, nargs='+', default=[64, 96, 128], help="Disparity ranges to sweep.")
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[5, 7, 11, 15], help="Block sizes to sweep.")
+    parser.add_argument('--window-sizes', type=int, nargs='+', default=[3, 5, 7], help="SGBM smoothness windows to sweep.")
+    parser.add_argument('--limit', type=int, default=50, help="Number of labelled frames in the sweep.")
+    parser.add_argument('--ground-truth-classes', nargs='+', default=['Car', 'Cyclist', 'Pedestrian'],
+                        help="KITTI classes of the evaluated ground-truth objects.")
+    parser.add_argument('--distance-field', default='median_depth',
+                        help="Box depth statistic compared with the ground truth, e.g. center_depth or median_depth.")
+    parser.add_argument('--metric', default='abs_error', help="Score field used to rank configurations.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--chunksize', type=int, default=4, help="Number of (configuration, frame) pairs sent to a worker at a time.")
+    parser.add_argument('--frame-cache', default=None,
+                        help="Folder of the frame cache holding the decoded frames. Defaults to frame_cache next to the left images.")
+    parser.add_argument('--output', default='sweep.json', help="JSON file receiving the results.")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    data_folder = arguments.data
+
+    # Index the dataset and decode the frames once for every configuration and worker
+    dataset = sv.KittiDataset.open(os.path.join(data_folder, 'Left', 'image_2'),
+                                   os.path.join(data_folder, 'Right', 'image_3'),
+                                   os.path.join(data_folder, 'Callibration', 'training', 'calib'),
+                                   os.path.join(data_folder, 'Labels', 'training'),
+                                   manifest_path=os.path.join(data_folder, 'kitti_manifest.json'))
+    frame_ids = [frame_id for frame_id in dataset.frame_ids
+                 if dataset.label_path(frame_id) is not None and dataset.calibration_path(frame_id) is not None]
+    frame_ids = frame_ids[:arguments.limit]
+    frame_cache = sv.FrameCache.open(dataset.folders['left'], dataset.folders['right'], arguments.frame_cache)
+    ground_truth = load_ground_truth(dataset, frame_ids, arguments.ground_truth_classes)
+
+    configurations = parameter_grid(tuple(arguments.matchers), tuple(arguments.num_disparities),
+                                    tuple(arguments.block_sizes), tuple(arguments.window_sizes))
+    if arguments.strategy == 'random':
+        configurations = sample_configurations(configurations, arguments.samples, arguments.seed)
+
+    start = time.perf_counter()
+    results, failures = run_sweep(configurations, ground_truth, frame_ids, frame_cache,
+                                  strategy='halving' if arguments.strategy == 'halving' else 'grid',
+                                  eta=arguments.eta, min_frames=arguments.min_frames, metric=arguments.metric,
+                                  distance_field=arguments.distance_field, num_workers=arguments.workers,
+                                  chunksize=arguments.chunksize)
+    elapsed = time.perf_counter() - start
+
+    # Only configurations evaluated on every frame compete for the Pareto front
+    complete = [result for result in results if result['score']['frames'] == len(frame_ids)]
+    front = [complete[index]['name'] for index in pareto_front([result['score'] for result in complete],
+                                                               error_key=arguments.metric)]
+
+    # Print one line per configuration, best first
+    for result in sorted(results, key=lambda result: (result['score'][arguments.metric] is None,
+                                                      result['score'][arguments.metric] or 0.0)):
+        score = result['score']
+        marker = '*' if result['name'] in front else ' '
+        print(f"{marker} {result['name']:70s} {arguments.metric} {score[arguments.metric] or float('nan'):7.3f}  "
+              f"valid {score['valid_fraction'] or 0.0:5.2f}  {score['runtime_ms']:8.2f} ms  ({score['frames']} frames)")
+    print(f"Pareto front (*): {front}")
+
+    with open(arguments.output, 'w') as file:
+        json.dump({'strategy': arguments.strategy, 'frames': frame_ids, 'elapsed': elapsed,
+                   'distance_field': arguments.distance_field, 'metric': arguments.metric,
+                   'results': results, 'pareto_front': front,
+                   'failures': [{'task': list(task), 'error': error} for task, error in failures]},
+                  file, indent=2)
+    print(f"Results saved: {arguments.output}")
+
+
+if __name__ == '__main__':
+    main()
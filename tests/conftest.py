@@ -0,0 +1,75 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_stereo_pair(height=200, width=320, background_disparity=6, objects=((120, 40, 200, 120, 24),
+                                                                             (220, 110, 300, 180, 14)), seed=0):
+    """
+    Build a rectified BGR stereo pair of textured fronto-parallel planes with known disparity.
+    """
+    rng = np.random.default_rng(seed)
+
+    def texture(texture_height, texture_width):
+        noise = rng.integers(0, 256, (texture_height, texture_width), dtype=np.uint8)
+        return cv2.GaussianBlur(noise, (3, 3), 0)
+
+    # A point at column x of the left image appears at column x - disparity of the right image
+    background = texture(height, width + background_disparity)
+    left = background[:, :width].copy()
+    right = background[:, background_disparity:background_disparity + width].copy()
+    disparity = np.full((height, width), background_disparity, np.float32)
+    for x1, y1, x2, y2, object_disparity in objects:
+        patch = texture(y2 - y1, x2 - x1)
+        left[y1:y2, x1:x2] = patch
+        right[y1:y2, x1 - object_disparity:x2 - object_disparity] = patch
+        disparity[y1:y2, x1:x2] = object_disparity
+
+    return cv2.cvtColor(left, cv2.COLOR_GRAY2BGR), cv2.cvtColor(right, cv2.COLOR_GRAY2BGR), disparity
+
+
+@pytest.fixture(scope="session")
+def stereo_pair():
+    return make_stereo_pair()
+
+
+@pytest.fixture(scope="session")
+def image_folders(tmp_path_factory):
+    """
+    Left and right image folders of a short synthetic sequence, as (left_folder, right_folder, image_files).
+    """
+    root = tmp_path_factory.mktemp("images")
+    left_folder, right_folder = root / "left", root / "right"
+    left_folder.mkdir()
+    right_folder.mkdir()
+    image_files = []
+    for index in range(4):
+        left, right, _ = make_stereo_pair(objects=((100 + 10 * index, 40, 180 + 10 * index, 120, 24),), seed=index)
+        image_file = f"{index:06d}.png"
+        cv2.imwrite(str(left_folder / image_file), left)
+        cv2.imwrite(str(right_folder / image_file), right)
+        image_files.append(image_file)
+    return str(left_folder), str(right_folder), image_files
+
+
+def calibration_text(baseline=0.54, focal_length=721.5377, cx=609.5593, cy=172.854):
+    """
+    Contents of a KITTI object calibration file of a rectified rig with the given geometry.
+    """
+    def row(values):
+        return " ".join(f"{value:.12e}" for value in np.ravel(values))
+
+    camera = np.array([[focal_length, 0, cx], [0, focal_length, cy], [0, 0, 1]])
+    p_left = np.column_stack([camera, [0.06 * focal_length, 0, 0]])
+    p_right = np.column_stack([camera, [(0.06 - baseline) * focal_length, 0, 0]])
+    velo_to_cam = np.array([[0, -1, 0, 0], [0, 0, -1, -0.08], [1, 0, 0, -0.27]])
+    return "\n".join([f"P0: {row(np.column_stack([camera, np.zeros(3)]))}",
+                      f"P1: {row(np.column_stack([camera, [-baseline * focal_length, 0, 0]]))}",
+                      f"P2: {row(p_left)}", f"P3: {row(p_right)}", f"R0_rect: {row(np.eye(3))}",
+                      f"Tr_velo_to_cam: {row(velo_to_cam)}", f"Tr_imu_to_velo: {row(np.eye(3, 4))}", ""])
@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+
+import benchmark
+import Stereo_Vision as sv
+
+
+def test_synthetic_pair_follows_its_disparity():
+    left, right, disparity = benchmark.synthetic_stereo_pair(height=60, width=160, background_disparity=4,
+                                                             objects=((60, 10, 100, 50, 20),))
+    assert left.shape == right.shape == (60, 160, 3)
+    # The object and the background rows above it reappear in the right image shifted by their disparity
+    for rows, columns in ((slice(10, 50), np.arange(60, 100)), (slice(0, 10), np.arange(4, 160))):
+        shifted = columns - disparity[rows, columns].astype(int)
+        np.testing.assert_array_equal(right[rows][:, shifted[0]], left[rows][:, columns])
+    assert np.all(disparity[10:50, 60:100] == 20) and np.count_nonzero(disparity == 4) == 60 * 160 - 40 * 40
+
+
+def test_disparity_error_uses_the_valid_pixels():
+    true_disparity = np.full((4, 6), 10, np.float32)
+    disparity_map = true_disparity.copy()
+    disparity_map[0] = -1
+    disparity_map[1, :3] = 15
+    error = benchmark.disparity_error(disparity_map, true_disparity, border=1)
+    assert error['valid_fraction'] == pytest.approx(15 / 24)
+    assert error['mean_abs_error_px'] == pytest.approx(2 * 5 / 15)
+    assert error['bad_3px_fraction'] == pytest.approx(2 / 15)
+
+
+def test_benchmark_reports_every_stage(monkeypatch):
+    monkeypatch.setattr(sv, "baseline", None, raising=False)
+    monkeypatch.setattr(sv, "focal_length", None, raising=False)
+    results = benchmark.run_benchmark(height=60, width=160, iterations=2, warmup=1, num_disparities=(16,),
+                                      block_sizes=(5,), matchers=("stereo_bm",))
+    name = "compute_disparity[stereo_bm,num_disparities=16,block_size=5]"
+    assert set(results['stages']) == {'decode', 'cvtColor', name, 'calculate_depth_map', 'calculate_distance',
+                                      'calculate_distance[renderer]', 'imwrite'}
+    for statistics in results['stages'].values():
+        assert statistics['iterations'] == 2
+        assert 0 <= statistics['p50_ms'] <= statistics['p95_ms'] <= statistics['p99_ms']
+    assert name in results['disparity_accuracy']
+    json.dumps(results)
@@ -0,0 +1,1015 @@
+import concurrent.futures
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+
+import Stereo_Vision as sv
+from conftest import calibration_text, make_stereo_pair
+
+# Boxes of the two objects of the synthetic stereo pair
+BOXES = [[120, 40, 200, 120], [220, 110, 300, 180]]
+
+
+def gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+#--- Disparity engine
+@pytest.mark.parametrize("matcher", ["stereo_bm", "numpy_bm"])
+def test_banding_is_bit_exact(stereo_pair, matcher):
+    left, right, _ = stereo_pair
+    params = dict(num_disparities=64, block_size=11, matcher=matcher)
+    with sv.DisparityEngine(num_threads=1) as engine:
+        expected = engine.compute_raw(gray(left), gray(right), **params)
+    with sv.DisparityEngine(num_threads=4, min_band_rows=32) as engine:
+        banded = engine.compute_raw(gray(left), gray(right), **params)
+    assert banded.dtype == np.int16
+    np.testing.assert_array_equal(banded, expected)
+
+
+def test_pooled_sgbm_matches_a_fresh_matcher(stereo_pair):
+    left, right, _ = stereo_pair
+    stereo = cv2.StereoSGBM_create(minDisparity=0, numDisparities=64, blockSize=5, P1=8 * 3 * 5 ** 2,
+                                   P2=32 * 3 * 5 ** 2, mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+    expected = stereo.compute(gray(left), gray(right)).astype(np.float32) / 16
+    with sv.DisparityEngine(num_threads=4) as engine:
+        for _ in range(2):
+            disparity = sv.compute_disparity(left, right, num_disparities=64, block_size=5, window_size=5,
+                                             show_disparity=False, engine=engine)
+            np.testing.assert_array_equal(disparity, expected)
+
+
+def test_compute_many_matches_compute(stereo_pair):
+    left, right, _ = stereo_pair
+    pairs = [(left, right), (right[:, ::-1].copy(), left[:, ::-1].copy())]
+    params = dict(num_disparities=64, block_size=5, window_size=5)
+    with sv.DisparityEngine(num_threads=2) as engine:
+        many = engine.compute_many(pairs, **params)
+        for (left_image, right_image), disparity in zip(pairs, many):
+            np.testing.assert_array_equal(disparity, engine.compute(left_image, right_image, **params))
+
+
+
+
+@pytest.mark.parametrize("cost", ["sad", "census"])
+def test_numpy_bm_does_not_depend_on_the_memory_budget(stereo_pair, cost):
+    left, right, _ = stereo_pair
+    params = dict(num_disparities=64, block_size=11, matcher="numpy_bm")
+    with sv.DisparityEngine(num_threads=1, numpy_cost=cost) as engine:
+        expected = engine.compute_raw(gray(left), gray(right), **params)
+    with sv.DisparityEngine(num_threads=1, numpy_cost=cost, numpy_memory_budget=1) as engine:
+        chunked = engine.compute_raw(gray(left), gray(right), **params)
+    np.testing.assert_array_equal(chunked, expected)
+
+
+def test_numpy_bm_finds_the_true_disparity(stereo_pair):
+    left, right, disparity = stereo_pair
+    with sv.DisparityEngine(num_threads=1) as engine:
+        computed = engine.compute_raw(gray(left), gray(right), num_disparities=64, block_size=11,
+                                      matcher="numpy_bm").astype(np.float32) / 16
+    for x1, y1, x2, y2 in BOXES:
+        inner = (slice(y1 + 8, y2 - 8), slice(x1 + 8, x2 - 8))
+        assert np.median(np.abs(computed[inner] - disparity[inner])) < 0.5
+
+@pytest.mark.parametrize("matcher", ["stereo_bm", "numpy_bm"])
+def test_roi_disparity_matches_the_full_frame(stereo_pair, matcher):
+    left, right, _ = stereo_pair
+    params = dict(num_disparities=64, block_size=11, matcher=matcher)
+    with sv.DisparityEngine(num_threads=1) as engine:
+        expected = engine.compute_raw(gray(left), gray(right), **params)
+        roi = sv.compute_disparity_roi(left, right, BOXES, engine=engine, raw=True, **params)
+    inside = np.zeros(roi.shape, bool)
+    for x1, y1, x2, y2 in BOXES:
+        inside[y1:y2, x1:x2] = True
+    np.testing.assert_array_equal(roi[inside], expected[inside])
+    assert np.all(roi[~inside] == -16)
+
+#--- Batch processing of image folders
+def test_process_pool_matches_serial_run(image_folders, tmp_path):
+    left_folder, right_folder, image_files = image_folders
+    outputs = {}
+    for num_workers in (1, 2):
+        output_folder = tmp_path / f"workers_{num_workers}"
+        output_folder.mkdir()
+        failures = sv.save_disparity_maps(left_folder, right_folder, str(output_folder), num_workers=num_workers,
+                                          chunksize=1)
+        assert failures == []
+        outputs[num_workers] = {name: cv2.imread(str(output_folder / name)) for name in image_files}
+
+    for name in image_files:
+        np.testing.assert_array_equal(outputs[2][name], outputs[1][name])
+
+
+def test_batch_reports_failures_and_continues(image_folders, tmp_path):
+    left_folder, right_folder, image_files = image_folders
+
+    def task(image_file, output_folder):
+        if image_file == image_files[1]:
+            raise IOError("unreadable")
+        return os.path.join(output_folder, image_file)
+
+    failures = sv.run_folder_batch(task, image_files, args=(str(tmp_path),))
+    assert failures == [(image_files[1], "OSError: unreadable")]
+
+
+def test_pipeline_workers_require_weights(image_folders, tmp_path):
+    left_folder, right_folder, _ = image_folders
+    with pytest.raises(ValueError, match="weights_path"):
+        sv.process_pipeline_images(left_folder, right_folder, str(tmp_path), num_workers=2)
+
+
+#--- Streaming pipeline
+def fake_pipeline(left_image, right_image, object_class):
+    return cv2.absdiff(left_image, right_image), left_image, right_image
+
+
+def test_streaming_pipeline_writes_every_frame_in_order(image_folders, tmp_path, monkeypatch):
+    left_folder, right_folder, image_files = image_folders
+    monkeypatch.setattr(sv, "pipeline", fake_pipeline)
+    missing = "999999.png"
+
+    stream = sv.StreamingPipeline(left_folder, right_folder, str(tmp_path), image_files=image_files + [missing],
+                                  prefetch=2, write_queue_size=1)
+    yielded = [image_file for image_file, *_ in stream.run()]
+
+    assert yielded == image_files
+    assert [image_file for image_file, _ in stream.failures] == [missing]
+    for image_file in image_files:
+        left_image = cv2.imread(os.path.join(left_folder, image_file))
+        right_image = cv2.imread(os.path.join(right_folder, image_file))
+        np.testing.assert_array_equal(cv2.imread(str(tmp_path / image_file)), cv2.absdiff(left_image, right_image))
+    stats = stream.stats()
+    assert stats['frames_written'] == len(image_files)
+    assert stats['read_queue_depth_max'] <= 2 and stats['write_queue_depth_max'] <= 1
+
+
+#--- Detection
+NAMES = {0: 'person', 1: 'bicycle', 2: 'car'}
+DETECTIONS = np.array([[120, 40, 200, 120, 0.9, 2], [220, 110, 300, 180, 0.4, 2], [10, 10, 60, 90, 0.8, 0],
+                       [30, 20, 90, 100, 0.7, 1]], np.float32)
+
+
+class FakeDetector:
+    """
+    Stand-in for the YOLO model that returns fixed detections and counts its calls.
+    """
+
+    class Result:
+        def __init__(self, data):
+            self.boxes = type("Boxes", (), {"data": data})()
+
+    def __init__(self, detections=DETECTIONS):
+        self.detections = detections
+        self.names = NAMES
+        self.calls = 0
+
+    def __call__(self, frames, verbose=True):
+        self.calls += 1
+        frames = frames if isinstance(frames, list) else [frames]
+        return [self.Result(self.detections.copy()) for _ in frames]
+
+
+def test_filter_boxes_matches_a_loop():
+    class_ids = sv.get_class_ids(NAMES, ['car', 'bicycle'])
+    expected = [box for box in DETECTIONS.tolist() if NAMES[int(box[5])] in ('car', 'bicycle') and box[4] > 0.5]
+    np.testing.assert_array_equal(sv.filter_boxes(DETECTIONS, class_ids), np.array(expected, np.float32))
+
+
+def test_batched_detection_calls_the_model_once_per_batch(stereo_pair):
+    left, _, _ = stereo_pair
+    detector = FakeDetector()
+    boxes = sv.get_bounding_boxes_batch([left] * 5, detector, NAMES, ['car'], batch_size=2)
+    assert detector.calls == 3
+    assert len(boxes) == 5
+    for frame_boxes in boxes:
+        np.testing.assert_array_equal(frame_boxes, DETECTIONS[:1])
+
+    bbox_coordinates = sv.get_bounding_box_center_frame(left, detector, NAMES, ['car', 'person'], show_output=False)
+    assert bbox_coordinates == [[120, 40, 200, 120], [10, 10, 60, 90]]
+
+
+#--- Dataset index
+def test_dataset_index_reuses_its_manifest(tmp_path, monkeypatch):
+    folders = {kind: tmp_path / kind for kind in ("left", "right", "calib", "label")}
+    for folder in folders.values():
+        folder.mkdir()
+    for frame_id in ("000002", "000000", "000001"):
+        (folders["left"] / f"{frame_id}.png").write_bytes(b"")
+        (folders["calib"] / f"{frame_id}.txt").write_text("")
+    for frame_id in ("000000", "000002"):
+        (folders["right"] / f"{frame_id}.png").write_bytes(b"")
+    (folders["label"] / "000002.txt").write_text("")
+    paths = [str(folders[kind]) for kind in ("left", "right", "calib", "label")]
+    manifest_path = str(tmp_path / "manifest.json")
+
+    dataset = sv.KittiDataset.open(*paths, manifest_path=manifest_path)
+    assert dataset.frame_ids == ["000000", "000002"]
+    assert dataset.index_of("000002") == 1
+    assert dataset.label_path("000000") is None
+    assert dataset.right_image_path("000002") == os.path.join(paths[1], "000002.png")
+
+    # An unchanged folder structure is read from the manifest without listing the folders
+    with monkeypatch.context() as patch:
+        patch.setattr(sv.KittiDataset, "_list_folder", staticmethod(lambda *args: pytest.fail("folder listed")))
+        reopened = sv.KittiDataset.open(*paths, manifest_path=manifest_path)
+    assert reopened.frame_ids == dataset.frame_ids
+    assert reopened.calibration_path("000002") == dataset.calibration_path("000002")
+
+    # Adding a file invalidates the manifest
+    (folders["right"] / "000001.png").write_bytes(b"")
+    assert sv.KittiDataset.open(*paths, manifest_path=manifest_path).frame_ids == ["000000", "000001", "000002"]
+
+
+#--- Calibration store
+
+def test_calibration_store_matches_the_files_and_follows_changes(tmp_path):
+    calibration_folder = tmp_path / "calib"
+    calibration_folder.mkdir()
+    for index in range(4):
+        (calibration_folder / f"{index:06d}.txt").write_text(calibration_text(baseline=0.5 + 0.01 * index))
+    store_path = str(tmp_path / "calibration.npz")
+
+    store = sv.CalibrationStore.open(str(calibration_folder), store_path)
+    assert len(store) == 4 and "000003" in store
+    calibration = store.get("000002")
+    expected = sv.CalibrationStore.parse_file(str(calibration_folder / "000002.txt"))
+    for field in sv.Calibration._fields:
+        np.testing.assert_allclose(getattr(calibration, field), expected[field], rtol=1e-6)
+    assert calibration.baseline == pytest.approx(0.52, rel=1e-5)
+    assert calibration.fx == pytest.approx(721.5377, rel=1e-6)
+
+    # Modified, added and removed files are picked up when the store is reopened
+    changed = calibration_folder / "000001.txt"
+    changed.write_text(calibration_text(baseline=0.7))
+    os.utime(changed, ns=(os.stat(changed).st_mtime_ns + 10**9,) * 2)
+    (calibration_folder / "000004.txt").write_text(calibration_text(baseline=0.8))
+    os.remove(calibration_folder / "000000.txt")
+    reopened = sv.CalibrationStore.open(str(calibration_folder), store_path)
+    assert reopened.frame_ids == ["000001", "000002", "000003", "000004"]
+    assert reopened.get("000001").baseline == pytest.approx(0.7, rel=1e-5)
+    assert reopened.get("000004").baseline == pytest.approx(0.8, rel=1e-5)
+    assert reopened.get("000003").baseline == pytest.approx(0.53, rel=1e-5)
+
+
+
+def test_calibration_store_reopens_unchanged_files_without_parsing(tmp_path, monkeypatch):
+    calibration_folder = tmp_path / "calib"
+    calibration_folder.mkdir()
+    for index in range(50):
+        (calibration_folder / f"{index:06d}.txt").write_text(calibration_text(baseline=0.5 + 0.001 * index))
+    store_path = str(tmp_path / "calibration.npz")
+    store = sv.CalibrationStore.open(str(calibration_folder), store_path)
+
+    def parse_file(file_path):
+        raise AssertionError(f"{file_path} was parsed again")
+
+    monkeypatch.setattr(sv.CalibrationStore, "parse_file", staticmethod(parse_file))
+    reopened = sv.CalibrationStore.open(str(calibration_folder), store_path)
+    assert reopened.frame_ids == store.frame_ids
+    for frame_id in ("000000", "000025", "000049"):
+        for field in sv.Calibration._fields:
+            np.testing.assert_array_equal(getattr(reopened.get(frame_id), field), getattr(store.get(frame_id), field))
+
+#--- Lookup-table depth
+def test_lut_depth_matches_the_division_and_masks_invalid_pixels(stereo_pair):
+    left, right, _ = stereo_pair
+    raw = sv.compute_disparity(left, right, num_disparities=64, block_size=5, window_size=5, show_disparity=False,
+                               raw=True)
+    assert raw.dtype == np.int16 and (raw <= 0).any()
+
+    out, valid_mask = np.empty(raw.shape, np.float32), np.empty(raw.shape, bool)
+    depth_map, mask = sv.calculate_depth_map_raw(raw, 0.54, 721.5, 64, out=out, valid_mask=valid_mask)
+    assert depth_map is out and mask is valid_mask
+    np.testing.assert_array_equal(valid_mask, raw > 0)
+    np.testing.assert_allclose(depth_map[valid_mask], 721.5 * 0.54 / (raw[valid_mask] / 16.0), rtol=1e-6)
+    assert np.all(depth_map[~valid_mask] == 0)
+
+
+
+def test_shared_lut_is_consistent_across_threads(stereo_pair, monkeypatch):
+    left, right, _ = stereo_pair
+    raw = sv.compute_disparity(left, right, num_disparities=64, block_size=5, window_size=5, show_disparity=False,
+                               raw=True)
+    frames = [np.roll(raw, shift, axis=1) for shift in range(8)]
+    lut = sv.get_depth_lut(0.54, 721.5, 64)
+    expected = [lut.compute(frame)[0] for frame in frames]
+
+    def convert(frame):
+        # Each thread owns its buffers, including the index scratch buffer
+        out, valid_mask, index_out = (np.empty(raw.shape, np.float32), np.empty(raw.shape, bool),
+                                      np.empty(raw.shape, np.int32))
+        return [lut.compute(frame, out=out, valid_mask=valid_mask, index_out=index_out)[0].copy()
+                for _ in range(20)]
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        for depth_maps, depth_map in zip(executor.map(convert, frames), expected):
+            for result in depth_maps:
+                np.testing.assert_array_equal(result, depth_map)
+
+    # The registry keeps only the most recently used tables
+    monkeypatch.setattr(sv, "MAX_DEPTH_LUTS", 2)
+    assert sv.get_depth_lut(0.54, 721.5, 64) is lut
+    for baseline in (0.1, 0.2, 0.3):
+        sv.get_depth_lut(baseline, 721.5, 64)
+    assert sv.get_depth_lut(0.54, 721.5, 64) is not lut
+
+
+def test_pipeline_depth_comes_from_the_lut_in_reused_buffers(stereo_pair, fake_model):
+    left, right, _ = stereo_pair
+    raw = sv.compute_disparity(left, right, show_disparity=False, raw=True, **sv.PIPELINE_STEREO_PARAMS)
+    depth_map, _ = sv.calculate_depth_map_raw(raw, 0.54, 721.5377, sv.PIPELINE_STEREO_PARAMS['num_disparities'])
+
+    for run_concurrently in (False, True):
+        boxes, distances = sv.pipeline(left, right, ['car'], render=False, concurrent=run_concurrently)
+        np.testing.assert_array_equal(distances, depth_map[(boxes[:, 1] + boxes[:, 3]) // 2,
+                                                           (boxes[:, 0] + boxes[:, 2]) // 2])
+
+    # Every frame of a thread reuses its buffers, other threads get their own
+    buffers = sv.get_depth_buffers(left.shape)
+    sv.pipeline(left, right, ['car'], render=False, roi_only=True)
+    assert all(buffer is reused for buffer, reused in zip(buffers, sv.get_depth_buffers(left.shape)))
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        other = executor.submit(sv.get_depth_buffers, left.shape).result()
+    assert not any(buffer is mine for buffer, mine in zip(other, buffers))
+
+#--- Pseudo-LiDAR point clouds
+def test_point_cloud_reprojects_onto_its_pixels(tmp_path):
+    calibration_file = tmp_path / "calib.txt"
+    calibration_file.write_text(calibration_text())
+    p_left, _, p_ro_rect, p_velo_to_cam, _ = sv.get_calibration_parameters(calibration_file.read_text())
+    rng = np.random.default_rng(3)
+    depth_map = rng.uniform(2, 60, (20, 30)).astype(np.float32)
+    depth_map[0, :5] = 0
+    depth_map[1, :5] = 90
+
+    points = sv.depth_to_point_cloud(depth_map, p_left)
+    keep = (depth_map > 0) & (depth_map < 80)
+    assert len(points) == keep.sum()
+
+    # Projecting the points with the left camera gives back their pixels and depths
+    projected = np.column_stack([points, np.ones(len(points))]) @ p_left.astype(np.float64).T
+    v, u = np.nonzero(keep)
+    np.testing.assert_allclose(projected[:, 0] / projected[:, 2], u, atol=1e-3)
+    np.testing.assert_allclose(projected[:, 1] / projected[:, 2], v, atol=1e-3)
+    np.testing.assert_allclose(projected[:, 2], depth_map[keep], rtol=1e-5)
+
+    # Velodyne points map back to the same camera points
+    velodyne = sv.depth_to_point_cloud(depth_map, p_left, p_ro_rect, p_velo_to_cam, coordinates="velodyne")
+    camera = np.column_stack([velodyne, np.ones(len(velodyne))]) @ p_velo_to_cam.astype(np.float64).T
+    np.testing.assert_allclose(camera @ p_ro_rect.astype(np.float64).T, points, atol=1e-3)
+
+    bin_file = str(tmp_path / "000000.bin")
+    sv.save_velodyne_bin(velodyne, bin_file)
+    loaded = sv.load_velodyne_bin(bin_file)
+    np.testing.assert_array_equal(loaded[:, :3], velodyne)
+    assert np.all(loaded[:, 3] == 0)
+
+
+def test_ray_grids_keep_only_the_most_recently_used(tmp_path, monkeypatch):
+    calibration_file = tmp_path / "calib.txt"
+    calibration_file.write_text(calibration_text())
+    p_left = sv.get_calibration_parameters(calibration_file.read_text())[0]
+    monkeypatch.setattr(sv, "MAX_RAY_GRIDS", 2)
+    monkeypatch.setattr(sv, "_ray_grids", sv.collections.OrderedDict())
+
+    grid = sv.get_ray_grid((20, 30), p_left)
+    assert sv.get_ray_grid((20, 30), p_left) is grid
+    for width in (31, 32, 33):
+        sv.get_ray_grid((20, width), p_left)
+    assert len(sv._ray_grids) == 2
+    assert sv.get_ray_grid((20, 30), p_left) is not grid
+
+
+def test_point_clouds_from_worker_processes_match_serial(tmp_path, image_folders):
+    left_folder, right_folder, image_files = image_folders
+    calibration_folder = tmp_path / "calib"
+    calibration_folder.mkdir()
+    for index, image_file in enumerate(image_files):
+        (calibration_folder / image_file.replace(".png", ".txt")).write_text(
+            calibration_text(baseline=0.5 + 0.01 * index))
+    store = sv.CalibrationStore.open(str(calibration_folder), str(tmp_path / "calibration.npz"))
+
+    outputs = {}
+    for num_workers in (1, 2):
+        output_folder = tmp_path / f"velodyne_{num_workers}"
+        output_folder.mkdir()
+        assert sv.save_point_clouds(left_folder, right_folder, str(output_folder), store, num_workers=num_workers,
+                                    chunksize=1) == []
+        outputs[num_workers] = {name: sv.load_velodyne_bin(str(output_folder / name))
+                                for name in sorted(os.listdir(output_folder))}
+    assert list(outputs[1]) == [image_file.replace(".png", ".bin") for image_file in image_files]
+    for name, points in outputs[1].items():
+        np.testing.assert_array_equal(outputs[2][name], points)
+
+    # A store built in memory has no file the workers could load
+    with pytest.raises(ValueError):
+        sv.save_point_clouds(left_folder, right_folder, str(tmp_path), sv.CalibrationStore(store.arrays))
+
+
+#--- Voxel grid and spatial index
+def random_cloud(num_points=5000, seed=4):
+    rng = np.random.default_rng(seed)
+    xyz = rng.uniform([-20, -5, 0], [20, 5, 60], (num_points, 3))
+    return np.column_stack([xyz, rng.uniform(0, 1, num_points)]).astype(np.float32)
+
+
+def test_voxel_downsample_averages_each_voxel():
+    points = random_cloud()
+    downsampled = sv.voxel_downsample(points, 2.0)
+
+    coordinates = np.floor((points[:, :3] - points[:, :3].min(axis=0)) / 2.0).astype(np.int64)
+    groups = {}
+    for coordinate, point in zip(map(tuple, coordinates), points.astype(np.float64)):
+        groups.setdefault(coordinate, []).append(point)
+    expected = np.array([np.mean(group, axis=0) for _, group in sorted(groups.items())], np.float32)
+    np.testing.assert_allclose(downsampled[np.lexsort(downsampled[:, 2::-1].T)],
+                               expected[np.lexsort(expected[:, 2::-1].T)], rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(sv.voxel_downsample(points[:, :3], 2.0), downsampled[:, :3])
+
+
+def test_crop_and_index_queries_match_a_scan(tmp_path):
+    points = random_cloud()
+    xyz = points[:, :3]
+    distance = np.linalg.norm(xyz, axis=1)
+    cropped = sv.crop_point_cloud(points, min_range=5, max_range=30, horizontal_fov=60, coordinates="camera")
+    expected = (distance >= 5) & (distance <= 30) & (np.abs(np.degrees(np.arctan2(xyz[:, 0], xyz[:, 2]))) <= 30)
+    np.testing.assert_array_equal(cropped, points[expected])
+
+    index = sv.VoxelGridIndex(points, voxel_size=1.5)
+    low, high = np.array([-3, -2, 10]), np.array([4, 1, 25])
+    inside = np.flatnonzero(np.all((xyz >= low) & (xyz <= high), axis=1))
+    np.testing.assert_array_equal(np.sort(index.query_box(low, high)), inside)
+
+    calibration_file = tmp_path / "calib.txt"
+    calibration_file.write_text(calibration_text())
+    p_left = sv.get_calibration_parameters(calibration_file.read_text())[0].astype(np.float64)
+    planes = sv.frustum_planes([500, 100, 700, 250], p_left, near=1, far=50)
+    projected = np.column_stack([xyz, np.ones(len(xyz))]) @ p_left.T
+    u, v = projected[:, 0] / projected[:, 2], projected[:, 1] / projected[:, 2]
+    in_frustum = (u >= 500) & (u <= 700) & (v >= 100) & (v <= 250) & (xyz[:, 2] >= 1) & (xyz[:, 2] <= 50)
+    # Points within rounding distance of a plane may fall either way
+    found = np.zeros(len(points), bool)
+    found[index.query_frustum(planes)] = True
+    margin = np.min(np.abs(np.column_stack([xyz, np.ones(len(xyz))]) @ planes.T), axis=1) < 1e-4
+    np.testing.assert_array_equal(found[~margin], in_frustum[~margin])
+
+
+#--- Box depth statistics
+def test_box_statistics_match_numpy_on_cell_aligned_boxes():
+    rng = np.random.default_rng(5)
+    depth_map = rng.uniform(1, 70, (96, 128)).astype(np.float32)
+    depth_map[rng.random(depth_map.shape) < 0.2] = 0
+    boxes = [[0, 0, 32, 16], [40, 20, 100, 92], [8, 48, 12, 52], [120, 88, 128, 96]]
+    stats = sv.BoxDepthStatistics(depth_map).query(boxes)
+
+    for (x1, y1, x2, y2), record in zip(boxes, stats):
+        window = depth_map[y1:y2, x1:x2]
+        valid = window[window > 0]
+        assert record['valid_fraction'] == pytest.approx(valid.size / window.size)
+        assert record['mean_depth'] == pytest.approx(valid.mean(), rel=1e-5)
+        assert record['center_depth'] == depth_map[(y1 + y2) // 2, (x1 + x2) // 2]
+        # Percentiles are interpolated inside histogram bins of 80 / 64 m, which only agrees with
+        # numpy's order statistics once the box holds enough samples
+        if valid.size >= 200:
+            for field, percentile in (('p10_depth', 10), ('median_depth', 50), ('p90_depth', 90)):
+                assert abs(record[field] - np.percentile(valid, percentile)) <= 1.25
+
+
+def test_calculate_distance_reports_the_requested_statistic(stereo_pair):
+    left, _, _ = stereo_pair
+    depth_map = np.full(left.shape[:2], 20, np.float32)
+    depth_map[70:90, 150:170] = 0
+    disparity_map = np.full(left.shape[:2], 30, np.float32)
+    boxes = [[120, 40, 200, 120]]
+
+    *images, stats = sv.calculate_distance(boxes, left, depth_map, disparity_map, show_output=False,
+                                           box_statistics=True, distance_field="median_depth")
+    assert [image.shape for image in images] == [left.shape] * 3
+    assert stats['center_depth'][0] == 0
+    assert stats['median_depth'][0] == pytest.approx(20, abs=1.25)
+    assert stats['valid_fraction'][0] == pytest.approx(1 - 400 / 6400)
+
+
+#--- Headless mode and renderer
+def test_headless_distances_match_the_box_centers(stereo_pair):
+    left, _, _ = stereo_pair
+    depth_map = np.arange(left.shape[0] * left.shape[1], dtype=np.float32).reshape(left.shape[:2])
+    boxes, distances = sv.calculate_distance(BOXES, left, depth_map, depth_map, show_output=False, render=False)
+    assert boxes.dtype == np.int32 and boxes.shape == (2, 4)
+    np.testing.assert_array_equal(distances, [depth_map[80, 160], depth_map[145, 260]])
+
+
+def test_renderer_matches_the_legacy_annotations(stereo_pair):
+    left, _, disparity = stereo_pair
+    depth_map = np.full(left.shape[:2], 20, np.float32)
+    legacy = sv.calculate_distance(BOXES, left, depth_map, disparity, show_output=False)
+    renderer = sv.DistanceRenderer()
+    for _ in range(2):
+        rendered = sv.calculate_distance(BOXES, left, depth_map, disparity, show_output=False, renderer=renderer)
+    np.testing.assert_array_equal(rendered[1], legacy[1])
+    # The buffers are reused from one frame to the next
+    assert rendered[1] is renderer.frame
+
+    # Colors follow the fixed range rather than the frame's own minimum and maximum
+    level = np.uint8(round(20 * 255 / 80))
+    expected = cv2.applyColorMap(np.full((1, 1), level, np.uint8), cv2.COLORMAP_BONE)[0, 0]
+    np.testing.assert_array_equal(rendered[2][195, 5], expected)
+
+
+#--- Temporal mode
+@pytest.fixture
+def fake_model(monkeypatch):
+    detector = FakeDetector()
+    monkeypatch.setattr(sv, "model", detector, raising=False)
+    monkeypatch.setattr(sv, "names", NAMES, raising=False)
+    monkeypatch.setattr(sv, "baseline", 0.54, raising=False)
+    monkeypatch.setattr(sv, "focal_length", 721.5377, raising=False)
+    return detector
+
+
+def test_temporal_processor_reuses_static_frames(stereo_pair, fake_model):
+    left, right, _ = stereo_pair
+    brighter = [cv2.add(image, 5) for image in (left, right)]
+    processor = sv.TemporalStereoProcessor(object_class=['car'], num_disparities=64, keyframe_interval=3,
+                                           engine=sv.DisparityEngine(num_threads=1))
+
+    statuses = []
+    results = []
+    for left_image, right_image in [(left, right), (left, right), brighter, (left, right)]:
+        results.append(processor.process(left_image, right_image))
+        statuses.append(processor.last_status)
+    assert statuses == ['full', 'reused', 'adaptive', 'full']
+    assert results[1] is results[0]
+    assert fake_model.calls == 3
+
+
+def test_temporal_processor_starts_over_on_a_new_frame_size(stereo_pair, fake_model):
+    left, right, _ = stereo_pair
+    processor = sv.TemporalStereoProcessor(object_class=['car'], num_disparities=64,
+                                           engine=sv.DisparityEngine(num_threads=1))
+    processor.process(left, right)
+
+    # Cropping four columns leaves the downsampled difference image unchanged
+    cropped_left, cropped_right = np.ascontiguousarray(left[:, :-4]), np.ascontiguousarray(right[:, :-4])
+    results = processor.process(cropped_left, cropped_right)
+    assert processor.last_status == 'full'
+    assert results[1].shape == cropped_left.shape
+    processor.process(cropped_left, cropped_right)
+    assert processor.last_status == 'reused'
+
+
+def test_temporal_disparity_range_covers_the_previous_frame(stereo_pair):
+    _, _, disparity = stereo_pair
+    raw = (disparity * 16).astype(np.int16)
+    processor = sv.TemporalStereoProcessor(num_disparities=64, margin=2, range_step=1)
+    min_disparity, num_disparities = processor.disparity_range(raw, 0)
+    assert min_disparity == 4
+    assert num_disparities % 16 == 0 and min_disparity + num_disparities >= 24 + 2
+    # Without valid pixels the full range is used
+    assert processor.disparity_range(np.full_like(raw, -16), 0) == (0, 64)
+
+
+
+def test_adaptive_ranges_reuse_a_bounded_set_of_matchers():
+    processor = sv.TemporalStereoProcessor(num_disparities=64, margin=2)
+    starts = set()
+    for background_disparity in range(10, 40):
+        raw = np.full((20, 40), background_disparity * 16, np.int16)
+        starts.add(processor.disparity_range(raw, 0)[0])
+    # Minimum disparities snap to the 8 px range step
+    assert starts == {8, 16, 24, 32}
+
+    with sv.DisparityEngine(num_threads=1, max_matcher_keys=2) as engine:
+        image = np.random.default_rng(0).integers(0, 256, (40, 80), dtype=np.uint8)
+        for min_disparity in (0, 8, 16, 0):
+            engine.compute_raw(image, image, num_disparities=16, block_size=5, window_size=5,
+                               min_disparity=min_disparity)
+        assert len(engine._matchers) == 2
+
+
+#--- Detector scheduling
+def test_box_iou_of_overlapping_boxes():
+    iou = sv.box_iou(np.array([[0, 0, 10, 10]], np.float32), np.array([[0, 0, 10, 10], [5, 0, 15, 10],
+                                                                        [20, 20, 30, 30]], np.float32))
+    np.testing.assert_allclose(iou, [[1, 50 / 150, 0]])
+
+
+def test_scheduler_propagates_boxes_between_keyframes(stereo_pair):
+    left, _, _ = stereo_pair
+    detector = FakeDetector()
+    scheduler = sv.DetectorScheduler(detector, NAMES, object_class=['car'], interval=3)
+
+    shifts = [0, 3, 6, 0]
+    outputs = [scheduler.update(np.roll(left, shift, axis=1)) for shift in shifts]
+    assert detector.calls == 2
+    for shift, (boxes, _) in zip(shifts, outputs):
+        np.testing.assert_allclose(boxes, [[120 + shift, 40, 200 + shift, 120]], atol=1)
+    # The detection of the keyframe is matched to the propagated track
+    assert [track_ids.tolist() for _, track_ids in outputs] == [[0]] * 4
+
+
+def test_scheduler_detects_again_on_a_new_frame_size(stereo_pair):
+    left, _, _ = stereo_pair
+    detector = FakeDetector()
+    scheduler = sv.DetectorScheduler(detector, NAMES, object_class=['car'], interval=5)
+    scheduler.update(left)
+    scheduler.update(np.ascontiguousarray(left[:160, :240]))
+    assert detector.calls == 2
+
+
+#--- Concurrent pipeline
+def test_concurrent_pipeline_matches_the_serial_one(stereo_pair, fake_model):
+    left, right, _ = stereo_pair
+    serial = sv.pipeline(left, right, ['car'], render=False, concurrent=False)
+    concurrent = sv.pipeline(left, right, ['car'], render=False, concurrent=True)
+    for expected, result in zip(serial, concurrent):
+        np.testing.assert_array_equal(result, expected)
+    assert fake_model.calls == 2
+
+
+def test_concurrent_pipeline_reports_the_detector_error(stereo_pair, fake_model, monkeypatch):
+    left, right, _ = stereo_pair
+    finished = []
+
+    def stereo_branch(*args):
+        time.sleep(0.05)
+        finished.append(True)
+        raise ValueError("stereo")
+
+    def detector(frame):
+        raise RuntimeError("detector")
+
+    monkeypatch.setattr(sv, "_stereo_branch", stereo_branch)
+    monkeypatch.setattr(sv, "model", detector)
+    with pytest.raises(RuntimeError, match="detector"):
+        sv.pipeline(left, right, ['car'], render=False, concurrent=True)
+    # The stereo branch finished before the error was raised
+    assert finished == [True]
+
+
+#--- Ground-truth evaluation
+def test_parse_labels_reads_the_kitti_columns():
+    labels = sv.parse_labels("Car 0.00 1 -1.58 587.01 173.33 614.12 200.12 1.65 1.67 3.64 -0.65 1.71 46.70 -1.59\n"
+                             "Unknown 0.50 0 0.00 0.00 0.00 10.00 10.00 1.00 1.00 1.00 0.00 0.00 5.00 0.00\n")
+    assert labels['type_id'].tolist() == [sv.KITTI_CLASSES.index('Car'), -1]
+    assert labels['occluded'].tolist() == [1, 0]
+    np.testing.assert_allclose(labels['bbox'][0], [587.01, 173.33, 614.12, 200.12], rtol=1e-6)
+    np.testing.assert_allclose(labels['location'][0], [-0.65, 1.71, 46.70], rtol=1e-6)
+    assert len(sv.parse_labels("")) == 0
+
+
+def test_match_boxes_prefers_the_highest_iou():
+    true_boxes = np.array([[0, 0, 100, 100], [200, 0, 300, 100], [400, 0, 500, 100]], np.float32)
+    predicted_boxes = np.array([[210, 0, 310, 100], [0, 0, 100, 90], [10, 0, 110, 100]], np.float32)
+    matches, iou = sv.match_boxes(true_boxes, predicted_boxes)
+    np.testing.assert_array_equal(matches, [1, 0, -1])
+    np.testing.assert_allclose(iou, [0.9, 90 / 110, 0], rtol=1e-6)
+
+
+def test_summarize_distance_errors_groups_the_records():
+    records = np.zeros(4, sv.EVALUATION_DTYPE)
+    records['type_id'] = [sv.KITTI_CLASSES.index(name) for name in ('Car', 'Car', 'Pedestrian', 'Car')]
+    records['occluded'] = [0, 1, 0, 2]
+    records['true_distance'] = [5, 15, 8, 45]
+    records['predicted_distance'] = [6, 12, 8, np.nan]
+    records['iou'] = [0.9, 0.8, 0.7, 0]
+    summary = sv.summarize_distance_errors(records)
+
+    assert summary['overall']['objects'] == 4 and summary['overall']['recall'] == 0.75
+    assert summary['overall']['abs_error'] == pytest.approx(4 / 3)
+    assert summary['overall']['rmse'] == pytest.approx(np.sqrt(10 / 3))
+    assert summary['class']['Car'] == pytest.approx({'objects': 3, 'matched': 2, 'no_depth': 0, 'recall': 2 / 3,
+                                                     'abs_error': 2, 'rel_error': (1 / 5 + 3 / 15) / 2,
+                                                     'rmse': np.sqrt(5)})
+    assert set(summary['range']) == {'0-10 m', '10-20 m', '40-50 m'}
+    assert summary['range']['40-50 m']['abs_error'] is None
+    assert summary['occlusion']['fully visible']['objects'] == 2
+
+    # A matched box without valid depth counts towards the recall but not the errors
+    records['iou'][3] = 0.6
+    summary = sv.summarize_distance_errors(records)
+    assert summary['overall']['recall'] == 1 and summary['overall']['no_depth'] == 1
+    assert summary['overall']['abs_error'] == pytest.approx(4 / 3)
+
+    # Objects of an unknown type are not counted as cars
+    records['type_id'][3] = -1
+    summary = sv.summarize_distance_errors(records)
+    assert summary['class']['Car']['objects'] == 2 and summary['class']['Unknown']['objects'] == 1
+
+
+def test_evaluate_dataset_requires_a_calibration(tmp_path, image_folders, fake_model):
+    left_folder, right_folder, image_files = image_folders
+    labels_folder = tmp_path / "labels"
+    labels_folder.mkdir()
+    for image_file in image_files:
+        (labels_folder / image_file.replace(".png", ".txt")).write_text(
+            "Car 0.00 0 0.00 100.00 40.00 180.00 120.00 1.50 1.60 4.00 0.00 1.50 16.00 0.00\n")
+    dataset = sv.KittiDataset.open(left_folder, right_folder, labels_folder=str(labels_folder))
+    with pytest.raises(ValueError, match="baseline and focal_length"):
+        sv.evaluate_dataset(dataset)
+
+    # The module calibration is not picked up implicitly, an explicit one is used for every frame
+    records, summary, failures = sv.evaluate_dataset(dataset, baseline=0.54, focal_length=721.5377)
+    assert failures == [] and len(records) == len(image_files)
+    assert summary['class']['Car']['objects'] == len(image_files)
+
+
+#--- Columnar label store
+def write_label_files(labels_folder, rng, num_frames=20):
+    classes = ('Car', 'Pedestrian', 'Cyclist', 'DontCare')
+    for frame in range(num_frames):
+        lines = []
+        for _ in range(rng.integers(0, 6)):
+            location = rng.uniform([-10, 1, 2], [10, 2, 60])
+            lines.append(f"{rng.choice(classes)} {rng.uniform(0, 1):.2f} {rng.integers(0, 4)} 0.00 "
+                         f"100.00 100.00 200.00 200.00 1.50 1.60 4.00 "
+                         f"{location[0]:.2f} {location[1]:.2f} {location[2]:.2f} 0.00")
+        with open(os.path.join(labels_folder, f"{frame:06d}.txt"), 'w') as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def test_label_store_query_matches_a_scan(tmp_path):
+    labels_folder = tmp_path / "labels"
+    labels_folder.mkdir()
+    write_label_files(str(labels_folder), np.random.default_rng(2))
+
+    store = sv.LabelStore.open(str(labels_folder), str(tmp_path / "label_store"))
+    labels = store.labels(slice(None))
+    frames = store.columns['frame']
+    distances = sv.label_distances(labels, "range")
+
+    rows = store.query(object_class=['Car', 'Cyclist'], frames=(3, 15), min_distance=10, max_distance=40,
+                       max_occluded=1)
+    expected = np.flatnonzero(np.isin(labels['type_id'], sv.class_type_ids(['Car', 'Cyclist']))
+                              & (frames >= 3) & (frames < 15) & (distances >= 10) & (distances < 40)
+                              & (labels['occluded'] <= 1))
+    np.testing.assert_array_equal(rows, expected)
+
+    # Reopening memory-maps the saved columns and answers the same queries
+    reopened = sv.LabelStore.open(str(labels_folder), str(tmp_path / "label_store"))
+    np.testing.assert_array_equal(reopened.query(object_class=['Pedestrian']),
+                                  store.query(object_class=['Pedestrian']))
+    np.testing.assert_array_equal(reopened.frame_labels("000007"), store.frame_labels("000007"))
+
+
+#--- Metrics
+def test_metrics_registry_collects_and_exports(tmp_path):
+    registry = sv.MetricsRegistry(enabled=True, window=4)
+    registry.increment('boxes', 2)
+    registry.increment('boxes')
+    for value in (5.0, 1.0, 3.0, 2.0, 4.0):
+        registry.observe('invalid_fraction', value)
+    with registry.timer('stage'):
+        pass
+
+    snapshot = registry.snapshot()
+    assert snapshot['counters'] == {'boxes': 3}
+    observation = snapshot['observations']['invalid_fraction']
+    assert (observation['count'], observation['sum'], observation['min'], observation['max']) == (5, 15.0, 1.0, 5.0)
+    # Quantiles cover the recent window only
+    assert observation['quantiles']['0.5'] == pytest.approx(2.5)
+    assert snapshot['observations']['stage_seconds']['count'] == 1
+
+    jsonl_path = str(tmp_path / "metrics.jsonl")
+    registry.write_jsonl(jsonl_path)
+    registry.write_jsonl(jsonl_path)
+    with open(jsonl_path) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 2 and lines[0]['counters'] == {'boxes': 3}
+
+    prometheus_path = str(tmp_path / "metrics.prom")
+    registry.write_prometheus(prometheus_path)
+    with open(prometheus_path) as file:
+        exported = file.read().splitlines()
+    assert exported[:2] == ["# TYPE stereo_vision_boxes_total counter", "stereo_vision_boxes_total 3"]
+    assert 'stereo_vision_invalid_fraction{quantile="0.5"} 2.5' in exported
+    assert "stereo_vision_invalid_fraction_count 5" in exported
+
+
+def test_disabled_metrics_record_nothing():
+    registry = sv.MetricsRegistry()
+    registry.increment('boxes')
+    registry.observe('invalid_fraction', 1.0)
+    with registry.timer('stage'):
+        pass
+    assert registry.snapshot()['counters'] == {} and registry.snapshot()['observations'] == {}
+
+
+#--- KITTI PNG and depth store outputs
+def test_kitti_disparity_png_round_trip(stereo_pair, tmp_path):
+    left, right, _ = stereo_pair
+    with sv.DisparityEngine(num_threads=1) as engine:
+        raw = engine.compute_raw(gray(left), gray(right), num_disparities=64, block_size=11, matcher="stereo_bm")
+    file_path = str(tmp_path / "disparity.png")
+    sv.write_kitti_disparity_png(file_path, raw)
+    values, valid_mask = sv.read_kitti_png(file_path)
+    np.testing.assert_array_equal(valid_mask, raw > 0)
+    np.testing.assert_array_equal(values[valid_mask] * 16, raw[valid_mask])
+
+
+def test_kitti_depth_png_round_trip(tmp_path):
+    depth = np.random.default_rng(0).uniform(0, 100, (40, 60)).astype(np.float32)
+    depth[:5] = 0
+    depth[5:10] = 300
+    file_path = str(tmp_path / "depth.png")
+    sv.write_kitti_png(file_path, depth)
+    values, valid_mask = sv.read_kitti_png(file_path)
+    # Values beyond the 16-bit range are stored as invalid rather than clipped
+    np.testing.assert_array_equal(valid_mask, (depth > 0) & (depth < 255))
+    assert np.max(np.abs(values[valid_mask] - depth[valid_mask])) <= 0.5 / sv.KITTI_PNG_SCALE + 1e-6
+
+
+@pytest.mark.parametrize("encoding, tolerance", [("float32", 0), ("float16", 0.05), ("uint16", 0.5 / 256 + 1e-6)])
+def test_depth_store_round_trip(tmp_path, encoding, tolerance):
+    rng = np.random.default_rng(1)
+    # KITTI frames differ slightly in size from one sequence to the next
+    shapes = [(30, 50), (30, 50), (28, 52), (30, 50), (31, 49)]
+    frames = {f"{index:06d}": rng.uniform(0, 80, shape).astype(np.float32) for index, shape in enumerate(shapes)}
+    store_path = str(tmp_path / "store")
+    with sv.DepthStore.create(store_path, encoding=encoding, frames_per_chunk=2) as store:
+        store.reserve({"000001": (30, 50), "000002": (28, 52)})
+        for frame_id, depth in frames.items():
+            store.put(frame_id, depth, valid_mask=depth > 1)
+        with pytest.raises(ValueError):
+            store.put("000002", frames["000000"])
+
+    with sv.DepthStore.open(store_path) as store:
+        assert sorted(store.frame_ids) == sorted(frames)
+        for frame_id, depth in frames.items():
+            assert store.frame_shape(frame_id) == depth.shape
+            values, valid_mask = store.get(frame_id)
+            np.testing.assert_array_equal(valid_mask, depth > 1)
+            assert np.max(np.abs(values[valid_mask] - depth[valid_mask])) <= tolerance
+
+
+
+def test_depth_maps_of_mixed_sizes_go_into_one_store(tmp_path):
+    left_folder, right_folder = tmp_path / "left", tmp_path / "right"
+    left_folder.mkdir()
+    right_folder.mkdir()
+    for index, (height, width) in enumerate([(120, 240), (128, 256), (120, 240)]):
+        left, right, _ = make_stereo_pair(height=height, width=width, objects=(), seed=index)
+        cv2.imwrite(str(left_folder / f"{index:06d}.png"), left)
+        cv2.imwrite(str(right_folder / f"{index:06d}.png"), right)
+    (left_folder / "000003.png").write_bytes(b"not an image")
+
+    store_path = str(tmp_path / "store")
+    failures = sv.save_depth_maps(str(left_folder), str(right_folder), store_path, 0.54, 721.5, num_workers=2,
+                                  chunksize=1, output_format="store", encoding="float32")
+    assert [image_file for image_file, _ in failures] == ["000003.png"]
+
+    with sv.DepthStore.open(store_path) as store:
+        assert store.frame_ids == ["000000", "000001", "000002"]
+        for frame_id in store.frame_ids:
+            left = cv2.imread(str(left_folder / f"{frame_id}.png"))
+            right = cv2.imread(str(right_folder / f"{frame_id}.png"))
+            raw = sv.compute_disparity(left, right, num_disparities=90, block_size=5, window_size=5,
+                                       show_disparity=False, raw=True)
+            expected, expected_mask = sv.calculate_depth_map_raw(raw, 0.54, 721.5, num_disparities=90)
+            values, valid_mask = store.get(frame_id)
+            np.testing.assert_array_equal(valid_mask, expected_mask)
+            np.testing.assert_array_equal(values, np.where(expected_mask, expected, 0))
+
+#--- Frame cache
+def test_frame_cache_matches_the_decoded_images(tmp_path):
+    left_folder, right_folder = tmp_path / "left", tmp_path / "right"
+    left_folder.mkdir()
+    right_folder.mkdir()
+    # Frames of different sizes share the flat streams
+    for index, (height, width) in enumerate([(200, 320), (120, 160), (200, 320)]):
+        left, right, _ = make_stereo_pair(height=height, width=width, objects=(), seed=index)
+        cv2.imwrite(str(left_folder / f"{index:06d}.png"), left)
+        cv2.imwrite(str(right_folder / f"{index:06d}.png"), right)
+
+    cache_path = str(tmp_path / "frame_cache")
+    cache = sv.FrameCache.open(str(left_folder), str(right_folder), cache_path, color=True, num_threads=2)
+    assert len(cache) == 3
+    for frame_id in cache.frame_ids:
+        left = cv2.imread(str(left_folder / f"{frame_id}.png"))
+        right = cv2.imread(str(right_folder / f"{frame_id}.png"))
+        left_gray, right_gray = cache.gray_pair(frame_id)
+        np.testing.assert_array_equal(left_gray, gray(left))
+        np.testing.assert_array_equal(right_gray, gray(right))
+        np.testing.assert_array_equal(cache.left_color(frame_id), left)
+
+    # A new frame in the folders rebuilds the cache
+    assert sv.FrameCache.open(str(left_folder), str(right_folder), cache_path).meta == cache.meta
+    left, right, _ = make_stereo_pair(objects=(), seed=3)
+    cv2.imwrite(str(left_folder / "000003.png"), left)
+    cv2.imwrite(str(right_folder / "000003.png"), right)
+    rebuilt = sv.FrameCache.open(str(left_folder), str(right_folder), cache_path)
+    assert "000003" in rebuilt and len(rebuilt) == 4
+
+
+#--- Disparity result cache
+def test_result_cache_hits_are_byte_identical(stereo_pair, tmp_path):
+    left, right, _ = stereo_pair
+    cache_path = str(tmp_path / "cache")
+    params = dict(num_disparities=64, block_size=5, window_size=5, matcher="stereo_sgbm", show_disparity=False,
+                  raw=True)
+    with sv.DisparityEngine(num_threads=2) as engine:
+        cache = sv.DisparityResultCache(cache_path)
+        computed = sv.compute_disparity(left, right, engine=engine, cache=cache, **params)
+        memory_hit = sv.compute_disparity(left, right, engine=engine, cache=cache, **params)
+        disk_hit = sv.compute_disparity(left, right, engine=engine, cache=sv.DisparityResultCache(cache_path),
+                                        **params)
+        uncached = sv.compute_disparity(left, right, engine=engine, **params)
+
+    assert cache.stats()['memory_hits'] == 1
+    for result in (memory_hit, disk_hit, uncached):
+        assert result.dtype == computed.dtype
+        assert result.tobytes() == computed.tobytes()
+
+
+def test_result_cache_keys_cover_the_band_rows(stereo_pair):
+    left, right, _ = stereo_pair
+    params = dict(num_disparities=64, block_size=5, window_size=5, matcher="stereo_sgbm", show_disparity=False,
+                  raw=True)
+    cache = sv.DisparityResultCache()
+
+    # Engines with the same SGBM overlap but a different number of bands
+    for num_threads in (2, 3):
+        with sv.DisparityEngine(num_threads=num_threads, sgbm_band_overlap=16) as engine:
+            cached = sv.compute_disparity(left, right, engine=engine, cache=cache, **params)
+            assert cached.tobytes() == sv.compute_disparity(left, right, engine=engine, **params).tobytes()
+    assert cache.stats()['memory_hits'] == 0
+
+
+#--- Rectification of raw stereo input
+def raw_calibration_text(width=320, height=200, focal_length=300.0, baseline=0.5):
+    camera_matrix = f"{focal_length} 0 {(width - 1) / 2} 0 {focal_length} {(height - 1) / 2} 0 0 1"
+    lines = ["calib_time: 09-Jan-2012 13:57:47"]
+    for camera, tx in (("02", 0.0), ("03", -focal_length * baseline)):
+        lines += [f"S_{camera}: {width} {height}", f"K_{camera}: {camera_matrix}", f"D_{camera}: 0 0 0 0 0",
+                  f"S_rect_{camera}: {width} {height}", f"R_rect_{camera}: 1 0 0 0 1 0 0 0 1",
+                  f"P_rect_{camera}: {focal_length} 0 {(width - 1) / 2} {tx} 0 {focal_length} {(height - 1) / 2} 0 "
+                  f"0 0 1 0"]
+    return "\n".join(lines) + "\n"
+
+
+def test_identity_rectification_keeps_the_images(stereo_pair):
+    left, right, _ = stereo_pair
+    calibration = sv.parse_raw_calibration(raw_calibration_text())
+    assert calibration['image_size'] == calibration['rectified_size'] == (320, 200)
+
+    rectifier = sv.StereoRectifier(**calibration)
+    rectified_left, rectified_right = rectifier.rectify(left, right)
+    np.testing.assert_array_equal(rectified_left, left)
+    np.testing.assert_array_equal(rectified_right, right)
+    assert rectifier.baseline == pytest.approx(0.5) and rectifier.focal_length == pytest.approx(300)
+
+    # Scaling the output scales the rectified geometry, but not the baseline
+    half = sv.StereoRectifier(**calibration, output_size=(160, 100))
+    assert half.rectify(left, right)[0].shape == (100, 160, 3)
+    assert half.focal_length == pytest.approx(150) and half.baseline == pytest.approx(0.5)
+    with pytest.raises(ValueError):
+        rectifier.rectify(left[:100], right[:100])
+
+
+def test_rectifier_is_rebuilt_when_the_file_changes(tmp_path):
+    calibration_file = tmp_path / "calib_cam_to_cam.txt"
+    calibration_file.write_text(raw_calibration_text())
+    rectifier = sv.get_rectifier(str(calibration_file))
+    assert sv.get_rectifier(str(calibration_file)) is rectifier
+
+    calibration_file.write_text(raw_calibration_text(baseline=0.6))
+    os.utime(calibration_file, ns=(os.stat(calibration_file).st_atime_ns,
+                                   os.stat(calibration_file).st_mtime_ns + 10**9))
+    assert sv.get_rectifier(str(calibration_file)).baseline == pytest.approx(0.6)
+
+
+def test_result_cache_counts_every_disk_eviction(tmp_path):
+    cache_path = str(tmp_path / "cache")
+    value_bytes = np.zeros((32, 64), np.int16).nbytes
+    cache = sv.DisparityResultCache(cache_path, max_memory_bytes=0, max_disk_bytes=4 * (value_bytes + 128))
+
+    def put(index):
+        cache.put(f"{index:064x}", np.full((32, 64), index, np.int16))
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(put, range(64)))
+    # Files removed by a concurrent eviction are counted once, by the thread that removed them
+    remaining = [name for name in os.listdir(cache_path) if name.endswith('.npy')]
+    assert 0 < len(remaining) < 64
+    assert cache.stats()['disk_evictions'] == 64 - len(remaining)
+
+
+def test_match_boxes_ignores_other_classes():
+    true_boxes = np.array([[0, 0, 100, 100], [200, 0, 300, 100]], np.float32)
+    predicted_boxes = np.array([[0, 0, 100, 100], [200, 0, 300, 100]], np.float32)
+    names = {0: 'person', 2: 'car'}
+    compatible = sv.class_compatibility(sv.class_type_ids(['Car', 'Pedestrian']), np.array([0, 2]), names)
+
+    matches, iou = sv.match_boxes(true_boxes, predicted_boxes, compatible=compatible)
+    np.testing.assert_array_equal(matches, [-1, -1])
+    np.testing.assert_array_equal(iou, [0, 0])
+
+    matches, iou = sv.match_boxes(true_boxes, predicted_boxes[::-1], compatible=compatible)
+    np.testing.assert_array_equal(matches, [1, 0])
+    np.testing.assert_array_equal(iou, [1, 1])
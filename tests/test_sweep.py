@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+
+import Stereo_Vision as sv
+import sweep
+from conftest import calibration_text
+
+
+def test_parameter_grid_drops_duplicate_block_matchers():
+    configurations = sweep.parameter_grid(matchers=("stereo_bm", "stereo_sgbm"), num_disparities=(64,),
+                                          block_sizes=(3, 5), window_sizes=(3, 5))
+    names = [sweep.configuration_name(configuration) for configuration in configurations]
+    # Block matching ignores the window and needs at least a 5 px block
+    assert names == ["stereo_bm[num_disparities=64,block_size=5]",
+                     "stereo_sgbm[num_disparities=64,block_size=3,window_size=3]",
+                     "stereo_sgbm[num_disparities=64,block_size=3,window_size=5]",
+                     "stereo_sgbm[num_disparities=64,block_size=5,window_size=3]",
+                     "stereo_sgbm[num_disparities=64,block_size=5,window_size=5]"]
+    sampled = sweep.sample_configurations(configurations, 3)
+    assert len(sampled) == 3 and all(configuration in configurations for configuration in sampled)
+
+
+def test_pareto_front_keeps_the_undominated_scores():
+    scores = [{'abs_error': 1.0, 'runtime_ms': 30}, {'abs_error': 2.0, 'runtime_ms': 10},
+              {'abs_error': 2.5, 'runtime_ms': 20}, {'abs_error': 0.5, 'runtime_ms': 50},
+              {'abs_error': None, 'runtime_ms': 1}]
+    assert sweep.pareto_front(scores) == [1, 0, 3]
+
+
+def test_score_counts_missing_depth_as_zero():
+    score = sweep.score_configuration(np.array([0.01, 0.03]), np.array([10, 20], np.float32),
+                                      np.array([11, 0], np.float32))
+    assert score['objects'] == 2 and score['valid_fraction'] == 0.5
+    assert score['abs_error'] == pytest.approx(10.5)
+    assert score['runtime_ms'] == pytest.approx(20)
+
+
+@pytest.mark.parametrize("strategy", ["grid", "halving"])
+def test_sweep_ranks_configurations_on_labelled_frames(image_folders, tmp_path, strategy):
+    left_folder, right_folder, image_files = image_folders
+    calibration_folder, labels_folder = tmp_path / "calib", tmp_path / "labels"
+    calibration_folder.mkdir()
+    labels_folder.mkdir()
+    depth = 0.54 * 721.5377 / 24
+    for index, image_file in enumerate(image_files):
+        frame_id = image_file[:-4]
+        (calibration_folder / f"{frame_id}.txt").write_text(calibration_text())
+        (labels_folder / f"{frame_id}.txt").write_text(
+            f"Car 0.00 0 0.00 {100 + 10 * index}.00 40.00 {180 + 10 * index}.00 120.00 1.50 1.60 4.00 "
+            f"0.00 1.70 {depth:.2f} 0.00\n")
+
+    dataset = sv.KittiDataset.open(left_folder, right_folder, str(calibration_folder), str(labels_folder),
+                                   manifest_path=str(tmp_path / "manifest.json"))
+    frame_ids = dataset.frame_ids
+    ground_truth = sweep.load_ground_truth(dataset, frame_ids, ('Car',))
+    frame_cache = sv.FrameCache.open(left_folder, right_folder, str(tmp_path / "frame_cache"))
+    configurations = sweep.parameter_grid(matchers=("stereo_bm",), num_disparities=(16, 32, 64), block_sizes=(11,))
+
+    results, failures = sweep.run_sweep(configurations, ground_truth, frame_ids, frame_cache, strategy=strategy,
+                                        eta=3)
+    assert failures == []
+    scores = {result['name']: result['score'] for result in results}
+    # Only a range that covers the 24 px disparity of the objects measures their depth
+    best = "stereo_bm[num_disparities=32,block_size=11]"
+    assert scores[best]['frames'] == len(frame_ids)
+    assert scores[best]['rel_error'] < 0.05
+    assert scores["stereo_bm[num_disparities=16,block_size=11]"]['rel_error'] > 0.5